@@ -48,7 +48,14 @@ int lastSentMotion = -1;
 
 // camera/server state
 httpd_handle_t stream_httpd = NULL;
-bool cameraOn = false;
+httpd_handle_t mjpeg_httpd = NULL;  // port 81, serves the long-lived /stream connection
+volatile bool cameraOn = false;
+
+// MJPEG multipart format (Python side: MjpegStream.MjpegParser)
+#define PART_BOUNDARY "123456789000000000000987654321"
+static const char* STREAM_CONTENT_TYPE = "multipart/x-mixed-replace;boundary=" PART_BOUNDARY;
+static const char* STREAM_BOUNDARY = "\r\n--" PART_BOUNDARY "\r\n";
+static const char* STREAM_PART = "Content-Type: image/jpeg\r\nContent-Length: %u\r\n\r\n";
 
 // ==========================================
 // 3. ฟังก์ชันส่งรูปภาพ (Capture Handler)
@@ -70,6 +77,35 @@ static esp_err_t capture_handler(httpd_req_t *req) {
   return res;
 }
 
+// ==========================================
+// 3.1 ฟังก์ชันส่งวิดีโอแบบ MJPEG (Stream Handler)
+// ==========================================
+static esp_err_t stream_handler(httpd_req_t *req) {
+  char part_buf[64];
+  esp_err_t res = httpd_resp_set_type(req, STREAM_CONTENT_TYPE);
+  if (res != ESP_OK) return res;
+  httpd_resp_set_hdr(req, "Access-Control-Allow-Origin", "*");
+
+  // One response, one JPEG part per frame, until the client leaves or the camera stops
+  while (cameraOn) {
+    camera_fb_t * fb = esp_camera_fb_get();
+    if (!fb) {
+      Serial.println("Camera capture failed");
+      res = ESP_FAIL;
+      break;
+    }
+
+    size_t hlen = snprintf(part_buf, sizeof(part_buf), STREAM_PART, fb->len);
+    res = httpd_resp_send_chunk(req, STREAM_BOUNDARY, strlen(STREAM_BOUNDARY));
+    if (res == ESP_OK) res = httpd_resp_send_chunk(req, part_buf, hlen);
+    if (res == ESP_OK) res = httpd_resp_send_chunk(req, (const char *)fb->buf, fb->len);
+    esp_camera_fb_return(fb);
+    if (res != ESP_OK) break;
+  }
+  if (res == ESP_OK) httpd_resp_send_chunk(req, NULL, 0);  // camera stopped: end the response cleanly
+  return res;
+}
+
 static void startCameraServer() {
   if (stream_httpd != NULL) return; // already running
 
@@ -86,6 +122,13 @@ static void startCameraServer() {
     .user_ctx  = NULL
   };
 
+  httpd_uri_t stream_uri = {
+    .uri       = "/stream",
+    .method    = HTTP_GET,
+    .handler   = stream_handler,
+    .user_ctx  = NULL
+  };
+
   if (httpd_start(&stream_httpd, &config) == ESP_OK) {
     httpd_register_uri_handler(stream_httpd, &capture_uri);
     Serial.println("HTTP server started");
@@ -93,9 +136,25 @@ static void startCameraServer() {
     Serial.println("Failed to start HTTP server");
     stream_httpd = NULL;
   }
+
+  // The stream handler never returns while a client is connected,
+  // so it gets its own server instance and /capture stays responsive
+  config.server_port = 81;
+  config.ctrl_port += 1;
+  if (httpd_start(&mjpeg_httpd, &config) == ESP_OK) {
+    httpd_register_uri_handler(mjpeg_httpd, &stream_uri);
+    Serial.println("MJPEG stream server started on port 81");
+  } else {
+    Serial.println("Failed to start MJPEG stream server");
+    mjpeg_httpd = NULL;
+  }
 }
 
 static void stopCameraServer() {
+  if (mjpeg_httpd) {
+    httpd_stop(mjpeg_httpd);
+    mjpeg_httpd = NULL;
+  }
   if (stream_httpd) {
     httpd_stop(stream_httpd);
     stream_httpd = NULL;
@@ -168,9 +227,11 @@ static bool startCamera() {
 
 static void stopCamera() {
   if (!cameraOn) return;
+  // Clear the flag first so a running stream_handler leaves its loop before the camera goes away
+  cameraOn = false;
+  delay(200);
   stopCameraServer();
   esp_camera_deinit();
-  cameraOn = false;
   Serial.println("Camera stopped");
 }
 
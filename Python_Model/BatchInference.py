@@ -0,0 +1,288 @@
+import numpy as np
+import os
+import threading
+import time
+
+from Metrics import METRICS
+
+# Result handed back when a frame had no person (same shape as PersonDetector.detect)
+NO_PEOPLE = (np.zeros((0, 4)), np.zeros((0,)))
+
+# ==========================================
+# CLASS: Pending Detection (per-frame handle)
+# ==========================================
+class PendingDetection:
+    """Handle for one frame submitted to the BatchDetectionEngine."""
+    def __init__(self, camera_id, frame):
+        self.camera_id = camera_id
+        self.frame = frame
+        self.submitted_at = time.time()
+        self.result = NO_PEOPLE
+        self.dropped = False
+        self.error = None
+        self._done = threading.Event()
+
+    def _finish(self, result=None, dropped=False, error=None):
+        if result is not None:
+            self.result = result
+        self.dropped = dropped
+        self.error = error
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Blocks until the batch containing this frame has run. Returns the detect() result."""
+        if not self._done.wait(timeout):
+            return None
+        return self.result
+
+# ==========================================
+# CLASS: Batch Detection Engine
+# ==========================================
+class BatchDetectionEngine:
+    """Shares one PersonDetector between many camera feeds by batching their frames
+    into a single blobFromImages / net.forward() call."""
+    def __init__(self, detector, batch_size=8, max_wait=0.02):
+        self.detector = detector
+        self.batch_size = batch_size
+        self.max_wait = max_wait  # Longest time the oldest frame waits for the batch to fill
+
+        # At most one pending frame per camera, a newer frame replaces a stale one
+        self.pending = {}
+        self.cond = threading.Condition()
+        self.feeds = {}
+        self.started = False
+
+        self.batches_run = 0
+        self.frames_run = 0
+
+    def start(self):
+        if self.started:
+            return self
+        self.started = True
+        self.thread = threading.Thread(target=self._run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def submit(self, camera_id, frame):
+        """Queues a frame for the next batch. Returns a PendingDetection."""
+        request = PendingDetection(camera_id, frame)
+        with self.cond:
+            stale = self.pending.get(camera_id)
+            self.pending[camera_id] = request
+            self.cond.notify()
+        if stale is not None:
+            stale._finish(dropped=True)
+        return request
+
+    def detect(self, camera_id, frame, timeout=None):
+        """Blocking convenience wrapper, same return value as PersonDetector.detect, or None
+        if the frame got no result (timeout, replaced by a newer frame, inference error)."""
+        request = self.submit(camera_id, frame)
+        result = request.wait(timeout)
+        if result is None or request.dropped or request.error is not None:
+            return None
+        return result
+
+    def add_feed(self, camera_id, source, on_result, stop_on_eof=False):
+        """Starts pulling frames from a VideoSource / ThreadedSnapshotCamera into the engine.
+        on_result(camera_id, frame, boxes, confidences) is called from the feed's own thread."""
+        feed = CameraFeed(camera_id, source, self, on_result, stop_on_eof)
+        self.feeds[camera_id] = feed
+        return feed.start()
+
+    def remove_feed(self, camera_id):
+        feed = self.feeds.pop(camera_id, None)
+        if feed is not None:
+            feed.stop()
+
+    def stop(self):
+        for camera_id in list(self.feeds):
+            self.remove_feed(camera_id)
+        with self.cond:
+            self.started = False
+            self.cond.notify_all()
+        if hasattr(self, 'thread'):
+            self.thread.join()
+
+    def _next_batch(self):
+        """Waits until the batch is full or the oldest frame has waited max_wait."""
+        with self.cond:
+            while self.started and not self.pending:
+                self.cond.wait()
+            if not self.started:
+                return []
+
+            oldest = min(r.submitted_at for r in self.pending.values())
+            deadline = oldest + self.max_wait
+            while self.started and len(self.pending) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            batch = sorted(self.pending.values(), key=lambda r: r.submitted_at)[:self.batch_size]
+            for request in batch:
+                del self.pending[request.camera_id]
+            return batch
+
+    def _run(self):
+        while self.started:
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            try:
+                results = self.detector.detect_batch([r.frame for r in batch])
+            except Exception as e:
+                print(f"[ERROR] Batch inference failed: {e}")
+                for request in batch:
+                    request._finish(error=e)
+                continue
+
+            for request, result in zip(batch, results):
+                request._finish(result)
+            self.batches_run += 1
+            self.frames_run += len(batch)
+
+        # Release anyone still waiting on shutdown
+        with self.cond:
+            leftover = list(self.pending.values())
+            self.pending.clear()
+        for request in leftover:
+            request._finish(dropped=True)
+
+# ==========================================
+# CLASS: Engine Detector (per-camera view of the engine)
+# ==========================================
+class EngineDetector:
+    """PersonDetector interface (detect / detect_batch) backed by a shared BatchDetectionEngine,
+    so per-camera code such as IntervalDetector or RoiDetector runs unchanged on one shared net.
+    A frame the engine gave no result for returns None, not an empty room: IntervalDetector
+    then keeps its previous boxes, so tracks are not reset by a slow or failed batch."""
+    def __init__(self, engine, camera_id, timeout=5.0):
+        self.engine = engine
+        self.camera_id = camera_id
+        self.timeout = timeout
+        self.missed = 0
+
+    def detect(self, frame):
+        request = self.engine.submit(self.camera_id, frame)
+        return self._result(request, request.wait(self.timeout))
+
+    def detect_batch(self, frames):
+        # One engine slot per crop, so the crops of a frame do not replace each other
+        requests = [self.engine.submit((self.camera_id, i), frame) for i, frame in enumerate(frames)]
+        results = [self._result(request, request.wait(self.timeout)) for request in requests]
+        return None if any(result is None for result in results) else results
+
+    def _result(self, request, result):
+        if result is None:
+            reason = f"no result after {self.timeout}s"
+        elif request.error is not None:
+            reason = f"inference error ({request.error})"
+        elif request.dropped:
+            reason = "frame dropped by the engine"
+        else:
+            return result
+        self.missed += 1
+        METRICS.count("engine_missed")
+        print(f"[WARNING] Detection for {self.camera_id} missed: {reason}")
+        return None
+
+# ==========================================
+# CLASS: Camera Feed (one per camera)
+# ==========================================
+class CameraFeed:
+    """Reads frames from one source, submits them to the engine and hands back the results."""
+    def __init__(self, camera_id, source, engine, on_result, stop_on_eof=False):
+        self.camera_id = camera_id
+        self.source = source
+        self.engine = engine
+        self.on_result = on_result
+        self.stop_on_eof = stop_on_eof
+        self.started = False
+        self.frames = 0
+        self.last_frame_id = 0
+
+    def start(self):
+        if self.started:
+            return self
+        self.started = True
+        self.thread = threading.Thread(target=self._run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while self.started:
+            grabbed, frame = self._next_frame()
+            if not grabbed:
+                if self.stop_on_eof:
+                    print(f"[INFO] Feed {self.camera_id} ended")
+                    self.started = False
+                    break
+                time.sleep(0.01)
+                continue
+            if frame is None:
+                continue
+
+            request = self.engine.submit(self.camera_id, frame)
+            result = request.wait()
+            if result is None or request.dropped or request.error is not None:
+                continue
+
+            self.frames += 1
+            boxes, confidences = result
+            try:
+                self.on_result(self.camera_id, request.frame, boxes, confidences)
+            except Exception as e:
+                print(f"[ERROR] Feed {self.camera_id} callback: {e}")
+
+    def _next_frame(self):
+        """Newest unseen frame from a threaded source's FrameRing, or a plain read() otherwise."""
+        if getattr(self.source, 'started', False) and hasattr(self.source, 'wait_frame'):
+            entry = self.source.wait_frame(self.last_frame_id, timeout=0.1)
+            if entry is None:
+                return not self.source.ring.closed, None
+            self.last_frame_id = entry[0]
+            return True, entry[2]
+        return self.source.read()
+
+    def stop(self):
+        self.started = False
+        if hasattr(self, 'thread') and self.thread is not threading.current_thread():
+            self.thread.join()
+
+if __name__ == "__main__":
+    # TEST SECTION
+    # Runs every test clip as its own "camera" through one shared detector
+    from src import PersonDetector, VideoSource
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    prototxt_path = os.path.join(base_dir, "MobileNetFile", "MobileNetSSD.prototxt")
+    model_path = os.path.join(base_dir, "MobileNetFile", "MobileNetSSD.caffemodel")
+    video_dir = os.path.join(base_dir, "Video_Testing")
+
+    detector = PersonDetector(prototxt_path, model_path)
+    engine = BatchDetectionEngine(detector, batch_size=4, max_wait=0.02).start()
+
+    def on_result(camera_id, frame, boxes, confidences):
+        if len(boxes):
+            print(f"[{camera_id}] {len(boxes)} person(s), best {confidences[0]:.2f} at {boxes[0].astype('int')}")
+
+    clips = sorted(f for f in os.listdir(video_dir) if f.endswith(".mp4"))
+    start = time.time()
+    for clip in clips:
+        engine.add_feed(clip, VideoSource(os.path.join(video_dir, clip)), on_result, stop_on_eof=True)
+
+    while any(feed.started for feed in engine.feeds.values()):
+        time.sleep(0.1)
+
+    elapsed = time.time() - start
+    engine.stop()
+    print(f"[INFO] {engine.frames_run} frames in {engine.batches_run} batches, "
+          f"{engine.frames_run / max(elapsed, 1e-6):.1f} FPS total")
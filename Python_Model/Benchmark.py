@@ -0,0 +1,281 @@
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import time
+
+import cv2
+
+from Metrics import METRICS
+from ModelLoader import BACKENDS, backend_available
+from MotionGate import MotionGate
+from FallEvents import FallEventDetector
+from RoiDetection import RoiDetector
+from SparseDetection import IntervalDetector
+from Tracker import MultiPersonTracker, iou_matrix
+from src import FallAnalyzer, PersonDetector, VideoSource
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTOTXT_PATH = os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.prototxt")
+MODEL_PATH = os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.caffemodel")
+VIDEO_DIR = os.path.join(BASE_DIR, "Video_Testing")
+
+# Fields that identify a run, used to line up two result files
+RUN_KEY = ("clip", "model", "resolution", "threads", "backend", "detect_every", "motion_gate", "roi")
+
+# IoU above which a box counts as the same detection as the reference model's
+MATCH_IOU = 0.5
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS).
+    It never goes down, which is why every run gets its own process (measure_run)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def parse_model(spec):
+    """'caffe', 'caffe-int8', 'path/to/model.onnx' or 'path/to/model.onnx:int8' ->
+    (prototxt, model, quantize)."""
+    quantize = spec.endswith("-int8") or spec.endswith(":int8")
+    name = spec[:-5] if quantize else spec
+    if name == "caffe":
+        return PROTOTXT_PATH, MODEL_PATH, quantize
+    return None, name, quantize
+
+def agreement(reference, boxes_per_frame):
+    """Precision / recall / mean IoU of one model's boxes against the reference model's,
+    frame by frame (greedy one-to-one matching at MATCH_IOU)."""
+    matched = ref_total = own_total = 0
+    iou_sum = 0.0
+    for ref, own in zip(reference, boxes_per_frame):
+        ref_total += len(ref)
+        own_total += len(own)
+        if len(ref) == 0 or len(own) == 0:
+            continue
+        ious = iou_matrix(ref, own)
+        while ious.size and ious.max() >= MATCH_IOU:
+            i, j = divmod(int(ious.argmax()), ious.shape[1])
+            matched += 1
+            iou_sum += ious[i, j]
+            ious[i, :] = 0
+            ious[:, j] = 0
+    return {
+        "precision": round(matched / own_total, 4) if own_total else 1.0,
+        "recall": round(matched / ref_total, 4) if ref_total else 1.0,
+        "mean_iou": round(iou_sum / matched, 4) if matched else 0.0,
+    }
+
+def parse_resolution(text):
+    if text == "native":
+        return None
+    w, h = text.lower().split("x")
+    return (int(w), int(h))
+
+# ==========================================
+# BENCHMARK RUN (one clip, one setting)
+# ==========================================
+def run_clip(detector, clip_path, resolution, detect_every, max_frames=None, keep_boxes=False, motion_gate=False,
+             roi=False):
+    """Replays one clip through VideoSource -> PersonDetector -> tracker/FallAnalyzer. No GUI, no Firebase.
+    keep_boxes adds the per-frame person boxes under "_boxes" (for the accuracy comparison)."""
+    METRICS.reset()
+    source = VideoSource(clip_path)
+    tracker = MultiPersonTracker(FallAnalyzer(), events=FallEventDetector())
+    if roi:
+        detector = RoiDetector(detector, tracker=tracker)
+    sparse = IntervalDetector(detector, detect_every=detect_every, gate=MotionGate() if motion_gate else None)
+    # Video time, not wall time: the clip is replayed faster (or slower) than real time
+    fps = source.cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+    frames = 0
+    frames_with_person = 0
+    person_boxes = 0
+    fall_frames = 0
+    fall_events = 0
+    boxes_per_frame = []
+
+    start = time.perf_counter()
+    while max_frames is None or frames < max_frames:
+        ret, frame = source.read()
+        if not ret:
+            break
+        if resolution is not None:
+            with METRICS.stage("resize"):
+                frame = cv2.resize(frame, resolution)
+
+        boxes, confidences = sparse.detect(frame)
+        (h, w) = frame.shape[:2]
+        with METRICS.stage("analyze"):
+            tracks = tracker.update(boxes, w, h, timestamp=frames / fps)
+
+        frames += 1
+        if keep_boxes:
+            boxes_per_frame.append(boxes)
+        if len(boxes):
+            frames_with_person += 1
+            person_boxes += len(boxes)
+        if any(status == "Fall Down" for (_, _, status, _) in tracks):
+            fall_frames += 1
+        fall_events += sum(1 for kind, _ in tracker.events.pop_events() if kind == "confirmed")
+    elapsed = time.perf_counter() - start
+    source.release()
+
+    result = {
+        "frames": frames,
+        "seconds": round(elapsed, 4),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "dnn_runs": sparse.detections_run,
+        "frames_gated": sparse.frames_gated,
+        "roi_crops": detector.crops_run if roi else 0,
+        "frames_with_person": frames_with_person,
+        "person_boxes": person_boxes,
+        "fall_frames": fall_frames,
+        "fall_events": fall_events,
+        "stages_ms": {name: {k: round(v * 1000, 3) if k != "count" else v for k, v in stats.items()}
+                      for name, stats in METRICS.stage_stats().items()},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    if keep_boxes:
+        result["_boxes"] = boxes_per_frame
+    return result
+
+def measure_run(model, backend, num_threads, clip, resolution, detect_every, max_frames, keep_boxes,
+                motion_gate, roi):
+    """Loads the model and replays one clip. run_sweep calls it in a fresh process, so that
+    peak_rss_mb and the thread setting belong to this run alone."""
+    cv2.setNumThreads(num_threads)
+    METRICS.enable()
+    prototxt, model_file, quantize = parse_model(model)
+    start = time.perf_counter()
+    detector = PersonDetector(prototxt, model_file, backend=backend, quantize=quantize)
+    load_ms = round((time.perf_counter() - start) * 1000, 1)
+    result = run_clip(detector, clip, resolution, detect_every, max_frames, keep_boxes=keep_boxes,
+                      motion_gate=motion_gate, roi=roi)
+    result["load_ms"] = load_ms
+    return result
+
+def run_sweep(args):
+    clips = args.clips or sorted(os.path.join(VIDEO_DIR, f) for f in os.listdir(VIDEO_DIR) if f.endswith(".mp4"))
+    resolutions = args.resolutions.split(",")
+    threads = [int(t) for t in args.threads.split(",")]
+    backends = args.backends.split(",")
+    models = args.models.split(",")
+
+    # One fresh process per run (maxtasksperchild=1): the model is loaded again each time,
+    # but peak RSS is no longer the high-water mark of every earlier, larger run
+    pool = mp.get_context("spawn").Pool(1, maxtasksperchild=1)
+    runs = []
+    for backend, num_threads, res_text in itertools.product(backends, threads, resolutions):
+        if backend not in BACKENDS or not backend_available(backend):
+            print(f"[WARNING] Backend '{backend}' not available on this host, skipping")
+            continue
+
+        for clip in clips:
+            reference = None  # Boxes of the first model, the others are scored against it
+            for model in models:
+                try:
+                    result = pool.apply(measure_run, (model, backend, num_threads, clip, parse_resolution(res_text),
+                                                      args.detect_every, args.max_frames, len(models) > 1,
+                                                      args.motion_gate, args.roi))
+                except cv2.error as e:
+                    # e.g. backend not compiled into this OpenCV build
+                    print(f"[WARNING] {model}/{backend} failed on {os.path.basename(clip)}: {e}")
+                    continue
+                boxes = result.pop("_boxes", None)
+                if reference is None:
+                    reference = boxes
+                elif boxes is not None:
+                    result["vs_" + models[0]] = agreement(reference, boxes)
+                result.update({
+                    "clip": os.path.basename(clip),
+                    "model": model,
+                    "resolution": res_text,
+                    "threads": num_threads,
+                    "backend": backend,
+                    "detect_every": args.detect_every,
+                    "motion_gate": args.motion_gate,
+                    "roi": args.roi,
+                })
+                runs.append(result)
+                forward = result["stages_ms"].get("forward", {})
+                accuracy = result.get("vs_" + models[0])
+                print(f"[BENCH] {result['clip']:<22} {model:<12} {backend:<8} threads={num_threads:<2} "
+                      f"res={res_text:<8} {result['fps']:7.1f} FPS  forward p50={forward.get('p50', 0):.1f}ms "
+                      f"p95={forward.get('p95', 0):.1f}ms  persons={result['person_boxes']} "
+                      f"dnn={result['dnn_runs']} rss={result['peak_rss_mb']}MB"
+                      + (f"  precision={accuracy['precision']:.3f} recall={accuracy['recall']:.3f}"
+                         if accuracy else ""))
+    pool.close()
+    pool.join()
+
+    report = {
+        "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "host": {
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+        },
+        "runs": runs,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Results written to {args.out}")
+
+    # Best setting per clip on this host
+    for clip in sorted({r["clip"] for r in runs}):
+        best = max((r for r in runs if r["clip"] == clip), key=lambda r: r["fps"])
+        print(f"[BEST] {clip}: model={best['model']} backend={best['backend']} threads={best['threads']} "
+              f"res={best['resolution']} -> {best['fps']} FPS")
+
+# ==========================================
+# COMPARE TWO RESULT FILES
+# ==========================================
+def run_key(run):
+    # Result files from older versions lack the newer fields
+    defaults = {"model": "caffe", "motion_gate": False, "roi": False}
+    return tuple(run[k] if k in run else defaults[k] for k in RUN_KEY)
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {run_key(r): r for r in json.load(f)["runs"]}
+    with open(new_path) as f:
+        new = {run_key(r): r for r in json.load(f)["runs"]}
+
+    print(f"{'run':<90} {'FPS old':>8} {'FPS new':>8} {'change':>8} {'fwd p95':>14} {'persons':>12}")
+    for key in sorted(set(old) & set(new)):
+        a, b = old[key], new[key]
+        change = (b["fps"] - a["fps"]) / a["fps"] * 100 if a["fps"] else 0.0
+        fwd_a = a["stages_ms"].get("forward", {}).get("p95", 0)
+        fwd_b = b["stages_ms"].get("forward", {}).get("p95", 0)
+        name = " ".join(f"{k}={v}" for k, v in zip(RUN_KEY, key))
+        print(f"{name:<90} {a['fps']:>8.1f} {b['fps']:>8.1f} {change:>+7.1f}% "
+              f"{fwd_a:>6.1f}->{fwd_b:<6.1f} {a['person_boxes']:>5}->{b['person_boxes']:<5}")
+    for key in sorted(set(old) ^ set(new)):
+        print(f"[INFO] only in {'old' if key in old else 'new'}: {dict(zip(RUN_KEY, key))}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline detector benchmark over the Video_Testing clips")
+    parser.add_argument("--clips", nargs="*", help="video files (default: every .mp4 in Video_Testing)")
+    parser.add_argument("--resolutions", default="400x300", help="comma list of WxH or 'native'")
+    parser.add_argument("--threads", default=str(cv2.getNumThreads()), help="comma list for cv2.setNumThreads")
+    parser.add_argument("--backends", default="opencv", help="comma list of " + ",".join(BACKENDS))
+    parser.add_argument("--models", default="caffe",
+                        help="comma list: caffe, caffe-int8, model.onnx, model.onnx:int8 (first = accuracy reference)")
+    parser.add_argument("--detect-every", type=int, default=1, help="run the DNN every N frames")
+    parser.add_argument("--motion-gate", action="store_true", help="skip the DNN on static frames (MotionGate)")
+    parser.add_argument("--roi", action="store_true", help="detect on crops around tracked people (RoiDetector)")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run_sweep(args)
@@ -0,0 +1,70 @@
+import random
+import threading
+import time
+
+# Capture modes, set by the detection loop
+PACE_SUSPECT = "suspect"  # Fall suspected or in progress: every frame the consumer can take
+PACE_NORMAL = "normal"
+PACE_STEADY = "steady"  # Static scene (motion gate): a few frames a second is enough
+
+# Shortest time between two snapshot requests per mode, in seconds
+PACE_INTERVALS = {
+    PACE_SUSPECT: 0.0,
+    PACE_NORMAL: 0.05,  # 20 FPS (เพียงพอสำหรับ Fall Detection)
+    PACE_STEADY: 0.25,
+}
+
+# ==========================================
+# CLASS: Capture Pacer
+# ==========================================
+class CapturePacer:
+    """Decides when ThreadedSnapshotCamera may fetch the next frame.
+
+    The next request waits until the consumer has taken the previous frame, so nothing is
+    fetched only to be overwritten in the FrameRing; fetching then overlaps with the
+    consumer's processing of that frame. On top of that each mode sets a minimum interval.
+    Switching to PACE_SUSPECT cuts a pending wait short."""
+    def __init__(self, intervals=None, max_wait=1.0):
+        self.intervals = dict(PACE_INTERVALS, **(intervals or {}))
+        self.max_wait = max_wait  # Fetch anyway after this long, so a stalled consumer still sees a fresh frame
+        self.mode = PACE_NORMAL
+        self.wake = threading.Event()
+
+    def set_mode(self, mode):
+        if mode != self.mode:
+            self.mode = mode
+            if mode == PACE_SUSPECT:
+                self.wake.set()
+
+    def wait_turn(self, ring, last_start):
+        """Blocks until the next request may start. last_start is when the previous one started."""
+        ring.wait_consumed(self.max_wait)
+        remaining = self.intervals[self.mode] - (time.time() - last_start)
+        if remaining > 0:
+            self.wake.clear()
+            self.wake.wait(remaining)
+
+    def interrupt(self):
+        """Wakes a waiting capture thread (on stop)."""
+        self.wake.set()
+
+# ==========================================
+# CLASS: Reconnect Backoff
+# ==========================================
+class Backoff:
+    """Exponential backoff with jitter for reconnecting to a board: base, 2x base, 4x base...
+    up to cap, each delay randomised between half and all of it, so boards that restart
+    together (power cut, router reboot) are not all hit again at the same moment."""
+    def __init__(self, base=0.5, cap=30.0, factor=2.0):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.failures = 0
+
+    def next_delay(self):
+        delay = min(self.cap, self.base * self.factor ** self.failures)
+        self.failures += 1
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def reset(self):
+        self.failures = 0
@@ -0,0 +1,243 @@
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# ==========================================
+# CLASS: Recording (one clip being collected)
+# ==========================================
+class Recording:
+    def __init__(self, camera_id, event_time, end_time, name, meta):
+        self.camera_id = camera_id
+        self.event_time = event_time
+        self.end_time = end_time  # Stop collecting once a frame at or after this arrives
+        self.name = name
+        self.meta = meta
+        self.frames = []  # (timestamp, jpeg bytes)
+
+# ==========================================
+# CLASS: Event Recorder (pre-roll + post-roll clips)
+# ==========================================
+class EventRecorder:
+    """Keeps the last few seconds of every camera as JPEG bytes and, on a confirmed fall,
+    writes pre_seconds before to post_seconds after the event to out_dir.
+
+    Frames stay compressed in memory (a 400x300 JPEG is ~15 KB against 360 KB decoded),
+    so the pre-roll of many cameras stays small; max_buffer_bytes caps it per camera.
+    Files are written on a background thread, and the oldest clips are deleted once
+    out_dir grows past max_disk_mb.
+
+    container="mjpeg" writes the JPEGs back to back (no re-encode, plays in VLC / ffplay),
+    "avi" decodes and re-encodes with cv2.VideoWriter (MJPG) for players that need a container.
+    Each clip gets a .json next to it with the event details and frame timestamps.
+
+    Decoded frames (sources without JPEG bytes, e.g. a video file) are encoded on a background
+    thread; if it falls more than encode_queue frames behind, frames are skipped, never waited for."""
+    def __init__(self, out_dir="fall_clips", pre_seconds=5.0, post_seconds=5.0, buffer_seconds=None,
+                 max_buffer_bytes=16 * 1024 * 1024, max_disk_mb=500, container="mjpeg", quality=80,
+                 encode_queue=8):
+        self.out_dir = out_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        # Falls are confirmed a few seconds after they start, and the clip starts before the
+        # fall, so the ring holds more than pre_seconds
+        self.buffer_seconds = buffer_seconds or pre_seconds + 10.0
+        self.max_buffer_bytes = max_buffer_bytes
+        self.max_disk_bytes = max_disk_mb * 1024 * 1024
+        self.container = container
+        self.quality = quality
+
+        self.buffers = {}  # camera_id -> deque of (timestamp, jpeg bytes)
+        self.buffer_bytes = {}
+        self.recordings = {}  # camera_id -> [Recording] still collecting post-roll
+        self.lock = threading.Lock()
+        self.write_q = queue.Queue()
+        self.encode_q = queue.Queue(maxsize=encode_queue)
+        self.started = False
+        self.clips_written = 0
+        self.encode_skipped = 0
+
+    def start(self):
+        if self.started:
+            return self
+        self.started = True
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        self.encode_thread = threading.Thread(target=self._encode, args=())
+        self.encode_thread.daemon = True
+        self.encode_thread.start()
+        return self
+
+    def add_frame(self, camera_id, frame=None, jpeg=None, timestamp=None):
+        """Adds one frame to the camera's pre-roll. Pass the camera's own JPEG bytes when there
+        are any (no re-encode); otherwise a copy of frame is encoded on the encode thread."""
+        if timestamp is None:
+            timestamp = time.time()
+        if jpeg is None:
+            try:
+                # Copy: the caller may draw on or reuse frame right after this returns
+                self.encode_q.put_nowait((camera_id, frame.copy(), timestamp))
+            except queue.Full:
+                self.encode_skipped += 1
+            return
+        self._add_jpeg(camera_id, jpeg, timestamp)
+
+    def _add_jpeg(self, camera_id, jpeg, timestamp):
+        finished = []
+        with self.lock:
+            buffer = self.buffers.get(camera_id)
+            if buffer is None:
+                buffer = self.buffers[camera_id] = deque()
+                self.buffer_bytes[camera_id] = 0
+            buffer.append((timestamp, jpeg))
+            self.buffer_bytes[camera_id] += len(jpeg)
+
+            # Evict by age, then by size
+            while buffer and (buffer[0][0] < timestamp - self.buffer_seconds
+                              or self.buffer_bytes[camera_id] > self.max_buffer_bytes):
+                self.buffer_bytes[camera_id] -= len(buffer.popleft()[1])
+
+            active = self.recordings.get(camera_id)
+            if active:
+                for recording in active:
+                    recording.frames.append((timestamp, jpeg))
+                finished = [r for r in active if timestamp >= r.end_time]
+                self.recordings[camera_id] = [r for r in active if timestamp < r.end_time]
+
+        for recording in finished:
+            self.write_q.put(recording)
+
+    def trigger(self, camera_id, event_time=None, name=None, meta=None):
+        """Starts a clip around event_time (e.g. FallEvent.start). It is written once
+        post_seconds of frames after event_time have arrived, or on finish(camera_id)."""
+        if event_time is None:
+            event_time = time.time()
+        if name is None:
+            stamp = datetime.datetime.fromtimestamp(event_time).strftime("%Y%m%d_%H%M%S")
+            name = f"{camera_id}_{stamp}"
+        recording = Recording(camera_id, event_time, event_time + self.post_seconds, name, meta or {})
+        with self.lock:
+            recording.frames = [(t, jpeg) for (t, jpeg) in self.buffers.get(camera_id, ())
+                                if t >= event_time - self.pre_seconds]
+            self.recordings.setdefault(camera_id, []).append(recording)
+        return recording
+
+    def trigger_event(self, camera_id, event):
+        """trigger() for a confirmed FallEvents.FallEvent: the clip is centred on when the fall began."""
+        stamp = datetime.datetime.fromtimestamp(event.start).strftime("%Y%m%d_%H%M%S")
+        meta = {"track_id": event.track_id, "fall_start": event.start, "confirmed_at": event.confirmed_at,
+                "peak_velocity": event.peak_velocity, "min_ratio": event.min_ratio}
+        return self.trigger(camera_id, event.start, name=f"{camera_id}_{stamp}_person{event.track_id}", meta=meta)
+
+    def finish(self, camera_id):
+        """Camera stopped: writes its open clips with whatever post-roll they have, drops the pre-roll."""
+        with self.lock:
+            pending = self.recordings.pop(camera_id, [])
+            self.buffers.pop(camera_id, None)
+            self.buffer_bytes.pop(camera_id, None)
+        for recording in pending:
+            self.write_q.put(recording)
+
+    def stop(self, timeout=10.0):
+        if self.started:
+            # Frames still waiting to be encoded belong in the clips finished below
+            self.encode_q.put(None)
+            self.encode_thread.join(timeout)
+        for camera_id in list(self.recordings):
+            self.finish(camera_id)
+        if self.started:
+            self.started = False
+            self.write_q.put(None)
+            self.thread.join(timeout)
+
+    def _encode(self):
+        while True:
+            item = self.encode_q.get()
+            if item is None:
+                break
+            camera_id, frame, timestamp = item
+            ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                self._add_jpeg(camera_id, buf.tobytes(), timestamp)
+
+    def _run(self):
+        while True:
+            recording = self.write_q.get()
+            if recording is None:
+                break
+            try:
+                self._write(recording)
+                self._enforce_disk_cap()
+            except Exception as e:
+                print(f"[ERROR] Clip {recording.name} not saved: {e}")
+
+    def _write(self, recording):
+        if not recording.frames:
+            return
+        base = os.path.join(self.out_dir, recording.name)
+        timestamps = [t for (t, _) in recording.frames]
+
+        if self.container == "avi":
+            path = base + ".avi"
+            duration = timestamps[-1] - timestamps[0]
+            fps = (len(timestamps) - 1) / duration if duration > 0 else 10.0
+            writer = None
+            for (_, jpeg) in recording.frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+                if writer is None:
+                    (h, w) = frame.shape[:2]
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+                writer.write(frame)
+            if writer is not None:
+                writer.release()
+        else:
+            path = base + ".mjpeg"
+            with open(path, "wb") as f:
+                for (_, jpeg) in recording.frames:
+                    f.write(jpeg)
+
+        info = dict(recording.meta)
+        info.update({
+            "camera_id": recording.camera_id,
+            "event_time": recording.event_time,
+            "clip": os.path.basename(path),
+            "frames": len(timestamps),
+            "frame_timestamps": timestamps,
+        })
+        with open(base + ".json", "w") as f:
+            json.dump(info, f, indent=2)
+        self.clips_written += 1
+        print(f"[INFO] Fall clip saved: {path} ({len(timestamps)} frames)")
+
+    def _enforce_disk_cap(self):
+        """Deletes whole clips (video + .json), oldest first, until out_dir fits max_disk_mb."""
+        clips = {}  # name without extension -> [newest mtime, total size, paths]
+        for name in os.listdir(self.out_dir):
+            path = os.path.join(self.out_dir, name)
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entry = clips.setdefault(os.path.splitext(name)[0], [0.0, 0, []])
+            entry[0] = max(entry[0], stat.st_mtime)
+            entry[1] += stat.st_size
+            entry[2].append(path)
+
+        total = sum(size for (_, size, _) in clips.values())
+        # The newest clip (the one just written) is always kept
+        for name, (_, size, paths) in sorted(clips.items(), key=lambda item: item[1][0])[:-1]:
+            if total <= self.max_disk_bytes:
+                break
+            for path in paths:
+                os.remove(path)
+            total -= size
+            print(f"[INFO] Disk cap reached, removed clip {name}")
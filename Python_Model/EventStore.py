@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+KIND_STATUS = "status"
+KIND_FALL = "fall"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+    key       TEXT UNIQUE,          -- Idempotency key, also the Firebase child name of fall events
+    kind      TEXT NOT NULL,        -- 'status' | 'fall'
+    device    TEXT,
+    room_id   TEXT,
+    created   REAL NOT NULL,        -- Unix time
+    payload   TEXT NOT NULL,        -- JSON
+    synced_at REAL                  -- NULL until it reached Firebase
+);
+CREATE INDEX IF NOT EXISTS events_created ON events (created);
+CREATE INDEX IF NOT EXISTS events_kind_created ON events (kind, created);
+CREATE INDEX IF NOT EXISTS events_device_created ON events (device, created);
+CREATE INDEX IF NOT EXISTS events_room_created ON events (room_id, created);
+CREATE INDEX IF NOT EXISTS events_unsynced ON events (seq) WHERE synced_at IS NULL;
+"""
+
+# ==========================================
+# CLASS: Event Store (local, append-only)
+# ==========================================
+class EventStore:
+    """Status changes and fall events in an append-only SQLite file (WAL mode).
+
+    Every event is on disk before anything is sent, so a network outage or a restart
+    loses nothing: FireBaseConnect.StoreWriter sends the unsynced rows upstream in
+    batches and marks them synced. Reads (recent(), latest_statuses()) are served from
+    local indexes, so a dashboard on this machine does not need to query Firebase.
+    WAL lets another process read the file while this one writes.
+
+    The file is capped at max_rows: past it, the oldest synced rows go first, then unsynced
+    statuses that a newer status of the same device supersedes (only the newest one is sent
+    anyway). Unsynced fall events are never dropped."""
+    def __init__(self, path="events.db", keep_days=30, max_rows=200000, cap_check_every=100):
+        self.path = path
+        self.keep_days = keep_days  # Synced rows older than this are removed by prune()
+        self.max_rows = max_rows
+        self.cap_check_every = cap_check_every  # Appends between two row counts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL: a commit survives a crash of this process, only an OS crash can lose the last one
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+        # Last recorded status per device, so only changes are appended
+        self.last_status = {row["device"]: row["status"] for row in self.latest_statuses()}
+        self.appended = 0
+        self.dropped = 0
+
+    def append(self, kind, payload, device=None, room_id=None, key=None, timestamp=None):
+        """Adds one event and returns its seq. Appending a key that is already stored is a no-op."""
+        with self.lock:
+            seq = self._insert(kind, payload, device, room_id, key, timestamp)
+        self._check_cap(seq)
+        return seq
+
+    def _insert(self, kind, payload, device, room_id, key, timestamp):
+        # Caller holds self.lock
+        if timestamp is None:
+            timestamp = time.time()
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO events (key, kind, device, room_id, created, payload) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, kind, device, room_id, timestamp, json.dumps(payload)))
+        self.appended += cursor.rowcount
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def _check_cap(self, seq):
+        if seq is not None and self.appended % self.cap_check_every == 0:
+            self.enforce_cap()
+
+    def enforce_cap(self):
+        """Trims the file back to max_rows (see class docstring). Returns the rows removed."""
+        with self.lock:
+            excess = self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] - self.max_rows
+            if excess <= 0:
+                return 0
+            removed = self.conn.execute(
+                "DELETE FROM events WHERE seq IN (SELECT seq FROM events WHERE synced_at IS NOT NULL ORDER BY seq LIMIT ?)",
+                (excess,)).rowcount
+            if excess > removed:
+                # Offline for long: drop superseded statuses that never made it upstream
+                dropped = self.conn.execute(
+                    "DELETE FROM events WHERE seq IN (SELECT e.seq FROM events e WHERE e.kind = ? AND e.synced_at IS NULL"
+                    " AND EXISTS (SELECT 1 FROM events n WHERE n.kind = e.kind AND n.device = e.device AND n.seq > e.seq)"
+                    " ORDER BY e.seq LIMIT ?)", (KIND_STATUS, excess - removed)).rowcount
+                self.dropped += dropped
+                removed += dropped
+                if excess > removed:
+                    print(f"[WARNING] Event store over {self.max_rows} rows, keeping {excess - removed} "
+                          f"extra unsynced fall event(s)")
+        return removed
+
+    def record_status(self, device, status, payload=None, timestamp=None):
+        """Appends a status row if it differs from the device's last one. Returns True if it did."""
+        # Rooms of a fleet report from their own threads: check, set and insert in one step
+        with self.lock:
+            if self.last_status.get(device) == status:
+                return False
+            self.last_status[device] = status
+            seq = self._insert(KIND_STATUS, payload or {"status": status}, device, None, None, timestamp)
+        self._check_cap(seq)
+        return True
+
+    def record_fall(self, key, payload, room_id=None, device=None, timestamp=None):
+        return self.append(KIND_FALL, payload, device=device, room_id=room_id, key=key, timestamp=timestamp)
+
+    def pending(self, limit=100):
+        """Oldest unsynced rows first."""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM events WHERE synced_at IS NULL ORDER BY seq LIMIT ?",
+                                     (limit,)).fetchall()
+        return [_row(r) for r in rows]
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM events WHERE synced_at IS NULL").fetchone()[0]
+
+    def mark_synced(self, seqs, synced_at=None):
+        if not seqs:
+            return
+        if synced_at is None:
+            synced_at = time.time()
+        with self.lock:
+            self.conn.executemany("UPDATE events SET synced_at = ? WHERE seq = ?", [(synced_at, s) for s in seqs])
+
+    def recent(self, kind=None, device=None, room_id=None, since=None, limit=50):
+        """Newest first. Every filter is optional; each one (or none) is served by an index."""
+        clauses, args = [], []
+        for column, value in (("kind", kind), ("device", device), ("room_id", room_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            clauses.append("created >= ?")
+            args.append(since)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(f"SELECT * FROM events {where} ORDER BY created DESC LIMIT ?",
+                                     args + [limit]).fetchall()
+        return [_row(r) for r in rows]
+
+    def latest_statuses(self):
+        """[{device, status, created}] with the newest status row of every device."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT device, payload, MAX(created) AS created FROM events WHERE kind = ? GROUP BY device",
+                (KIND_STATUS,)).fetchall()
+        return [{"device": r["device"], "status": json.loads(r["payload"]).get("status"), "created": r["created"]}
+                for r in rows]
+
+    def prune(self, keep_days=None):
+        """Deletes synced rows older than keep_days (unsynced rows are always kept). Returns the count."""
+        keep_days = self.keep_days if keep_days is None else keep_days
+        cutoff = time.time() - keep_days * 86400
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM events WHERE synced_at IS NOT NULL AND created < ?", (cutoff,))
+        return cursor.rowcount
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def _row(row):
+    event = dict(row)
+    event["payload"] = json.loads(event["payload"])
+    return event
+
+if __name__ == "__main__":
+    # Reads the local history without touching Firebase
+    import argparse
+    import datetime
+    parser = argparse.ArgumentParser(description="Show recent events from the local event store")
+    parser.add_argument("path", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "events.db"))
+    parser.add_argument("--kind", choices=[KIND_STATUS, KIND_FALL])
+    parser.add_argument("--device")
+    parser.add_argument("--room")
+    parser.add_argument("--hours", type=float, help="Only events from the last N hours")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    store = EventStore(args.path)
+    since = time.time() - args.hours * 3600 if args.hours else None
+    for event in store.recent(kind=args.kind, device=args.device, room_id=args.room, since=since, limit=args.limit):
+        stamp = datetime.datetime.fromtimestamp(event["created"]).strftime("%Y-%m-%d %H:%M:%S")
+        synced = "synced" if event["synced_at"] else "pending"
+        print(f"{stamp}  {event['kind']:6}  {event['device'] or event['room_id'] or '-':14}  {synced:7}  {event['payload']}")
+    print(f"[INFO] {store.pending_count()} event(s) waiting for Firebase")
+    store.close()
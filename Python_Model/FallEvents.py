@@ -0,0 +1,260 @@
+import time
+from collections import deque
+
+# Per-subject states (also the status string handed back to the tracker)
+STATUS_STANDING = "Standing"
+STATUS_FALLING = "Falling"  # Fast descent seen, not lying yet
+STATUS_LYING = "Lying"  # Lying down without a fast descent before it (bed, floor exercise, slow sit)
+STATUS_FALL = "Fall Down"  # Confirmed fall: fast descent, then down for confirm_seconds
+
+# ==========================================
+# CLASS: Fall Event
+# ==========================================
+class FallEvent:
+    """One confirmed fall. end stays None while the person is still down."""
+    def __init__(self, track_id, start, confirmed_at, peak_velocity, min_ratio):
+        self.track_id = track_id
+        self.start = start  # When the fast descent began
+        self.confirmed_at = confirmed_at
+        self.end = None  # When the person got up again, or was last seen
+        self.peak_velocity = peak_velocity
+        self.min_ratio = min_ratio
+
+    def duration(self):
+        return None if self.end is None else self.end - self.start
+
+    def __repr__(self):
+        return (f"FallEvent(track={self.track_id}, start={self.start:.2f}, confirmed={self.confirmed_at:.2f}, "
+                f"end={self.end if self.end is None else round(self.end, 2)}, v={self.peak_velocity:.2f})")
+
+# ==========================================
+# CLASS: Subject History (fixed-size ring)
+# ==========================================
+class SubjectHistory:
+    """Last `size` (timestamp, centroid y, box height, aspect ratio) samples of one track.
+    Features compare the newest sample with the one `span` seconds before it, against the
+    tallest / most upright shape in the ring. The span start and both maxima are kept up to
+    date on push(), so a frame costs O(1) (amortised) however long the ring is."""
+    __slots__ = ("size", "span", "t", "cy", "h", "ratio", "head", "count", "pushed", "old",
+                 "max_h", "max_ratio",
+                 "state", "fall_start", "down_since", "up_since", "peak_velocity", "min_ratio", "event")
+
+    def __init__(self, size, span=0.4):
+        self.size = size
+        self.span = span
+        self.t = [0.0] * size
+        self.cy = [0.0] * size
+        self.h = [0.0] * size
+        self.ratio = [0.0] * size
+        self.head = 0  # Next write position
+        self.count = 0
+        self.pushed = 0  # Samples ever pushed; sample n lives at n % size while in the ring
+        self.old = 0  # Sample number the features compare the newest one with
+        # Monotonic (sample number, value) queues: the first entry is the ring's maximum
+        self.max_h = deque()
+        self.max_ratio = deque()
+
+        self.state = STATUS_STANDING
+        self.fall_start = None
+        self.down_since = None
+        self.up_since = None
+        self.peak_velocity = 0.0
+        self.min_ratio = 0.0
+        self.event = None
+
+    def push(self, timestamp, cy, height, ratio):
+        n = self.pushed
+        i = self.head
+        self.t[i] = timestamp
+        self.cy[i] = cy
+        self.h[i] = height
+        self.ratio[i] = ratio
+        self.head = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        self.pushed = n + 1
+
+        oldest = n - self.count + 1
+        for queue, value in ((self.max_h, height), (self.max_ratio, ratio)):
+            while queue and queue[-1][1] <= value:
+                queue.pop()
+            queue.append((n, value))
+            if queue[0][0] < oldest:
+                queue.popleft()
+
+        # Newest sample at least span older than this one (the oldest in the ring if none is)
+        old = max(self.old, oldest)
+        while old + 1 < n and timestamp - self.t[(old + 1) % self.size] >= self.span:
+            old += 1
+        self.old = old
+
+    def last_time(self):
+        return self.t[(self.head - 1) % self.size]
+
+    def features(self):
+        """(vertical velocity in standing heights per second, downward positive;
+        aspect-ratio change in standing ratios per second) over the last span seconds.
+        "Standing" is the largest height / ratio in the ring: normalising by the old sample
+        instead makes the last part of a slow lie-down (box already short) look fast."""
+        if self.count < 2:
+            return 0.0, 0.0
+        new = (self.head - 1) % self.size
+        old = self.old % self.size
+        dt = self.t[new] - self.t[old]
+        if dt <= 0:
+            return 0.0, 0.0
+        velocity = (self.cy[new] - self.cy[old]) / (dt * max(self.max_h[0][1], 1.0))
+        ratio_rate = (self.ratio[new] - self.ratio[old]) / (dt * max(self.max_ratio[0][1], 0.1))
+        return velocity, ratio_rate
+
+# ==========================================
+# CLASS: Fall Event Detector (temporal)
+# ==========================================
+class FallEventDetector:
+    """Turns per-frame (box, aspect ratio) of each track into confirmed fall events.
+
+    A fall needs all of:
+      1. a fast descent: the box centre drops faster than fall_velocity standing heights/s
+         and the aspect ratio shrinks faster than fall_ratio_rate standing ratios per second,
+      2. lying (ratio <= lying_ratio) within fall_window seconds of that descent,
+      3. staying down for confirm_seconds.
+    Lying down slowly fails 1. and sitting or bending fails 3., so neither raises an alert.
+    1. is measured on the detector's raw boxes (raw_box), not on the tracker's smoothed
+    ones, which would damp exactly the fast drop it looks for; the ratio change is relative,
+    so it does not depend on how tall the person stands or how far from the camera.
+    The event ends after recover_seconds upright, or when the track is lost."""
+    def __init__(self, window=16, fall_velocity=0.35, fall_ratio_rate=-1.2, lying_ratio=1.0,
+                 fall_window=2.0, confirm_seconds=2.0, recover_seconds=1.5):
+        self.window = window
+        self.fall_velocity = fall_velocity
+        self.fall_ratio_rate = fall_ratio_rate
+        self.lying_ratio = lying_ratio
+        self.fall_window = fall_window
+        self.confirm_seconds = confirm_seconds
+        self.recover_seconds = recover_seconds
+
+        self.subjects = {}
+        self.events = []  # ("confirmed" | "ended", FallEvent) not yet collected by pop_events()
+
+    def reset(self):
+        self.subjects = {}
+        self.events = []
+
+    def update(self, track_id, box, ratio, timestamp=None, raw_box=None):
+        """Adds one sample for a track and returns its status string. box / ratio (smoothed)
+        decide lying; raw_box, if given, is what the descent is measured on."""
+        if timestamp is None:
+            timestamp = time.time()
+        subject = self.subjects.get(track_id)
+        if subject is None:
+            subject = self.subjects[track_id] = SubjectHistory(self.window)
+
+        (startX, startY, endX, endY) = box if raw_box is None else raw_box
+        height, width = float(endY - startY), float(endX - startX)
+        subject.push(timestamp, (startY + endY) / 2.0, height, height / width if width > 0 else 0.0)
+        velocity, ratio_rate = subject.features()
+        lying = ratio <= self.lying_ratio
+
+        state = subject.state
+        if state == STATUS_STANDING:
+            if velocity > self.fall_velocity and ratio_rate < self.fall_ratio_rate:
+                state = STATUS_FALLING
+                subject.fall_start = timestamp
+                subject.peak_velocity = velocity
+                subject.min_ratio = ratio
+            elif lying:
+                state = STATUS_LYING
+        elif state == STATUS_FALLING:
+            subject.peak_velocity = max(subject.peak_velocity, velocity)
+            subject.min_ratio = min(subject.min_ratio, ratio)
+            if lying:
+                if subject.down_since is None:
+                    subject.down_since = timestamp
+                if timestamp - subject.down_since >= self.confirm_seconds:
+                    state = STATUS_FALL
+                    subject.event = FallEvent(track_id, subject.fall_start, timestamp,
+                                              subject.peak_velocity, subject.min_ratio)
+                    subject.up_since = None
+                    self.events.append(("confirmed", subject.event))
+            else:
+                subject.down_since = None
+                if timestamp - subject.fall_start > self.fall_window:
+                    # Dropped fast but never ended up lying (crouch, sitting down hard)
+                    state = STATUS_STANDING
+        elif state == STATUS_FALL:
+            subject.min_ratio = min(subject.min_ratio, ratio)
+            if lying:
+                subject.up_since = None
+            else:
+                if subject.up_since is None:
+                    subject.up_since = timestamp
+                if timestamp - subject.up_since >= self.recover_seconds:
+                    self._end(subject, subject.up_since)
+                    state = STATUS_STANDING
+        elif state == STATUS_LYING:
+            if not lying:
+                state = STATUS_STANDING
+
+        if state != STATUS_FALLING and state != STATUS_FALL:
+            subject.down_since = None
+        subject.state = state
+        return state
+
+    def drop(self, track_ids):
+        """Forgets tracks the tracker evicted; an open event ends at the last time it was seen."""
+        for track_id in track_ids:
+            subject = self.subjects.pop(track_id, None)
+            if subject is not None and subject.state == STATUS_FALL:
+                self._end(subject, subject.last_time())
+
+    def pop_events(self):
+        """Returns and clears the ("confirmed" | "ended", FallEvent) list."""
+        events, self.events = self.events, []
+        return events
+
+    def features(self, track_id):
+        """(velocity, ratio_rate, seconds down) of a track, for display and tuning."""
+        subject = self.subjects.get(track_id)
+        if subject is None:
+            return 0.0, 0.0, 0.0
+        velocity, ratio_rate = subject.features()
+        down = 0.0 if subject.down_since is None else subject.last_time() - subject.down_since
+        return velocity, ratio_rate, down
+
+    def _end(self, subject, end_time):
+        subject.event.end = end_time
+        self.events.append(("ended", subject.event))
+        subject.event = None
+        subject.fall_start = None
+        subject.down_since = None
+        subject.up_since = None
+
+if __name__ == "__main__":
+    # TEST SECTION
+    # Same standing -> lying boxes at 15 FPS, once as a 0.5 s fall and once as a 3 s lie-down,
+    # through the tracker (smoothed boxes, as in the app). Only the fall may be confirmed.
+    import numpy as np
+    from Tracker import MultiPersonTracker
+    from src import FallAnalyzer
+
+    STANDING = np.array([150.0, 50.0, 230.0, 280.0])
+    LYING = np.array([90.0, 220.0, 290.0, 280.0])
+
+    def replay(transition_seconds, fps=15.0):
+        tracker = MultiPersonTracker(FallAnalyzer(smoothing_alpha=0.4), events=FallEventDetector())
+        t, peak_velocity = 0.0, 0.0
+        while t < 2.0 + transition_seconds + 4.0:
+            k = min(max((t - 2.0) / transition_seconds, 0.0), 1.0)
+            tracker.update(np.array([STANDING + k * (LYING - STANDING)]), 400, 300, timestamp=t)
+            for subject in tracker.events.subjects.values():
+                peak_velocity = max(peak_velocity, subject.features()[0])
+            t += 1.0 / fps
+        confirmed = [e for (kind, e) in tracker.events.pop_events() if kind == "confirmed"]
+        return confirmed, peak_velocity
+
+    fall, fall_velocity = replay(0.5)
+    slow, slow_velocity = replay(3.0)
+    print(f"[INFO] 0.5 s fall: {len(fall)} confirmed (peak velocity {fall_velocity:.2f} heights/s)")
+    print(f"[INFO] 3 s lie-down: {len(slow)} confirmed (peak velocity {slow_velocity:.2f} heights/s)")
+    assert len(fall) == 1, "fast fall not confirmed"
+    assert not slow, "slow lie-down confirmed as a fall"
@@ -1,68 +1,461 @@
-import firebase_admin
-from firebase_admin import credentials, db
+try:
+    import firebase_admin
+    from firebase_admin import credentials, db
+except ImportError:
+    # Offline tools (Benchmark.py, LocalFirebase stand-in) run without the Firebase SDK
+    firebase_admin = credentials = db = None
+from collections import deque
 import datetime
 import os
+import random
+import threading
+import time
+from CapturePacing import Backoff
+from Metrics import METRICS
+
+# ESP32 publishes the PIR flag here as {'val': 0|1}
+MOTION_PATH = "/hospital_system/wards/ward_A/room_301/motion"
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+def make_push_key():
+    """Client-side, time-ordered key in the same format as Firebase push IDs.
+    Lets a new child be written as part of a multi-path update instead of its own push() call."""
+    now = int(time.time() * 1000)
+    stamp = ""
+    for _ in range(8):
+        stamp = PUSH_CHARS[now % 64] + stamp
+        now //= 64
+    return stamp + "".join(random.choice(PUSH_CHARS) for _ in range(12))
+
+def now_string():
+    return str(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+def status_paths(paths, device_name, status, timestamp, root=True):
+    """Adds one device's status to a multi-path update. root also sets the single-device
+    fields (device / status / last_update) the dashboard already reads."""
+    paths[f"devices/{device_name}/status"] = status
+    paths[f"devices/{device_name}/last_update"] = timestamp
+    if root:
+        paths['device'] = device_name
+        paths['status'] = status
+        paths['last_update'] = timestamp
+
+class BackgroundWriter:
+    """Thread, retry and shutdown handling shared by FirebaseWriter and StoreWriter."""
+    def __init__(self, ref):
+        self.ref = ref
+        self.cond = threading.Condition()
+        self.started = False
+        self.drain_until = None  # Set by stop(flush=True): the thread flushes until then, then exits
+
+        self.sent_updates = 0
+        self.skipped = 0
+        self.failures = 0
+
+    def start(self):
+        if self.started:
+            return self
+        self.started = True
+        self.thread = threading.Thread(target=self._run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self, flush=True, timeout=5.0):
+        """Stops the thread. With flush=True, pending writes are sent first (up to timeout).
+        The final flush runs on the writer thread, so two updates are never in flight at once.
+        Returns False if the thread is still sending after timeout."""
+        deadline = time.time() + timeout
+        with self.cond:
+            self.started = False
+            self.drain_until = deadline if flush else None
+            self.cond.notify_all()
+        if hasattr(self, 'thread'):
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                print(f"[WARNING] Firebase writer still sending, {self.queue_depth()} more write(s) queued")
+                return False
+        elif flush:
+            self._drain(deadline)
+        return True
+
+    def _drain(self, deadline):
+        while self.queue_depth() and time.time() < deadline:
+            if not self._send_once():
+                time.sleep(min(self._retry_delay(), max(deadline - time.time(), 0)))
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.started and not self._has_work():
+                    self.cond.wait(self._idle_timeout())
+                if not self.started:
+                    break
+            if not self._send_once():
+                delay = self._retry_delay()
+                with self.cond:
+                    self.cond.wait_for(lambda: not self.started, delay)
+        if self.drain_until is not None:
+            self._drain(self.drain_until)
+
+    # Subclasses: queue_depth(), _send_once() -> False on failure, and these three
+    def _has_work(self):
+        # Caller holds self.cond
+        return self.queue_depth() > 0
+
+    def _idle_timeout(self):
+        return None
+
+    def _retry_delay(self):
+        return 1.0
+
+class FirebaseWriter(BackgroundWriter):
+    """Background thread that sends FirebaseHandler writes so the video loop never blocks on HTTPS.
+    Repeated statuses are dropped, every pending device and fall event goes out in one
+    multi-path update, and fall events beyond max_queue drop the oldest."""
+    def __init__(self, ref, max_queue=256, heartbeat=30.0, retry_delay=1.0):
+        super().__init__(ref)
+        self.heartbeat = heartbeat  # Re-send an unchanged status this often so last_update stays fresh
+        self.retry_delay = retry_delay
+
+        self.pending_status = {}  # device -> (status, timestamp), newest wins
+        self.events = deque(maxlen=max_queue)  # (key, payload) fall events
+        self.last_sent = {}  # device -> (status, time sent)
+        self.dropped = 0
+
+    def update_status(self, device_name, status, timestamp):
+        with self.cond:
+            sent = self.last_sent.get(device_name)
+            if (device_name not in self.pending_status and sent is not None and sent[0] == status
+                    and time.time() - sent[1] < self.heartbeat):
+                self.skipped += 1
+                return
+            # Re-insert so the most recently reported device ends up last (it fills the root fields)
+            self.pending_status.pop(device_name, None)
+            self.pending_status[device_name] = (status, timestamp)
+            self.cond.notify()
+
+    def log_fall(self, payload):
+        with self.cond:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+                print("[WARNING] Firebase queue full, dropping oldest fall event")
+            self.events.append((make_push_key(), payload))
+            self.cond.notify()
+
+    def queue_depth(self):
+        with self.cond:
+            return len(self.pending_status) + len(self.events)
+
+    def _retry_delay(self):
+        return self.retry_delay
+
+    def _send_once(self):
+        """Sends everything pending as one multi-path update. Returns False on failure."""
+        with self.cond:
+            statuses = self.pending_status
+            events = list(self.events)
+            self.pending_status = {}
+            self.events.clear()
+        if not statuses and not events:
+            return True
+
+        paths = {}
+        for device_name, (status, timestamp) in statuses.items():
+            status_paths(paths, device_name, status, timestamp)
+        for key, payload in events:
+            paths[f"fall_history/{key}"] = payload
+
+        try:
+            with METRICS.stage("firebase_write"):
+                self.ref.update(paths)
+        except Exception as e:
+            print(f"[ERROR] Firebase write failed, will retry: {e}")
+            self.failures += 1
+            with self.cond:
+                # Put back whatever has not been superseded meanwhile
+                for device_name, value in statuses.items():
+                    self.pending_status.setdefault(device_name, value)
+                for item in reversed(events):
+                    if len(self.events) == self.events.maxlen:
+                        self.dropped += 1
+                        continue
+                    self.events.appendleft(item)
+            return False
+
+        sent_at = time.time()
+        with self.cond:
+            for device_name, (status, _) in statuses.items():
+                self.last_sent[device_name] = (status, sent_at)
+        self.sent_updates += 1
+        if events:
+            print(f"[ALERT] {len(events)} fall event(s) logged to Firebase.")
+        return True
+
+class StoreWriter(BackgroundWriter):
+    """FirebaseWriter backed by an EventStore.EventStore: writes land in SQLite first and are
+    synced upstream batch_size rows at a time, under their stored keys, so nothing is lost offline."""
+    def __init__(self, ref, store, batch_size=100, heartbeat=30.0, backoff=None, prune_interval=3600.0):
+        super().__init__(ref)
+        self.store = store
+        self.batch_size = batch_size
+        self.heartbeat = heartbeat  # Re-send the current statuses this often so last_update stays fresh
+        self.backoff = backoff or Backoff(base=1.0, cap=60.0)
+        self.prune_interval = prune_interval
+
+        self.current = {}  # device -> (status, timestamp) most recently reported
+        self.last_heartbeat = time.time()
+        self.next_prune = time.time()
+
+    def update_status(self, device_name, status, timestamp):
+        with self.cond:
+            self.current[device_name] = (status, timestamp)
+        if self.store.record_status(device_name, status, {'status': status, 'last_update': timestamp}):
+            with self.cond:
+                self.cond.notify()
+        else:
+            self.skipped += 1
+
+    def log_fall(self, payload):
+        self.store.record_fall(make_push_key(), payload, room_id=payload.get('ROOMID'))
+        with self.cond:
+            self.cond.notify()
+
+    def queue_depth(self):
+        return self.store.pending_count()
+
+    def _has_work(self):
+        return self.store.pending_count() > 0 or time.time() - self.last_heartbeat >= self.heartbeat
+
+    def _idle_timeout(self):
+        return max(self.last_heartbeat + self.heartbeat - time.time(), 0.0)
+
+    def _retry_delay(self):
+        return self.backoff.next_delay()
+
+    def _send_once(self):
+        """Sends the oldest batch_size unsynced rows (or a heartbeat) as one multi-path update.
+        Returns False on failure."""
+        if time.time() >= self.next_prune:
+            self.next_prune = time.time() + self.prune_interval
+            self.store.prune()
+        rows = self.store.pending(self.batch_size)
+        heartbeat_due = time.time() - self.last_heartbeat >= self.heartbeat
+        if not rows and not heartbeat_due:
+            return True
+
+        paths = {}
+        if heartbeat_due:
+            with self.cond:
+                current = dict(self.current)
+            for device_name, (status, timestamp) in current.items():
+                status_paths(paths, device_name, status, now_string(), root=False)
+        falls = 0
+        for row in rows:
+            if row['kind'] == 'status':
+                payload = row['payload']
+                status_paths(paths, row['device'], payload['status'], payload.get('last_update', now_string()))
+            else:
+                paths[f"fall_history/{row['key']}"] = row['payload']
+                falls += 1
+        if not paths:
+            self.last_heartbeat = time.time()  # Nothing reported yet
+            return True
+
+        try:
+            with METRICS.stage("firebase_write"):
+                self.ref.update(paths)
+        except Exception as e:
+            print(f"[ERROR] Firebase sync failed, {self.store.pending_count()} event(s) kept locally: {e}")
+            self.failures += 1
+            return False
+
+        self.store.mark_synced([row['seq'] for row in rows])
+        self.backoff.reset()
+        self.last_heartbeat = time.time()
+        self.sent_updates += 1
+        if falls:
+            print(f"[ALERT] {falls} fall event(s) logged to Firebase.")
+        return True
 
 class FirebaseHandler:
     """Class to handle Firebase Realtime Database connections."""
-    def __init__(self, cert_path, db_url, root_node='sensor_data'):
-        # Initialize only if not already initialized
-        if not firebase_admin._apps:
-            if not os.path.exists(cert_path):
-                error_msg = f"Error: Certificate file not found at {cert_path}"
-                print(error_msg)
-                raise FileNotFoundError(error_msg)
-                
-            cred = credentials.Certificate(cert_path)
-            firebase_admin.initialize_app(cred, {'databaseURL': db_url})
-            print("[INFO] Firebase Connected")
+    def __init__(self, cert_path, db_url, root_node='sensor_data', async_writes=False, database=None, store=None):
+        # database: anything with the firebase_admin.db interface (e.g. LocalFirebase.LocalDatabase)
+        if database is None:
+            if firebase_admin is None:
+                raise ImportError("firebase_admin is not installed (pip install firebase-admin)")
+            database = db
+            # Initialize only if not already initialized
+            if not firebase_admin._apps:
+                if not os.path.exists(cert_path):
+                    error_msg = f"Error: Certificate file not found at {cert_path}"
+                    print(error_msg)
+                    raise FileNotFoundError(error_msg)
+                    
+                cred = credentials.Certificate(cert_path)
+                firebase_admin.initialize_app(cred, {'databaseURL': db_url})
+                print("[INFO] Firebase Connected")
         
-        self.ref = db.reference(root_node)
+        self.db = database
+        self.ref = self.db.reference(root_node)
         self.history_ref = self.ref.child('fall_history')
 
+        # Off-loop writer: update_status / log_fall only enqueue.
+        # store (EventStore.EventStore): persist locally first, sync in batches; closed by close()
+        self.store = store
+        if store is not None:
+            self.writer = StoreWriter(self.ref, store).start()
+        else:
+            self.writer = FirebaseWriter(self.ref).start() if async_writes else None
+
     def update_status(self, device_name, status):
         """Updates the current status of the device."""
-        self.ref.update({
-            'device': device_name,
-            'status': status,
-            'last_update': str(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        })
-
-    def log_fall(self):
-        """Logs a fall event to history."""
-        self.history_ref.push().set({
-            'ROOMID' : '301',
+        if self.writer:
+            self.writer.update_status(device_name, status, now_string())
+            return
+        with METRICS.stage("firebase_write"):
+            self.ref.update({
+                'device': device_name,
+                'status': status,
+                'last_update': now_string()
+            })
+
+    def log_fall(self, event=None, room_id='301'):
+        """Logs a fall event to history. event (FallEvents.FallEvent) adds when the fall started."""
+        payload = {
+            'ROOMID' : room_id,
             'status': 'Fall Down',
-            'timestamp': str(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        })
+            'timestamp': now_string()
+        }
+        if event is not None:
+            payload['fall_start'] = datetime.datetime.fromtimestamp(event.start).strftime("%Y-%m-%d %H:%M:%S")
+            payload['track_id'] = event.track_id
+        if self.writer:
+            self.writer.log_fall(payload)
+            return
+        self.history_ref.push().set(payload)
         print("[ALERT] Fall logged to Firebase.")
+
+    def close(self):
+        """Flushes queued writes and stops the background writer."""
+        stopped = True
+        if self.writer:
+            stopped = self.writer.stop(flush=True)
+            self.writer = None
+        # A writer still mid-update keeps using the store, the process exit closes it then
+        if self.store and stopped:
+            self.store.close()
+            self.store = None
     
-    def get_motion_state(self):
+    def get_motion_state(self, path=MOTION_PATH):
         """
         Reads the current motion state from Firebase.
         Returns: int (0 or 1) or None if error
-        ESP32 publishes to /hospital_system/wards/ward_A/room_301/motion path
+        ESP32 publishes to /hospital_system/wards/ward_A/room_301/motion path (one path per room)
         """
         try:
-            motion_path = "/hospital_system/wards/ward_A/room_301/motion"
-            motion_ref = db.reference(motion_path)
-            data = motion_ref.get()
-            
-            # Handle both dictionary and direct value formats
-            if data is None:
-                return 0  # Default to no motion if data not found
-            elif isinstance(data, dict):
-                # Data is a dictionary like {'motion': 0}
-                if 'val' in data:
-                    return int(data['val'])
-                return 0
-            else:
-                # Data is a direct value
-                return int(data)
+            motion_ref = self.db.reference(path)
+            return parse_motion(motion_ref.get())
         except Exception as e:
             print(f"[ERROR] Failed to read motion state: {e}")
             return None
 
+    def subscribe_motion(self, poll_interval=0.5, path=MOTION_PATH):
+        """Returns a MotionSubscription that keeps the motion flag up to date in the background."""
+        return MotionSubscription(self.db.reference(path), poll_interval)
+
+def parse_motion(data):
+    """Turns the value stored at the motion path into 0 or 1."""
+    # Handle both dictionary and direct value formats
+    if data is None:
+        return 0  # Default to no motion if data not found
+    elif isinstance(data, dict):
+        # Data is a dictionary like {'val': 0}
+        if 'val' in data:
+            return int(data['val'])
+        return 0
+    else:
+        # Data is a direct value
+        return int(data)
+
+class MotionSubscription:
+    """Caches the motion flag pushed by a db.reference().listen() stream and wakes waiters on change.
+    References without listen() (or whose stream fails to open) are polled from a background thread."""
+    def __init__(self, ref, poll_interval=0.5):
+        self.ref = ref
+        self.poll_interval = poll_interval
+        self.value = None  # None until the first event arrives
+        self.snapshot = None
+        self.cond = threading.Condition()
+        self.registration = None
+        self.started = True
+
+        try:
+            self.registration = ref.listen(self._on_event)
+        except Exception as e:
+            print(f"[WARNING] Motion stream unavailable ({e}), polling every {poll_interval}s")
+            self.thread = threading.Thread(target=self._poll, args=())
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _on_event(self, event):
+        """Applies a put/patch event at event.path to the local snapshot."""
+        parts = [p for p in event.path.split("/") if p]
+        with self.cond:
+            if not parts:
+                if event.event_type == "patch" and isinstance(self.snapshot, dict):
+                    self.snapshot.update(event.data or {})
+                else:
+                    self.snapshot = event.data
+            else:
+                if not isinstance(self.snapshot, dict):
+                    self.snapshot = {}
+                node = self.snapshot
+                for part in parts[:-1]:
+                    node = node.setdefault(part, {})
+                if event.event_type == "patch" and isinstance(node.get(parts[-1]), dict):
+                    node[parts[-1]].update(event.data or {})
+                elif event.data is None:
+                    node.pop(parts[-1], None)
+                else:
+                    node[parts[-1]] = event.data
+            self._set(parse_motion(self.snapshot))
+
+    def _poll(self):
+        while self.started:
+            try:
+                data = self.ref.get()
+                with self.cond:
+                    self._set(parse_motion(data))
+            except Exception as e:
+                print(f"[ERROR] Failed to read motion state: {e}")
+            time.sleep(self.poll_interval)
+
+    def _set(self, value):
+        # Caller holds self.cond
+        if value != self.value:
+            self.value = value
+            self.cond.notify_all()
+
+    def get(self):
+        """Latest motion flag (0 or 1), or None if nothing has arrived yet. Never blocks."""
+        return self.value
+
+    def wait_for(self, value, timeout=None):
+        """Blocks until the motion flag equals value. Returns False on timeout."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.value == value or not self.started, timeout) and self.started
+
+    def close(self):
+        with self.cond:
+            self.started = False
+            self.cond.notify_all()
+        if self.registration is not None:
+            self.registration.close()
+            self.registration = None
+
 if __name__ == "__main__":
     # TEST SECTION
     # This demonstrates how to use the classes together
@@ -0,0 +1,310 @@
+import json
+import os
+import threading
+import time
+
+from BatchInference import BatchDetectionEngine, EngineDetector
+from CapturePacing import Backoff
+from EventRecorder import EventRecorder
+from EventStore import EventStore
+from FallEvents import FallEventDetector
+from FireBaseConnect import MOTION_PATH, FirebaseHandler
+from Metrics import METRICS
+from MotionGate import MotionGate
+from RoiDetection import RoiDetector
+from SparseDetection import IntervalDetector
+from Tracker import MultiPersonTracker
+from StateMachine import MonitorStateMachine, STATE_ACTIVE
+from VideoFromBoard import ThreadedSnapshotCamera
+from src import FallAnalyzer, PersonDetector
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Per-room settings used when neither the room nor the config's "defaults" set them
+ROOM_DEFAULTS = {
+    "device": None,  # Firebase device name, defaults to the room id
+    "motion_path": MOTION_PATH,
+    "camera_mode": "stream",  # "stream" (port 81 /stream) or "snapshot" (/capture)
+    "frame_size": None,  # None = board's own resolution
+    "detect_every": 5,
+    "motion_gate": True,
+    "roi": False,
+    "roi_full_every": 10,
+    "zones": {},
+    "always_on": False,  # Ignore the PIR flag and keep the camera on (rooms without a motion sensor)
+    "camera_warmup": 0.0,  # Pause after starting the camera (frames are waited for anyway)
+    "log_fall_history": True,
+}
+
+def load_config(path):
+    """Reads the fleet JSON. Relative file paths are taken relative to the config file."""
+    with open(path) as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for section, key in (("firebase", "cert_path"), ("model", "prototxt"), ("model", "model"),
+                         ("recording", "dir"), ("store", "path")):
+        value = config.get(section, {}).get(key)
+        if value and not os.path.isabs(value):
+            config[section][key] = os.path.join(base, value)
+
+    rooms = {}
+    devices = {}  # device -> room_id; the device id is also the room's detector engine slot
+    for room in config.get("rooms", []):
+        settings = dict(ROOM_DEFAULTS, **config.get("defaults", {}))
+        settings.update(room)
+        settings["room_id"] = str(settings["room_id"])
+        settings["device"] = str(settings["device"] or settings["room_id"])
+        if settings["room_id"] in rooms:
+            raise ValueError(f"Duplicate room_id {settings['room_id']}")
+        if settings["device"] in devices:
+            raise ValueError(f"Duplicate device {settings['device']} (rooms {devices[settings['device']]} "
+                             f"and {settings['room_id']})")
+        devices[settings["device"]] = settings["room_id"]
+        rooms[settings["room_id"]] = settings
+    config["rooms"] = rooms
+    return config
+
+def camera_url(settings):
+    """camera: {"url": full URL} or {"ip": host, "port": 80, "stream_port": 81}; ports default
+    to the ESP32 firmware's (MjpegStream's test server serves both on its one --port)."""
+    camera = settings["camera"]
+    if "url" in camera:
+        return camera["url"]
+    if settings["camera_mode"] == "stream":
+        return f"http://{camera['ip']}:{camera.get('stream_port', 81)}/stream"
+    return f"http://{camera['ip']}:{camera.get('port', 80)}/capture"
+
+# ==========================================
+# CLASS: Room Pipeline (one room, own thread)
+# ==========================================
+class RoomPipeline:
+    """StateMachine.MonitorStateMachine for one room, headless, on its own thread, using the
+    fleet's shared detector engine, Firebase connection and clip recorder."""
+    def __init__(self, settings, engine, fb=None, recorder=None):
+        self.settings = settings
+        self.room_id = settings["room_id"]
+        self.device = settings["device"]
+        self.fb = fb
+        self.recorder = recorder
+
+        tracker = MultiPersonTracker(FallAnalyzer(smoothing_alpha=0.4), events=FallEventDetector())
+        detector = EngineDetector(engine, self.device)
+        if settings["roi"]:
+            detector = RoiDetector(detector, tracker=tracker, zones=settings["zones"],
+                                   full_every=settings["roi_full_every"])
+        interval_detector = IntervalDetector(detector, detect_every=settings["detect_every"],
+                                             gate=MotionGate() if settings["motion_gate"] else None)
+
+        self.motion = None
+        if fb and not settings["always_on"]:
+            self.motion = fb.subscribe_motion(path=settings["motion_path"])
+        self.machine = MonitorStateMachine(interval_detector, tracker, self._open_camera, motion=self.motion, fb=fb,
+                                           recorder=recorder, camera_id=self.device, room_id=self.room_id,
+                                           log_fall_history=settings["log_fall_history"],
+                                           always_on=settings["always_on"], camera_warmup=settings["camera_warmup"],
+                                           on_frame=self._count_frame)
+        self.error = None
+
+    def start(self):
+        print(f"[INFO] Room {self.room_id} started ({camera_url(self.settings)})")
+        self.thread = threading.Thread(target=self._run, args=(), name=f"room-{self.room_id}")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def alive(self):
+        return self.thread.is_alive()
+
+    def stop(self):
+        self.machine.stop()
+        if hasattr(self, 'thread') and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5.0)
+        self.machine.close()
+        if self.motion:
+            self.motion.close()
+            self.motion = None
+
+    def _open_camera(self):
+        return ThreadedSnapshotCamera(camera_url(self.settings), mode=self.settings["camera_mode"],
+                                      frame_size=self.settings["frame_size"], recorder=self.recorder,
+                                      camera_id=self.device)
+
+    def _count_frame(self, frame, tracks, state):
+        METRICS.frame(f"room_{self.room_id}")
+
+    def _run(self):
+        try:
+            self.machine.run()
+        except Exception as e:
+            # Left to the FleetRunner supervisor, which restarts the room with backoff
+            self.error = e
+            print(f"[ERROR] Room {self.room_id} pipeline failed: {e}")
+
+# ==========================================
+# CLASS: Fleet Runner (all rooms, one process)
+# ==========================================
+class FleetRunner:
+    """Runs every room of a fleet config in one process: one PersonDetector behind a
+    BatchDetectionEngine (frames of all rooms share its forward passes), one Firebase
+    connection with one background writer, one clip recorder.
+
+    Rooms are supervised (restarted with backoff if their thread dies) and the config file
+    is watched: added rooms start, removed rooms stop, changed rooms restart. Changes to the
+    firebase / store / model / recording sections need a process restart."""
+    def __init__(self, config_path, reload_interval=2.0):
+        self.config_path = config_path
+        self.reload_interval = reload_interval
+        self.config = load_config(config_path)
+        self.mtime = os.path.getmtime(config_path)
+        self.rooms = {}
+        self.backoffs = {}
+        self.restart_at = {}
+        self.running = False
+
+    def start(self):
+        config = self.config
+        fb_config = config.get("firebase")
+        self.fb = None
+        if fb_config:
+            store = None
+            try:
+                store_path = config.get("store", {}).get("path")
+                store = EventStore(store_path) if store_path else None
+                self.fb = FirebaseHandler(fb_config["cert_path"], fb_config["db_url"],
+                                          root_node=fb_config.get("root_node", "sensor_data"), async_writes=True,
+                                          store=store)
+                print("[INFO] Firebase connected successfully")
+            except Exception as e:
+                print(f"[ERROR] Firebase Connection Failed: {e}")
+                print("[WARNING] Continuing without Firebase integration (rooms without always_on stay idle)")
+                if store:
+                    store.close()
+
+        model = config.get("model", {})
+        detector = PersonDetector(model.get("prototxt", os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.prototxt")),
+                                  model.get("model", os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.caffemodel")),
+                                  confidence_threshold=model.get("confidence", 0.5),
+                                  backend=model.get("backend", "auto"), quantize=model.get("quantize", False))
+        self.engine = BatchDetectionEngine(detector, batch_size=model.get("batch_size", 8),
+                                           max_wait=model.get("max_wait", 0.02)).start()
+
+        recording = config.get("recording", {})
+        self.recorder = None
+        if recording.get("enabled", False):
+            self.recorder = EventRecorder(recording.get("dir", os.path.join(BASE_DIR, "fall_clips")),
+                                          pre_seconds=recording.get("pre_seconds", 5.0),
+                                          post_seconds=recording.get("post_seconds", 5.0),
+                                          max_disk_mb=recording.get("max_disk_mb", 500)).start()
+
+        metrics = config.get("metrics", {})
+        if metrics.get("enabled", False):
+            METRICS.enable(port=metrics.get("port"), log_interval=metrics.get("log_interval"))
+            METRICS.gauge("rooms_active", lambda: sum(1 for r in self.rooms.values() if r.machine.state == STATE_ACTIVE))
+            METRICS.gauge("firebase_queue_depth", lambda: self.fb.writer.queue_depth() if self.fb and self.fb.writer else 0)
+
+        self.running = True
+        for room_id in self.config["rooms"]:
+            self._start_room(room_id)
+        return self
+
+    def run(self):
+        """Supervises rooms and watches the config until Ctrl+C."""
+        self.start()
+        next_check = time.time() + self.reload_interval
+        try:
+            while self.running:
+                time.sleep(0.5)
+                self._supervise()
+                if time.time() >= next_check:
+                    next_check = time.time() + self.reload_interval
+                    self._check_reload()
+        except KeyboardInterrupt:
+            print("\n[INFO] Keyboard interrupt received. Shutting down...")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        for room_id in list(self.rooms):
+            self._stop_room(room_id)
+        self.engine.stop()
+        if self.recorder:
+            self.recorder.stop()
+        if self.fb:
+            self.fb.close()
+        print("[INFO] Fleet shutdown complete")
+
+    def _start_room(self, room_id):
+        settings = self.config["rooms"][room_id]
+        try:
+            self.rooms[room_id] = RoomPipeline(settings, self.engine, self.fb, self.recorder).start()
+        except Exception as e:
+            print(f"[ERROR] Room {room_id} could not start: {e}")
+            self._schedule_restart(room_id)
+
+    def _stop_room(self, room_id):
+        room = self.rooms.pop(room_id, None)
+        self.restart_at.pop(room_id, None)
+        if room is not None:
+            room.stop()
+            print(f"[INFO] Room {room_id} stopped")
+
+    def _schedule_restart(self, room_id):
+        backoff = self.backoffs.setdefault(room_id, Backoff(base=1.0, cap=60.0))
+        delay = backoff.next_delay()
+        self.restart_at[room_id] = time.time() + delay
+        print(f"[WARNING] Room {room_id} restarting in {delay:.1f}s")
+
+    def _supervise(self):
+        now = time.time()
+        for room_id in list(self.config["rooms"]):
+            room = self.rooms.get(room_id)
+            if room is not None and room.alive():
+                if room.machine.state == STATE_ACTIVE and room_id in self.backoffs:
+                    self.backoffs[room_id].reset()  # Healthy again
+                continue
+            if room_id not in self.restart_at:
+                if room is not None:
+                    room.stop()
+                    self.rooms.pop(room_id, None)
+                self._schedule_restart(room_id)
+            elif now >= self.restart_at[room_id]:
+                del self.restart_at[room_id]
+                self._start_room(room_id)
+
+    def _check_reload(self):
+        try:
+            mtime = os.path.getmtime(self.config_path)
+            if mtime == self.mtime:
+                return
+            config = load_config(self.config_path)
+        except (OSError, ValueError, KeyError) as e:
+            # Keep running the old config while the file is mid-edit or broken
+            print(f"[WARNING] Config not reloaded: {e}")
+            return
+        self.mtime = mtime
+
+        for section in ("firebase", "store", "model", "recording", "metrics"):
+            if config.get(section) != self.config.get(section):
+                print(f"[WARNING] '{section}' changed, restart the fleet to apply it")
+
+        old_rooms, new_rooms = self.config["rooms"], config["rooms"]
+        self.config = config
+        for room_id in old_rooms.keys() - new_rooms.keys():
+            self._stop_room(room_id)
+        for room_id in new_rooms:
+            if room_id not in old_rooms:
+                print(f"[INFO] Config reload: room {room_id} added")
+                self._start_room(room_id)
+            elif new_rooms[room_id] != old_rooms[room_id]:
+                print(f"[INFO] Config reload: room {room_id} changed, restarting")
+                self._stop_room(room_id)
+                self._start_room(room_id)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run every room of a fleet config in one process")
+    parser.add_argument("config", nargs="?", default=os.path.join(BASE_DIR, "fleet.json"))
+    args = parser.parse_args()
+
+    FleetRunner(args.config).run()
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+
+# imdecode flags by downscale factor: JPEG is decoded straight at 1/2, 1/4 or 1/8 size
+REDUCED_FLAGS = {
+    True: {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+           4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8},
+    False: {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8},
+}
+
+# ==========================================
+# CLASS: JPEG Frame Decoder
+# ==========================================
+class JpegFrameDecoder:
+    """Decodes camera JPEGs into a preallocated ring of frame buffers.
+
+    The JPEG bytes are wrapped with np.frombuffer (no copy), decoded with the largest
+    IMREAD_REDUCED_* factor that still covers target_size, and resized into the next ring
+    slot. Slots are handed out by reference: a frame stays valid until ring_size more
+    frames have been decoded.
+
+    target_size=None keeps the camera's own resolution (no resize at all)."""
+    def __init__(self, target_size=(400, 300), grayscale=True, ring_size=4):
+        self.target_size = target_size  # (width, height), same order as cv2.resize
+        self.native = target_size is None
+        self.grayscale = grayscale
+        self.flags = REDUCED_FLAGS[grayscale]
+        self.factor = 1
+        self.source_size = None  # Learned from the first frame, the camera resolution is fixed
+        self.ring_size = ring_size
+        self.ring = []
+        if not self.native:
+            self._allocate(target_size)
+        self.seq = 0
+
+    def _allocate(self, size):
+        (w, h) = size
+        shape = (h, w) if self.grayscale else (h, w, 3)
+        self.ring = [np.empty(shape, dtype=np.uint8) for _ in range(self.ring_size)]
+
+    def decode(self, jpeg_bytes):
+        """Returns (seq, frame) or (None, None) if the JPEG is corrupt."""
+        buf = np.frombuffer(jpeg_bytes, dtype=np.uint8)
+        img = cv2.imdecode(buf, self.flags[self.factor])
+        if img is None:
+            return None, None
+
+        (h, w) = img.shape[:2]
+        expected = None if self.source_size is None else (
+            self.source_size[0] // self.factor, self.source_size[1] // self.factor)
+        if expected is None or abs(expected[0] - w) > 1 or abs(expected[1] - h) > 1:
+            # First frame, or the board changed resolution: pick a new reduction factor
+            self.source_size = (w * self.factor, h * self.factor)
+            if self.native:
+                # Native size never reduces (factor stays 1), so img is already full size
+                self.target_size = self.source_size
+                self._allocate(self.target_size)
+            self.factor = self._pick_factor(self.source_size)
+
+        slot = self.ring[self.seq % len(self.ring)]
+        if (w, h) == self.target_size:
+            np.copyto(slot, img)
+        else:
+            cv2.resize(img, self.target_size, dst=slot)
+        self.seq += 1
+        return self.seq, slot
+
+    def _pick_factor(self, source_size):
+        (src_w, src_h) = source_size
+        (dst_w, dst_h) = self.target_size
+        for factor in (8, 4, 2):
+            if src_w // factor >= dst_w and src_h // factor >= dst_h:
+                return factor
+        return 1
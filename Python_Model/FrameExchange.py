@@ -0,0 +1,94 @@
+import threading
+import time
+
+# ==========================================
+# CLASS: Frame Ring (capture -> inference hand-off)
+# ==========================================
+class FrameRing:
+    """Bounded ring of the newest frames from one capture thread, each with a monotonic
+    frame ID and capture timestamp. The consumer asks for "a frame newer than the last one
+    I saw", so no inference cycle is spent on a frame it has already processed.
+
+    Counters (single consumer):
+      published  - frames put in by the capture thread
+      consumed   - frames handed to the consumer
+      dropped    - frames overwritten before the consumer got to them
+      duplicates - non-blocking reads that returned an already-seen frame"""
+    def __init__(self, size=4):
+        self.size = size
+        self.slots = [None] * size  # (frame_id, timestamp, frame)
+        self.latest_id = 0
+        self.last_consumed_id = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+        self.published = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.duplicates = 0
+
+    def publish(self, frame, timestamp=None):
+        """Called by the capture thread. Never blocks. Returns the new frame ID."""
+        if timestamp is None:
+            timestamp = time.time()
+        with self.cond:
+            self.latest_id += 1
+            self.slots[self.latest_id % self.size] = (self.latest_id, timestamp, frame)
+            self.published += 1
+            self.cond.notify_all()
+            return self.latest_id
+
+    def wait_newer(self, after_id, timeout=None):
+        """Blocks until a frame newer than after_id exists. Returns (frame_id, timestamp, frame),
+        or None on timeout / after close()."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.latest_id > after_id or self.closed, timeout):
+                return None
+            if self.latest_id <= after_id:
+                return None
+            return self._take()
+
+    def read_latest(self):
+        """Non-blocking: newest entry or None. Re-reading an already consumed frame counts as a duplicate."""
+        with self.cond:
+            if self.latest_id == 0:
+                return None
+            if self.latest_id == self.last_consumed_id:
+                self.duplicates += 1
+                return self.slots[self.latest_id % self.size]
+            return self._take()
+
+    def _take(self):
+        # Caller holds self.cond
+        entry = self.slots[self.latest_id % self.size]
+        self.dropped += max(self.latest_id - self.last_consumed_id - 1, 0)
+        self.last_consumed_id = self.latest_id
+        self.consumed += 1
+        self.cond.notify_all()  # Wakes a producer in wait_consumed()
+        return entry
+
+    def wait_consumed(self, timeout=None):
+        """Blocks until the consumer has taken the newest frame (or close()). Lets a producer
+        that can choose when to capture avoid producing frames nobody will read."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.latest_id == self.last_consumed_id or self.closed, timeout)
+
+    def close(self):
+        """Marks the end of the stream and wakes any waiting consumer."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def reopen(self):
+        with self.cond:
+            self.closed = False
+
+    def stats(self):
+        with self.cond:
+            return {
+                'published': self.published,
+                'consumed': self.consumed,
+                'dropped': self.dropped,
+                'duplicates': self.duplicates,
+                'latest_id': self.latest_id,
+            }
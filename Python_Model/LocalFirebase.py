@@ -0,0 +1,145 @@
+import copy
+import itertools
+import queue
+import threading
+import time
+
+# ==========================================
+# CLASS: Local Database (stand-in for firebase_admin.db)
+# ==========================================
+class LocalDatabase:
+    """In-memory stand-in for the firebase_admin.db module.
+    Pass it as FirebaseHandler(database=...) to run or test without a Firebase project."""
+    def __init__(self, latency=0.0):
+        self.data = {}
+        self.lock = threading.RLock()
+        self.latency = latency  # Simulated round-trip per call, in seconds
+        self.calls = []  # (method, path) of every network-like call, for inspection
+        self._push_ids = itertools.count()
+        self.listeners = []
+
+    def reference(self, path="/"):
+        return LocalReference(self, path)
+
+    def _call(self, method, path):
+        self.calls.append((method, path))
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, parts):
+        node = self.data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return copy.deepcopy(node)
+
+    def _set(self, parts, value):
+        if not parts:
+            self.data = copy.deepcopy(value) if isinstance(value, dict) else {}
+            return
+        node = self.data
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+    def _notify(self, parts):
+        """Sends the new value to every listener whose path overlaps the written path."""
+        for listener in list(self.listeners):
+            n = min(len(parts), len(listener.parts))
+            if parts[:n] == listener.parts[:n]:
+                listener.events.put(LocalEvent("put", "/", self._get(listener.parts)))
+
+def _split(path):
+    return [p for p in path.split("/") if p]
+
+# ==========================================
+# CLASS: Local Reference (stand-in for db.Reference)
+# ==========================================
+class LocalReference:
+    """Implements the subset of firebase_admin.db.Reference used in this project."""
+    def __init__(self, database, path):
+        self.database = database
+        self.parts = _split(path)
+        self.path = "/" + "/".join(self.parts)
+        self.key = self.parts[-1] if self.parts else None
+
+    def child(self, path):
+        return LocalReference(self.database, self.path + "/" + path)
+
+    def get(self):
+        with self.database.lock:
+            self.database._call("get", self.path)
+            return self.database._get(self.parts)
+
+    def set(self, value):
+        with self.database.lock:
+            self.database._call("set", self.path)
+            self.database._set(self.parts, value)
+            self.database._notify(self.parts)
+
+    def update(self, value):
+        """Multi-path update: keys may contain '/' to write deep children in one call."""
+        with self.database.lock:
+            self.database._call("update", self.path)
+            for key, child_value in value.items():
+                self.database._set(self.parts + _split(key), child_value)
+            self.database._notify(self.parts)
+
+    def push(self, value=None):
+        key = "-L%012d" % next(self.database._push_ids)
+        ref = self.child(key)
+        if value is not None:
+            ref.set(value)
+        return ref
+
+    def listen(self, callback):
+        """Same contract as db.Reference.listen(): callback(event) runs on a background thread,
+        first with the current value, then after every write that touches this path."""
+        with self.database.lock:
+            listener = LocalListener(self.database, self.parts, callback)
+            listener.events.put(LocalEvent("put", "/", self.database._get(self.parts)))
+            self.database.listeners.append(listener)
+        return listener
+
+# ==========================================
+# CLASS: Local Event / Listener (stand-ins for db.Event / ListenerRegistration)
+# ==========================================
+class LocalEvent:
+    """Mirrors firebase_admin.db.Event."""
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+class LocalListener:
+    """Delivers LocalEvents to one callback from its own thread."""
+    def __init__(self, database, parts, callback):
+        self.database = database
+        self.parts = parts
+        self.callback = callback
+        self.events = queue.Queue()
+        self.thread = threading.Thread(target=self._run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            try:
+                self.callback(event)
+            except Exception as e:
+                print(f"[ERROR] Listener callback: {e}")
+
+    def close(self):
+        with self.database.lock:
+            if self in self.database.listeners:
+                self.database.listeners.remove(self)
+        self.events.put(None)
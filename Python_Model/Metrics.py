@@ -0,0 +1,255 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets: 50us .. ~50s, each 25% wider than the last
+BUCKET_BOUNDS = [0.00005 * 1.25 ** i for i in range(63)]
+
+# ==========================================
+# CLASS: Histogram (fixed buckets, O(1) record)
+# ==========================================
+class Histogram:
+    """Latency histogram with fixed log-spaced buckets. Quantiles are approximate
+    (upper bound of the bucket they fall in, so within 25%)."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        idx = bisect.bisect_left(BUCKET_BOUNDS, seconds)
+        with self.lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.count, self.sum
+
+    @staticmethod
+    def quantile(counts, q):
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        target = q * total
+        running = 0
+        for idx, c in enumerate(counts):
+            running += c
+            if running >= target:
+                return BUCKET_BOUNDS[min(idx, len(BUCKET_BOUNDS) - 1)]
+        return BUCKET_BOUNDS[-1]
+
+# ==========================================
+# CLASS: Stage Timer
+# ==========================================
+class _StageTimer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    """Returned by Metrics.stage() when metrics are off: enter/exit do nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+# ==========================================
+# CLASS: Metrics Registry
+# ==========================================
+class Metrics:
+    """Per-stage latency histograms, counters, FPS and gauges for the detection pipeline.
+
+    Usage on the hot path:
+        with METRICS.stage("forward"):
+            detections = net.forward()
+    When disabled, stage() returns a shared no-op object and frame()/observe() return at once."""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}  # name -> callable, evaluated only when metrics are read
+        self.fps = {}  # name -> (last tick time, smoothed fps)
+        self.lock = threading.Lock()
+        self.server = None
+        self.logger = None
+        self._last_logged = {}
+
+    def enable(self, port=None, log_interval=None, host="127.0.0.1"):
+        """Turns recording on, optionally with a /metrics HTTP endpoint and a periodic log line."""
+        self.enabled = True
+        if port is not None and self.server is None:
+            self.server = _MetricsServer(self, host, port).start()
+        if log_interval and self.logger is None:
+            self.logger = threading.Thread(target=self._log_loop, args=(log_interval,))
+            self.logger.daemon = True
+            self.logger.start()
+        return self
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return _StageTimer(self._histogram(name))
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            self._histogram(name).record(seconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def frame(self, name="frames"):
+        """Counts one processed frame and updates the smoothed FPS for `name`."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            last, fps = self.fps.get(name, (None, 0.0))
+            if last is not None and now > last:
+                instant = 1.0 / (now - last)
+                fps = instant if fps == 0.0 else 0.9 * fps + 0.1 * instant
+            self.fps[name] = (now, fps)
+
+    def gauge(self, name, fn):
+        """Registers a callable (e.g. a queue length) read only when metrics are scraped or logged."""
+        with self.lock:
+            self.gauges[name] = fn
+
+    def _histogram(self, name):
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault(name, Histogram())
+        return hist
+
+    def _gauge_values(self):
+        values = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                values[name] = float(fn())
+            except Exception:
+                continue
+        return values
+
+    def render_prometheus(self):
+        lines = ["# TYPE fall_stage_seconds summary"]
+        for name, hist in sorted(self.histograms.items()):
+            counts, count, total = hist.snapshot()
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'fall_stage_seconds{{stage="{name}",quantile="{q}"}} {Histogram.quantile(counts, q):.6f}')
+            lines.append(f'fall_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'fall_stage_seconds_count{{stage="{name}"}} {count}')
+
+        with self.lock:
+            counters = dict(self.counters)
+            fps = {name: value for name, (_, value) in self.fps.items()}
+        lines.append("# TYPE fall_events_total counter")
+        for name, value in sorted(counters.items()):
+            lines.append(f'fall_events_total{{name="{name}"}} {value}')
+        lines.append("# TYPE fall_fps gauge")
+        for name, value in sorted(fps.items()):
+            lines.append(f'fall_fps{{loop="{name}"}} {value:.2f}')
+        lines.append("# TYPE fall_gauge gauge")
+        for name, value in sorted(self._gauge_values().items()):
+            lines.append(f'fall_gauge{{name="{name}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def stage_stats(self):
+        """{stage: {count, mean, p50, p95, p99}} in seconds, over everything recorded so far."""
+        stats = {}
+        for name, hist in sorted(self.histograms.items()):
+            counts, count, total = hist.snapshot()
+            if count == 0:
+                continue
+            stats[name] = {
+                'count': count,
+                'mean': total / count,
+                'p50': Histogram.quantile(counts, 0.5),
+                'p95': Histogram.quantile(counts, 0.95),
+                'p99': Histogram.quantile(counts, 0.99),
+            }
+        return stats
+
+    def reset(self):
+        """Clears recorded values (gauges stay registered)."""
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.fps = {}
+            self._last_logged = {}
+
+    def summary_line(self):
+        """One log line with p50/p95/p99 per stage since the previous summary_line() call."""
+        parts = []
+        for name, hist in sorted(self.histograms.items()):
+            counts, _, _ = hist.snapshot()
+            previous = self._last_logged.get(name, [0] * len(counts))
+            window = [c - p for c, p in zip(counts, previous)]
+            self._last_logged[name] = counts
+            if sum(window) == 0:
+                continue
+            p50, p95, p99 = (Histogram.quantile(window, q) * 1000 for q in (0.5, 0.95, 0.99))
+            parts.append(f"{name}={p50:.1f}/{p95:.1f}/{p99:.1f}ms")
+        with self.lock:
+            parts += [f"fps[{name}]={value:.1f}" for name, (_, value) in sorted(self.fps.items())]
+        parts += [f"{name}={value:g}" for name, value in sorted(self._gauge_values().items())]
+        return "[METRICS] " + " ".join(parts)
+
+    def _log_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            print(self.summary_line())
+
+# ==========================================
+# CLASS: Metrics HTTP Server (Prometheus text format)
+# ==========================================
+class _MetricsServer:
+    def __init__(self, metrics, host, port):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if not self.path.startswith("/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        print(f"[INFO] Metrics at http://{host}:{port}/metrics")
+        return self
+
+# Process-wide registry, off until METRICS.enable() is called
+METRICS = Metrics(enabled=False)
@@ -0,0 +1,227 @@
+import argparse
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+SOI = b"\xff\xd8"  # JPEG start-of-image marker
+EOI = b"\xff\xd9"  # JPEG end-of-image marker
+BOUNDARY = "123456789000000000000987654321"  # Same boundary as the ESP32 firmware
+
+# ==========================================
+# CLASS: Incremental MJPEG Parser
+# ==========================================
+class MjpegParser:
+    """Splits a multipart/x-mixed-replace byte stream into JPEG frames as chunks arrive.
+    Uses the part's Content-Length when present, otherwise scans for the SOI/EOI markers."""
+    def __init__(self, max_buffer=4 * 1024 * 1024):
+        self.buffer = bytearray()  # Reused for the whole connection
+        self.max_buffer = max_buffer
+        self.frames = 0
+        self.resyncs = 0
+
+    def feed(self, chunk):
+        """Adds bytes from the socket. Returns the list of complete JPEGs (as bytes)."""
+        self.buffer += chunk
+        frames = []
+        while True:
+            jpeg = self._next_frame()
+            if jpeg is None:
+                break
+            frames.append(jpeg)
+
+        # A broken stream without markers must not grow the buffer forever
+        if len(self.buffer) > self.max_buffer:
+            self.resyncs += 1
+            del self.buffer[:-2]
+        return frames
+
+    def _next_frame(self):
+        buf = self.buffer
+        start = buf.find(SOI)
+        if start < 0:
+            return None
+
+        # Headers of this part sit between the previous boundary and the SOI
+        length = None
+        header_end = buf.rfind(b"\r\n\r\n", 0, start + 1)
+        if header_end >= 0 and start - header_end <= 4:
+            header_start = buf.rfind(b"--", 0, header_end)
+            match = re.search(rb"(?i)content-length:\s*(\d+)", bytes(buf[max(header_start, 0):header_end]))
+            if match:
+                length = int(match.group(1))
+
+        if length is not None:
+            end = start + length
+            if len(buf) < end:
+                return None
+            if buf[end - 2:end] != EOI:
+                # Length did not line up with the image, fall back to the marker scan
+                length = None
+
+        if length is None:
+            end = buf.find(EOI, start + 2)
+            if end < 0:
+                return None
+            end += 2
+
+        jpeg = bytes(buf[start:end])
+        del buf[:end]
+        self.frames += 1
+        return jpeg
+
+# ==========================================
+# CLASS: MJPEG Stream Reader (HTTP client)
+# ==========================================
+class MjpegStreamReader:
+    """Holds one long-lived GET on an MJPEG URL and yields JPEG frames from it."""
+    def __init__(self, session, url, timeout=3.0, chunk_size=16 * 1024):
+        self.session = session
+        self.url = url
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.response = None
+
+    def frames(self):
+        """Generator of JPEG bytes. Raises on connection errors so the caller can reconnect."""
+        self.response = self.session.get(self.url, stream=True, timeout=self.timeout)
+        if self.response.status_code != 200:
+            raise IOError(f"Stream returned HTTP {self.response.status_code}")
+
+        parser = MjpegParser()
+        for chunk in self.response.iter_content(chunk_size=self.chunk_size):
+            if not chunk:
+                continue
+            for jpeg in parser.feed(chunk):
+                yield jpeg
+        raise IOError("Stream closed by the camera")
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+# ==========================================
+# CLASS: Local MJPEG Test Server (ESP32 stand-in)
+# ==========================================
+class MjpegTestServer:
+    """Serves a video file the way the ESP32 does: /stream (MJPEG) and /capture (one JPEG).
+    The clip loops forever at `fps`, so ThreadedSnapshotCamera can be tested without a board."""
+    def __init__(self, video_path, host="127.0.0.1", port=8081, fps=20, size=(320, 240), quality=80):
+        self.video_path = video_path
+        self.fps = fps
+        self.size = size  # QVGA, same as the firmware's FRAMESIZE_QVGA
+        self.quality = quality
+        self.latest = None
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.started = False
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/stream"):
+                    server._serve_stream(self)
+                elif self.path.startswith("/capture"):
+                    server._serve_capture(self)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+
+    def start(self):
+        if self.started:
+            return self
+        self.started = True
+        self.producer = threading.Thread(target=self._produce, args=())
+        self.producer.daemon = True
+        self.producer.start()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"[INFO] Test camera serving {os.path.basename(self.video_path)} at {self.url}/stream")
+        return self
+
+    def stop(self):
+        self.started = False
+        with self.cond:
+            self.cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _produce(self):
+        cap = cv2.VideoCapture(self.video_path)
+        while self.started:
+            ret, frame = cap.read()
+            if not ret:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            frame = cv2.resize(frame, self.size)
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                with self.cond:
+                    self.latest = jpeg.tobytes()
+                    self.seq += 1
+                    self.cond.notify_all()
+            time.sleep(1.0 / self.fps)
+        cap.release()
+
+    def _wait_frame(self, after_seq):
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > after_seq or not self.started, 2.0)
+            return self.seq, self.latest
+
+    def _serve_capture(self, handler):
+        _, jpeg = self._wait_frame(0)
+        if jpeg is None:
+            handler.send_error(500)
+            return
+        handler.send_response(200)
+        handler.send_header("Content-Type", "image/jpeg")
+        handler.send_header("Content-Length", str(len(jpeg)))
+        handler.end_headers()
+        handler.wfile.write(jpeg)
+
+    def _serve_stream(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", f"multipart/x-mixed-replace;boundary={BOUNDARY}")
+        handler.end_headers()
+        seq = 0
+        try:
+            while self.started:
+                seq, jpeg = self._wait_frame(seq)
+                if jpeg is None:
+                    continue
+                handler.wfile.write(f"\r\n--{BOUNDARY}\r\n".encode())
+                handler.wfile.write(f"Content-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode())
+                handler.wfile.write(jpeg)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+if __name__ == "__main__":
+    # Run a fake ESP32 camera from one of the test clips:
+    #   python MjpegStream.py Video_Testing/SingleManWalk.mp4 --port 8081
+    # then in VideoFromBoard.py set ESP32_IP = "127.0.0.1" and HTTP_PORT = STREAM_PORT = 8081
+    # (this server has /capture and /stream on the same port).
+    parser = argparse.ArgumentParser(description="Serve a video clip as an ESP32-style MJPEG camera")
+    parser.add_argument("video", nargs="?", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "Video_Testing", "SingleManWalk.mp4"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--fps", type=float, default=20)
+    args = parser.parse_args()
+
+    server = MjpegTestServer(args.video, args.host, args.port, args.fps).start()
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        server.stop()
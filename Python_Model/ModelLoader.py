@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VIDEO_DIR = os.path.join(BASE_DIR, "Video_Testing")
+
+# name -> (backend, target) for net.setPreferableBackend / setPreferableTarget
+BACKENDS = {
+    "opencv": (cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU),
+    "opencl": (cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_OPENCL),
+    "openvino": (cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE, cv2.dnn.DNN_TARGET_CPU),
+    "cuda": (cv2.dnn.DNN_BACKEND_CUDA, cv2.dnn.DNN_TARGET_CUDA),
+}
+
+# Order tried by backend="auto". OpenCL is left out: on integrated GPUs it is often
+# slower than the CPU path for a net this small, so it has to be asked for by name.
+AUTO_ORDER = ("cuda", "openvino", "opencv")
+
+# MobileNetSSD preprocessing, same values as PersonDetector.detect
+INPUT_SIZE = (300, 300)
+INPUT_SCALE = 0.007843
+INPUT_MEAN = 127.5
+
+# Loaded + warmed nets, one set per thread: cv2.dnn nets are not thread-safe, so a net is only
+# shared by the PersonDetectors created on the same thread
+_cache = threading.local()
+
+# ==========================================
+# HELPER: Backend selection
+# ==========================================
+def backend_available(name):
+    """True if this OpenCV build has the backend compiled in and a usable target for it."""
+    backend, target = BACKENDS[name]
+    if name == "opencv":
+        return True
+    if name == "opencl" and not cv2.ocl.haveOpenCL():
+        return False
+    if name == "cuda" and (not hasattr(cv2, "cuda") or cv2.cuda.getCudaEnabledDeviceCount() == 0):
+        return False
+    try:
+        return target in cv2.dnn.getAvailableTargets(backend)
+    except cv2.error:
+        return False
+
+def pick_backend(preferred="auto"):
+    """Resolves "auto" (or an unavailable name) to the best backend on this host."""
+    if preferred != "auto":
+        if preferred in BACKENDS and backend_available(preferred):
+            return preferred
+        print(f"[WARNING] DNN backend '{preferred}' not available, picking automatically")
+    for name in AUTO_ORDER:
+        if backend_available(name):
+            return name
+    return "opencv"
+
+# ==========================================
+# HELPER: Load / quantize / warm up
+# ==========================================
+def read_net(model_path, prototxt_path=None):
+    """Reads a Caffe (.caffemodel + .prototxt) or ONNX export of the detector.
+    An ONNX export must keep the SSD DetectionOutput layout [1, 1, N, 7]."""
+    if model_path.endswith(".caffemodel"):
+        return cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+    if model_path.endswith(".onnx"):
+        return cv2.dnn.readNetFromONNX(model_path)
+    return cv2.dnn.readNet(model_path, prototxt_path or "")
+
+def calibration_blobs(count=16, video_dir=VIDEO_DIR, step=15):
+    """Input blobs sampled from the test clips, for int8 calibration."""
+    blobs = []
+    clips = sorted(f for f in os.listdir(video_dir) if f.endswith(".mp4")) if os.path.isdir(video_dir) else []
+    for clip in clips:
+        cap = cv2.VideoCapture(os.path.join(video_dir, clip))
+        index = 0
+        while len(blobs) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % step == 0:
+                blobs.append(cv2.dnn.blobFromImage(cv2.resize(frame, INPUT_SIZE), INPUT_SCALE, INPUT_SIZE, INPUT_MEAN))
+            index += 1
+        cap.release()
+    return blobs
+
+def quantize_net(net, blobs):
+    """int8 post-training quantization with OpenCV's own Net.quantize (OpenCV 4.5.4 - 4.x).
+    Inputs and outputs stay fp32, so the caller does not change. Returns None if unsupported."""
+    if not hasattr(net, "quantize"):
+        print("[WARNING] This OpenCV build cannot quantize nets, using fp32")
+        return None
+    if not blobs:
+        print("[WARNING] No calibration frames found, using fp32")
+        return None
+    try:
+        return net.quantize(blobs, cv2.CV_32F, cv2.CV_32F)
+    except cv2.error as e:
+        print(f"[WARNING] int8 quantization failed ({e}), using fp32")
+        return None
+
+def warm_up(net, runs=2, batch_size=1):
+    """Runs a few forwards on a blank input, so the first real frame does not pay for
+    layer allocation, kernel compilation (OpenCL/CUDA) or graph setup (OpenVINO)."""
+    blob = np.zeros((batch_size, 3, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.float32)
+    for _ in range(runs):
+        net.setInput(blob)
+        net.forward()
+
+# ==========================================
+# MAIN ENTRY: cached, warmed net
+# ==========================================
+def load_net(model_path, prototxt_path=None, backend="auto", quantize=False, warmup_runs=2, cache=True):
+    """Returns a ready-to-serve net for the calling thread.
+
+    The first call for a given (model, backend, quantize) loads, optionally quantizes to
+    int8, picks the backend/target and warms it up; later calls from the same thread return
+    the same net at once. Other threads get their own net, since cv2.dnn nets are not
+    thread-safe. cache=False always loads a new one."""
+    name = pick_backend(backend)
+    key = (os.path.abspath(model_path), prototxt_path and os.path.abspath(prototxt_path), name, quantize)
+    nets = _thread_nets()
+    if cache and key in nets:
+        return nets[key]
+
+    start = time.perf_counter()
+    net = read_net(model_path, prototxt_path)
+    int8 = quantize_net(net, calibration_blobs()) if quantize else None
+    if int8 is not None:
+        net = int8
+    dnn_backend, dnn_target = BACKENDS[name]
+    net.setPreferableBackend(dnn_backend)
+    net.setPreferableTarget(dnn_target)
+    loaded = time.perf_counter()
+
+    try:
+        warm_up(net, warmup_runs)
+    except cv2.error as e:
+        if name == "opencv":
+            raise
+        # Compiled in but not usable on this host (no driver, no device): fall back to CPU
+        print(f"[WARNING] DNN backend '{name}' failed to run ({e}), falling back to opencv")
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        warm_up(net, warmup_runs)
+    warmed = time.perf_counter()
+
+    print(f"[INFO] Model ready: {os.path.basename(model_path)} backend={name}"
+          f"{' int8' if int8 is not None else ''} load={(loaded - start) * 1000:.0f}ms "
+          f"warmup={(warmed - loaded) * 1000:.0f}ms")
+    if cache:
+        nets[key] = net
+    return net
+
+def _thread_nets():
+    if not hasattr(_cache, "nets"):
+        _cache.nets = {}
+    return _cache.nets
+
+def clear_cache():
+    """Forgets the calling thread's nets."""
+    _thread_nets().clear()
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+
+# Gate decisions
+GATE_STATIC = "static"  # Nothing moved: reuse the last detections, no DNN
+GATE_MOTION = "motion"  # Some movement: normal detect-every-N / tracker path
+GATE_CHANGE = "change"  # Large change or first movement after a still period: detect now
+
+# ==========================================
+# CLASS: Motion Gate (pre-detection)
+# ==========================================
+class MotionGate:
+    """Background subtraction (MOG2) on a tiny grayscale copy of the frame, run before the DNN.
+
+    A person lying still is absorbed into the background after a while, so quiet rooms
+    stop costing a forward pass per frame. Any movement after a still period, or a large
+    moving area (somebody falling or walking in), forces an immediate re-detect."""
+    def __init__(self, width=160, history=300, var_threshold=25, min_area=0.002, trigger_area=0.03,
+                 max_static_frames=60, warmup_frames=10):
+        self.width = width
+        self.history = history
+        self.var_threshold = var_threshold
+        self.min_area = min_area  # Foreground fraction below this counts as static
+        self.trigger_area = trigger_area  # Foreground fraction at or above this forces a detection
+        self.max_static_frames = max_static_frames  # Re-anchor with one DNN run after this many static frames
+        self.warmup_frames = warmup_frames  # Background model is not trustworthy before this
+        self.kernel = np.ones((3, 3), np.uint8)
+
+        self.static_frames = 0
+        self.state = GATE_MOTION  # Last decision, read by capture pacing
+        self.reset()
+
+    def reset(self):
+        """New background model, e.g. after the camera was off and the room may have changed."""
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=self.history, varThreshold=self.var_threshold, detectShadows=False)
+        self.frames = 0
+        self.was_static = False
+        self.static_run = 0
+        self.foreground = 0.0
+
+    def check(self, gray):
+        """Feeds one grayscale frame (any size) and returns GATE_STATIC, GATE_MOTION or GATE_CHANGE."""
+        self.state = self._classify(gray)
+        return self.state
+
+    def _classify(self, gray):
+        (h, w) = gray.shape[:2]
+        if w != self.width:
+            gray = cv2.resize(gray, (self.width, max(int(h * self.width / w), 1)), interpolation=cv2.INTER_AREA)
+
+        mask = self.subtractor.apply(gray)
+        # Opening removes single-pixel sensor noise / JPEG flicker
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        self.foreground = cv2.countNonZero(mask) / mask.size
+        self.frames += 1
+
+        if self.frames <= self.warmup_frames:
+            return GATE_MOTION
+
+        if self.foreground < self.min_area:
+            self.static_run += 1
+            self.was_static = True
+            if self.static_run >= self.max_static_frames:
+                # Periodic check that the reused detections still match the scene
+                self.static_run = 0
+                return GATE_CHANGE
+            self.static_frames += 1
+            return GATE_STATIC
+
+        woke_up = self.was_static
+        self.was_static = False
+        self.static_run = 0
+        if woke_up or self.foreground >= self.trigger_area:
+            return GATE_CHANGE
+        return GATE_MOTION
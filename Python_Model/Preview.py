@@ -0,0 +1,145 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from MjpegStream import BOUNDARY
+
+COLOR_GREEN = (0, 255, 0)
+COLOR_RED = (0, 0, 255)
+COLOR_STATE = (255, 255, 0)
+
+# ==========================================
+# HELPER: Draw tracks
+# ==========================================
+def draw_tracks(frame, tracks, state=None, copy=True):
+    """Draws every (track_id, box, status, ratio) onto a BGR image and returns it.
+    Grayscale frames are converted; with copy=True a BGR frame is copied first,
+    so camera buffers handed out by reference are never drawn on."""
+    if len(frame.shape) == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    elif copy:
+        frame = frame.copy()
+
+    for (track_id, box, status, ratio) in tracks:
+        (startX, startY, endX, endY) = box
+        box_width = endX - startX
+        font_scale = max(box_width * 0.003, 0.5)
+        color = COLOR_RED if status == "Fall Down" else COLOR_GREEN
+
+        cv2.rectangle(frame, (startX, startY), (endX, endY), COLOR_GREEN, 2)
+        cv2.putText(frame, f"Person {track_id}: Ratio: {ratio:.2f} {status}", (startX, startY - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 2)
+
+    if state is not None:
+        cv2.putText(frame, f"State: {state}", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, COLOR_STATE, 2)
+    return frame
+
+# ==========================================
+# CLASS: Preview Server (annotated MJPEG over HTTP)
+# ==========================================
+class PreviewServer:
+    """Optional annotated preview for headless hosts, viewable in a browser at http://host:port/.
+
+    The inference loop calls submit() every frame. It only copies a frame when the render
+    thread has asked for one (at most `fps` times a second, and only while a viewer is
+    connected), so the loop never waits on drawing or JPEG encoding."""
+    def __init__(self, host="127.0.0.1", port=8090, fps=5, quality=70):
+        self.interval = 1.0 / fps
+        self.quality = quality
+        self.wanted = False  # Set by the render thread, cleared by submit()
+        self.pending = None  # (frame copy, tracks, state)
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self.viewers = 0
+        self.cond = threading.Condition()
+        self.started = False
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path in ("/", "/stream"):
+                    server._serve(self)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/"
+
+    def start(self):
+        if self.started:
+            return self
+        self.started = True
+        self.render_thread = threading.Thread(target=self._render, args=())
+        self.render_thread.daemon = True
+        self.render_thread.start()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"[INFO] Preview at {self.url}")
+        return self
+
+    def submit(self, frame, tracks, state=None):
+        """Called from the inference loop. Returns immediately unless a frame is wanted."""
+        if not self.wanted:
+            return
+        self.wanted = False
+        with self.cond:
+            self.pending = (frame.copy(), list(tracks), state)
+            self.cond.notify_all()
+
+    def stop(self):
+        self.started = False
+        with self.cond:
+            self.cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _render(self):
+        while self.started:
+            time.sleep(self.interval)
+            if self.viewers == 0:
+                continue
+            with self.cond:
+                item, self.pending = self.pending, None
+            self.wanted = True
+            if item is None:
+                continue
+
+            frame, tracks, state = item
+            annotated = draw_tracks(frame, tracks, state, copy=False)
+            ok, jpeg = cv2.imencode(".jpg", annotated, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                with self.cond:
+                    self.jpeg = jpeg.tobytes()
+                    self.jpeg_seq += 1
+                    self.cond.notify_all()
+
+    def _serve(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", f"multipart/x-mixed-replace;boundary={BOUNDARY}")
+        handler.end_headers()
+        with self.cond:
+            self.viewers += 1
+        seq = 0
+        try:
+            while self.started:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.jpeg_seq > seq or not self.started, 1.0)
+                    if self.jpeg_seq <= seq:
+                        continue
+                    seq, jpeg = self.jpeg_seq, self.jpeg
+                handler.wfile.write(f"\r\n--{BOUNDARY}\r\n".encode())
+                handler.wfile.write(f"Content-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode())
+                handler.wfile.write(jpeg)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.cond:
+                self.viewers -= 1
@@ -0,0 +1,371 @@
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from Metrics import METRICS
+from FallEvents import FallEventDetector
+from Tracker import MultiPersonTracker
+from src import FallAnalyzer, PersonDetector
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROTOTXT_PATH = os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.prototxt")
+MODEL_PATH = os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.caffemodel")
+
+# ==========================================
+# HELPER: Shared frame slots
+# ==========================================
+def attach_slots(name, n_slots, frame_size):
+    """Maps the shared frame block created by ProcessPipeline as an (n_slots, h, w) uint8 array.
+    Returns (shm, frames); keep shm referenced for as long as frames is used.
+    Only the creating process unlinks the block, workers just close() their mapping."""
+    shm = shared_memory.SharedMemory(name=name)
+    (w, h) = frame_size
+    frames = np.ndarray((n_slots, h, w), dtype=np.uint8, buffer=shm.buf)
+    return shm, frames
+
+def open_camera(camera, frame_size):
+    """Starts the threaded source for one camera config: {"url": ..., "mode": "stream"|"snapshot"}
+    for an ESP32 board, or {"video": path} for a file played back in real time."""
+    if "video" in camera:
+        from src import VideoSource
+        return VideoSource(camera["video"]).start(realtime=camera.get("realtime", True))
+    from VideoFromBoard import ThreadedSnapshotCamera
+    return ThreadedSnapshotCamera(camera["url"], mode=camera.get("mode", "stream"), frame_size=frame_size).start()
+
+# ==========================================
+# WORKER: Capture / decode (one process per camera)
+# ==========================================
+def capture_worker(cam_index, camera, frame_size, shm_name, n_slots, free_q, task_q, captured, dropped, stop_event):
+    """Pulls decoded frames from the camera and copies each into a free shared slot.
+    If every slot of this camera is still in flight the frame is dropped, so a slow
+    inference pool never builds a backlog of stale frames."""
+    shm, frames = attach_slots(shm_name, n_slots, frame_size)
+    source = open_camera(camera, frame_size)
+    last_frame_id = 0
+    try:
+        while not stop_event.is_set():
+            entry = source.wait_frame(last_frame_id, timeout=0.2)
+            if entry is None:
+                if source.ring.closed:
+                    break  # End of a video file
+                continue
+            last_frame_id, captured_at, frame = entry
+
+            try:
+                slot = free_q.get_nowait()
+            except queue.Empty:
+                with dropped.get_lock():
+                    dropped[cam_index] += 1
+                continue
+
+            if frame.shape[:2] == frames.shape[1:]:
+                np.copyto(frames[slot], frame if len(frame.shape) == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            else:
+                gray = frame if len(frame.shape) == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                cv2.resize(gray, frame_size, dst=frames[slot])
+
+            with captured.get_lock():
+                captured[cam_index] += 1
+            task_q.put((cam_index, last_frame_id, captured_at, slot))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if hasattr(source, 'stop'):
+            source.stop()
+        else:
+            source.release()
+        del frames
+        shm.close()
+
+# ==========================================
+# WORKER: Inference (N processes, one net each)
+# ==========================================
+def inference_worker(shm_name, n_slots, frame_size, task_q, result_q, prototxt, model,
+                     confidence_threshold, batch_size, num_threads, backend="auto", quantize=False):
+    """Loads the net once, then runs whatever frames are queued, up to batch_size per forward pass.
+    The first message on result_q is (pid, error): error is None once the net is loaded."""
+    cv2.setNumThreads(num_threads)  # One process per core, so no intra-op threads fighting each other
+    shm, frames = attach_slots(shm_name, n_slots, frame_size)
+
+    running = True
+    try:
+        try:
+            detector = PersonDetector(prototxt, model, confidence_threshold=confidence_threshold,
+                                      backend=backend, quantize=quantize)
+        except Exception as e:
+            result_q.put((os.getpid(), str(e)))
+            return
+        result_q.put((os.getpid(), None))
+
+        while running:
+            task = task_q.get()
+            if task is None:
+                break
+            batch = [task]
+            while len(batch) < batch_size:
+                try:
+                    task = task_q.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    running = False
+                    break
+                batch.append(task)
+
+            start = time.perf_counter()
+            try:
+                if len(batch) == 1:
+                    results = [detector.detect(frames[batch[0][3]])]
+                else:
+                    results = detector.detect_batch([frames[t[3]] for t in batch])
+            except Exception as e:
+                print(f"[ERROR] Inference worker {os.getpid()}: {e}")
+                results = [None] * len(batch)
+            per_frame = (time.perf_counter() - start) / len(batch)
+
+            for (cam_index, frame_id, captured_at, slot), result in zip(batch, results):
+                result_q.put((cam_index, frame_id, captured_at, slot, result, per_frame))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        del frames
+        shm.close()
+
+# ==========================================
+# CLASS: Process Pipeline (capture -> inference pool -> aggregator)
+# ==========================================
+class ProcessPipeline:
+    """Multi-process deployment: one capture/decode process per camera, a pool of inference
+    processes, and the aggregator (tracking, FallAnalyzer, Firebase) in the calling process.
+
+    Frames never go through pickle: every camera owns slots_per_camera slots of one
+    shared-memory block, and only (camera, frame_id, timestamp, slot) travels on the queues.
+    A slot goes back to its camera once the aggregator has handled the result.
+
+    cameras is a list of dicts with an "id" plus either "url" (+ "mode") or "video", and an
+    optional "room_id" for fall_history (defaults to the id).
+    on_result(camera_id, frame, tracks) is called on the aggregator; frame is a view of the
+    shared slot and is only valid during the call."""
+    def __init__(self, cameras, prototxt=PROTOTXT_PATH, model=MODEL_PATH, inference_workers=None,
+                 frame_size=(400, 300), slots_per_camera=3, batch_size=4, threads_per_worker=1,
+                 confidence_threshold=0.5, backend="auto", quantize=False, firebase=None, on_result=None,
+                 load_timeout=60.0):
+        self.cameras = cameras
+        self.prototxt = prototxt
+        self.model = model
+        self.inference_workers = inference_workers or max((os.cpu_count() or 2) - len(cameras), 1)
+        self.frame_size = frame_size
+        self.slots_per_camera = slots_per_camera
+        self.batch_size = batch_size
+        self.threads_per_worker = threads_per_worker
+        self.confidence_threshold = confidence_threshold
+        self.backend = backend
+        self.quantize = quantize
+        self.firebase = firebase
+        self.on_result = on_result
+        self.load_timeout = load_timeout  # Longest wait for the inference workers to load the net
+        self.started = False
+
+        # Per-camera aggregator state
+        self.trackers = [MultiPersonTracker(FallAnalyzer(), events=FallEventDetector()) for _ in cameras]
+        self.last_frame_ids = [0] * len(cameras)
+        self.processed = [0] * len(cameras)
+        self.results = 0  # Includes stale / failed results, compared against captured to know when idle
+        self.stale = 0
+
+    def start(self):
+        """Starts the inference pool, then the cameras. Raises RuntimeError if no worker loaded the net."""
+        if self.started:
+            return self
+        self.started = True
+        # spawn: no fork of a process that already has OpenCV / Firebase threads running
+        ctx = mp.get_context("spawn")
+        (w, h) = self.frame_size
+        n_slots = self.slots_per_camera * len(self.cameras)
+        self.shm = shared_memory.SharedMemory(create=True, size=n_slots * w * h)
+        self.frames = np.ndarray((n_slots, h, w), dtype=np.uint8, buffer=self.shm.buf)
+
+        self.stop_event = ctx.Event()
+        self.task_q = ctx.Queue()
+        self.result_q = ctx.Queue()
+        self.captured = ctx.Array('l', len(self.cameras))
+        self.dropped = ctx.Array('l', len(self.cameras))
+        self.free_qs = []
+        for i in range(len(self.cameras)):
+            free_q = ctx.Queue()
+            for slot in range(i * self.slots_per_camera, (i + 1) * self.slots_per_camera):
+                free_q.put(slot)
+            self.free_qs.append(free_q)
+
+        self.workers = [ctx.Process(target=inference_worker, daemon=True, args=(
+            self.shm.name, n_slots, self.frame_size, self.task_q, self.result_q, self.prototxt,
+            self.model, self.confidence_threshold, self.batch_size, self.threads_per_worker,
+            self.backend, self.quantize))
+            for _ in range(self.inference_workers)]
+        self.captures = []
+        for process in self.workers:
+            process.start()
+
+        # No camera is opened before at least one worker has a net to run its frames on
+        ready = self._wait_for_workers()
+        if ready == 0:
+            self.stop()
+            raise RuntimeError("No inference worker could load the model")
+        if ready < len(self.workers):
+            print(f"[WARNING] Only {ready} of {len(self.workers)} inference worker(s) loaded the model")
+
+        self.captures = [ctx.Process(target=capture_worker, daemon=True, args=(
+            i, camera, self.frame_size, self.shm.name, n_slots, self.free_qs[i], self.task_q,
+            self.captured, self.dropped, self.stop_event))
+            for i, camera in enumerate(self.cameras)]
+        for process in self.captures:
+            process.start()
+
+        print(f"[INFO] Pipeline started: {len(self.cameras)} camera(s), {ready} inference worker(s)")
+        return self
+
+    def _wait_for_workers(self):
+        """Collects the load report of every inference worker. Returns how many have a net."""
+        reported, ready = 0, 0
+        deadline = time.time() + self.load_timeout
+        while reported < len(self.workers) and time.time() < deadline:
+            try:
+                pid, error = self.result_q.get(timeout=0.2)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self.workers):
+                    break  # Died without a report (e.g. a crash inside OpenCV)
+                continue
+            reported += 1
+            if error is None:
+                ready += 1
+            else:
+                print(f"[ERROR] Inference worker {pid} could not load the model: {error}")
+        return ready
+
+    def run(self, duration=None):
+        """Aggregator loop. Returns when duration has passed, or when every capture has ended
+        (video files) and all of their frames have been processed."""
+        self.start()
+        deadline = None if duration is None else time.time() + duration
+        try:
+            while deadline is None or time.time() < deadline:
+                try:
+                    item = self.result_q.get(timeout=0.2)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in self.workers):
+                        print("[ERROR] Every inference worker has exited, stopping the pipeline")
+                        break
+                    if self._drained():
+                        break
+                    continue
+                self._handle(*item)
+        except KeyboardInterrupt:
+            print("\n[INFO] Keyboard interrupt received. Shutting down...")
+        finally:
+            self.stop()
+
+    def _drained(self):
+        return (not any(p.is_alive() for p in self.captures)
+                and self.results >= sum(self.captured[:]))
+
+    def _handle(self, cam_index, frame_id, captured_at, slot, result, infer_seconds):
+        self.results += 1
+        try:
+            if result is None:
+                return
+            METRICS.observe("worker_inference", infer_seconds)
+            METRICS.observe("frame_age", time.time() - captured_at)
+
+            # Workers finish out of order; a frame older than one already tracked is skipped
+            if frame_id <= self.last_frame_ids[cam_index]:
+                self.stale += 1
+                return
+            self.last_frame_ids[cam_index] = frame_id
+
+            boxes, confidences = result
+            frame = self.frames[slot]
+            (h, w) = frame.shape[:2]
+            with METRICS.stage("analyze"):
+                tracks = self.trackers[cam_index].update(boxes, w, h, timestamp=captured_at)
+            self.processed[cam_index] += 1
+            METRICS.frame("pipeline")
+
+            camera_id = self.cameras[cam_index]["id"]
+            if tracks and self.firebase:
+                fallen = any(status == "Fall Down" for (_, _, status, _) in tracks)
+                self.firebase.update_status(camera_id, "Fall Down" if fallen else "Standing")
+            for kind, event in self.trackers[cam_index].events.pop_events():
+                if kind == "confirmed":
+                    print(f"[ALERT] {camera_id}: fall confirmed, person {event.track_id}")
+                    if self.firebase:
+                        self.firebase.log_fall(event, room_id=self.cameras[cam_index].get("room_id", camera_id))
+
+            if self.on_result:
+                try:
+                    self.on_result(camera_id, frame, tracks)
+                except Exception as e:
+                    print(f"[ERROR] Pipeline callback ({camera_id}): {e}")
+        finally:
+            self.free_qs[cam_index].put(slot)
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+        self.stop_event.set()
+        for process in self.captures:
+            process.join(timeout=5.0)
+        for _ in self.workers:
+            self.task_q.put(None)
+        for process in self.workers:
+            process.join(timeout=5.0)
+        for process in self.captures + self.workers:
+            if process.is_alive():
+                process.terminate()
+
+        del self.frames
+        self.shm.close()
+        self.shm.unlink()
+
+    def stats(self):
+        return {camera["id"]: {
+            'captured': self.captured[i],
+            'dropped': self.dropped[i],
+            'processed': self.processed[i],
+        } for i, camera in enumerate(self.cameras)}
+
+if __name__ == "__main__":
+    # TEST SECTION
+    # python ProcessPipeline.py --workers 4 --video Video_Testing/ManyPeopleWalk.mp4 --camera http://192.168.1.51:81/stream
+    import argparse
+    parser = argparse.ArgumentParser(description="Multi-process fall detection over several cameras")
+    parser.add_argument("--camera", action="append", default=[], help="ESP32 stream URL (repeatable)")
+    parser.add_argument("--video", action="append", default=[], help="video file (repeatable)")
+    parser.add_argument("--workers", type=int, default=None, help="inference processes (default: cores - cameras)")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run (default: until the videos end)")
+    args = parser.parse_args()
+
+    cameras = [{"id": f"CAM-{i + 1:02d}", "url": url, "mode": "stream"} for i, url in enumerate(args.camera)]
+    cameras += [{"id": os.path.basename(path), "video": path, "realtime": False} for path in args.video]
+    if not cameras:
+        video_dir = os.path.join(BASE_DIR, "Video_Testing")
+        cameras = [{"id": f, "video": os.path.join(video_dir, f), "realtime": False}
+                   for f in sorted(os.listdir(video_dir)) if f.endswith(".mp4")]
+
+    METRICS.enable()
+    pipeline = ProcessPipeline(cameras, inference_workers=args.workers, batch_size=args.batch_size)
+    start = time.time()
+    pipeline.run(duration=args.duration)
+    elapsed = time.time() - start
+
+    total = 0
+    for camera_id, stats in pipeline.stats().items():
+        total += stats['processed']
+        print(f"[INFO] {camera_id}: {stats['processed']} processed, {stats['dropped']} dropped")
+    print(f"[INFO] {total} frames in {elapsed:.1f}s, {total / max(elapsed, 1e-6):.1f} FPS total")
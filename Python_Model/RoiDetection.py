@@ -0,0 +1,179 @@
+import cv2
+import numpy as np
+
+# ==========================================
+# HELPER: Zones and crop geometry
+# ==========================================
+def zone_boxes(zones, frame_width, frame_height):
+    """Room zones {"bed": (x1, y1, x2, y2), ...} in 0..1 frame coordinates -> (N, 4) pixel boxes."""
+    if not zones:
+        return np.zeros((0, 4))
+    rel = np.array(list(zones.values()), dtype=np.float64).reshape(-1, 4)
+    return rel * np.array([frame_width, frame_height, frame_width, frame_height])
+
+def square_crop(box, frame_width, frame_height, margin=0.25, min_size=96):
+    """Grows a box by margin on every side and makes it square (the net input is square, so
+    the person is not stretched), then shifts it to stay inside the frame."""
+    (x1, y1, x2, y2) = box
+    side = max(x2 - x1, y2 - y1) * (1 + 2 * margin)
+    side = min(max(side, min_size), frame_width, frame_height)
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    nx1 = int(np.clip(cx - side / 2, 0, frame_width - side))
+    ny1 = int(np.clip(cy - side / 2, 0, frame_height - side))
+    return np.array([nx1, ny1, nx1 + int(side), ny1 + int(side)])
+
+def merge_crops(crops, overlap=0.5):
+    """Replaces crops that mostly overlap (intersection > overlap of the smaller one) by
+    their bounding box, so one person is not run through the net twice."""
+    crops = [np.asarray(c, dtype=np.float64) for c in crops]
+    merged = True
+    while merged and len(crops) > 1:
+        merged = False
+        for i in range(len(crops)):
+            for j in range(i + 1, len(crops)):
+                a, b = crops[i], crops[j]
+                iw = min(a[2], b[2]) - max(a[0], b[0])
+                ih = min(a[3], b[3]) - max(a[1], b[1])
+                if iw <= 0 or ih <= 0:
+                    continue
+                smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+                if iw * ih > overlap * smaller:
+                    crops[i] = np.concatenate([np.minimum(a[:2], b[:2]), np.maximum(a[2:], b[2:])])
+                    del crops[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return crops
+
+# ==========================================
+# CLASS: ROI Detector
+# ==========================================
+class RoiDetector:
+    """Runs PersonDetector on crops instead of the whole frame.
+
+    Crops come from the tracker's predicted person boxes plus the room's bed/floor zones,
+    each blown up to the full 300x300 net input, so a person who covers a few pixels of the
+    frame is detected at a useful size. All crops of a frame go through one detect_batch().
+    A full-frame pass still runs every full_every calls (people outside the zones, somebody
+    entering), whenever nothing is tracked and no zone is set, and when the crops would
+    cost more than max_crops forwards. It also runs when a detection touches a crop border
+    inside the frame: that box is only part of a person (short and wide, like somebody
+    lying down), so it is never handed to the tracker.
+
+    Same detect(frame) -> (boxes, confidences) as PersonDetector, so IntervalDetector can use it;
+    None from the wrapped detector is passed on."""
+    def __init__(self, detector, tracker=None, zones=None, full_every=10, margin=0.5, min_crop=96,
+                 max_crops=3, nms_threshold=0.45, border=2):
+        self.detector = detector
+        self.tracker = tracker  # MultiPersonTracker supplying predicted_boxes()
+        self.zones = zones or {}
+        self.full_every = full_every
+        self.margin = margin  # Room around a predicted box for motion since the last detection
+        self.min_crop = min_crop
+        self.max_crops = max_crops
+        self.nms_threshold = nms_threshold
+        self.border = border  # Pixels from a crop edge that count as touching it
+
+        self.calls = 0
+        self.full_runs = 0
+        self.crops_run = 0
+        self.cut_fallbacks = 0
+
+    def detect(self, frame):
+        self.calls += 1
+        (h, w) = frame.shape[:2]
+
+        crops = self._crops(w, h)
+        if not crops or len(crops) > self.max_crops or (self.calls - 1) % self.full_every == 0:
+            self.full_runs += 1
+            return self.detector.detect(frame)
+
+        crops = [c.astype(int) for c in crops]
+        regions = [frame[y1:y2, x1:x2] for (x1, y1, x2, y2) in crops]
+        results = self.detector.detect_batch(regions)
+        self.crops_run += len(regions)
+        if results is None:
+            return None  # No result from the detector (see BatchInference.EngineDetector)
+
+        if any(self._cut(b, c, w, h) for c, (b, _) in zip(crops, results)):
+            self.cut_fallbacks += 1
+            self.full_runs += 1
+            return self.detector.detect(frame)
+
+        boxes = [b + np.array([c[0], c[1], c[0], c[1]]) for c, (b, _) in zip(crops, results)]
+        boxes = np.concatenate(boxes) if boxes else np.zeros((0, 4))
+        confidences = np.concatenate([conf for (_, conf) in results]) if results else np.zeros((0,))
+        return self._dedupe(boxes, confidences)
+
+    def _crops(self, w, h):
+        # Zones are squared and grown like person crops: a stretched crop distorts the ratio,
+        # and a tight one cuts off whoever lies across the zone edge
+        sources = list(zone_boxes(self.zones, w, h))
+        if self.tracker is not None:
+            sources += list(self.tracker.predicted_boxes())
+        return merge_crops([square_crop(box, w, h, self.margin, self.min_crop) for box in sources])
+
+    def _cut(self, boxes, crop, w, h):
+        """True if a box (crop coordinates) touches a crop edge that is not also a frame edge."""
+        (x1, y1, x2, y2) = crop
+        cw, ch = x2 - x1, y2 - y1
+        for (bx1, by1, bx2, by2) in boxes:
+            if ((bx1 <= self.border and x1 > 0) or (by1 <= self.border and y1 > 0)
+                    or (bx2 >= cw - self.border and x2 < w) or (by2 >= ch - self.border and y2 < h)):
+                return True
+        return False
+
+    def _dedupe(self, boxes, confidences):
+        """A person inside two overlapping crops comes back twice: keep the best box."""
+        if len(boxes) > 1:
+            xywh = np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2]))
+            keep = cv2.dnn.NMSBoxes(xywh.tolist(), confidences.tolist(), 0.0, self.nms_threshold)
+            keep = np.array(keep, dtype=int).reshape(-1)
+            boxes, confidences = boxes[keep], confidences[keep]
+        order = np.argsort(-confidences)
+        return boxes[order], confidences[order]
+
+if __name__ == "__main__":
+    # TEST SECTION
+    # A person lying across the right edge of the bed zone: the crop must not hand back
+    # the cut-off part of them as a short, wide box
+    class SceneDetector:
+        """Sees one person at PERSON (frame coordinates), clipped to whatever region it is given."""
+        PERSON = np.array([250.0, 150.0, 330.0, 290.0])
+
+        def __init__(self):
+            self.full_calls = 0
+
+        def _find(self, origin, size):
+            (ox, oy), (rw, rh) = origin, size
+            x1, y1 = max(self.PERSON[0] - ox, 0), max(self.PERSON[1] - oy, 0)
+            x2, y2 = min(self.PERSON[2] - ox, rw), min(self.PERSON[3] - oy, rh)
+            if x2 <= x1 or y2 <= y1:
+                return np.zeros((0, 4)), np.zeros((0,))
+            return np.array([[x1, y1, x2, y2]]), np.array([0.9])
+
+        def detect(self, frame):
+            self.full_calls += 1
+            return self._find((0, 0), (frame.shape[1], frame.shape[0]))
+
+        def detect_batch(self, regions):
+            return [self._find(self.origins[i], (r.shape[1], r.shape[0])) for i, r in enumerate(regions)]
+
+    frame = np.zeros((300, 400), dtype=np.uint8)
+    scene = SceneDetector()
+    roi = RoiDetector(scene, zones={"bed": (0.1, 0.3, 0.7, 0.8)}, full_every=100)
+
+    w, h = 400, 300
+    crop = square_crop(zone_boxes(roi.zones, w, h)[0], w, h, roi.margin, roi.min_crop)
+    print(f"[INFO] Bed zone crop: {crop.tolist()} (square: {crop[2] - crop[0] == crop[3] - crop[1]})")
+    assert crop[2] - crop[0] == crop[3] - crop[1]
+
+    roi.detect(frame)  # First call is a full pass
+    scene.origins = [crop[:2]]
+    boxes, _ = roi.detect(frame)
+    for (x1, y1, x2, y2) in boxes:
+        print(f"[INFO] Box {[int(v) for v in (x1, y1, x2, y2)]}, h/w = {(y2 - y1) / (x2 - x1):.2f}")
+    assert len(boxes) == 1 and np.allclose(boxes[0], SceneDetector.PERSON), "cut-off box reached the tracker"
+    assert roi.cut_fallbacks == 1
+    print("[INFO] Person cut by the zone crop: full-frame box kept, cut box dropped")
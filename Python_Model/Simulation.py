@@ -0,0 +1,349 @@
+import bisect
+import json
+import os
+import time
+
+import cv2
+
+from CapturePacing import CapturePacer
+from FallEvents import FallEventDetector
+from MotionGate import MotionGate
+from RoiDetection import RoiDetector
+from SparseDetection import IntervalDetector
+from StateMachine import MonitorStateMachine
+from Tracker import MultiPersonTracker
+from src import FallAnalyzer, PersonDetector
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ==========================================
+# CLASS: Simulated Clock
+# ==========================================
+class SimClock:
+    """Virtual time for StateMachine.MonitorStateMachine: sleep() advances it instantly,
+    so a replay runs as fast as the detector allows."""
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def advance_to(self, t):
+        self.now = max(self.now, t)
+
+# ==========================================
+# CLASS: Motion Timeline (recorded PIR flag)
+# ==========================================
+class MotionTimeline:
+    """Replays the motion flag from [(time, 0|1), ...] with FireBaseConnect.MotionSubscription's
+    get() / wait_for() on a SimClock. Times are seconds from the start of the simulation."""
+    def __init__(self, clock, changes, origin=0.0):
+        changes = sorted((origin + t, int(v)) for (t, v) in changes)
+        self.clock = clock
+        self.times = [t for (t, _) in changes]
+        self.values = [v for (_, v) in changes]
+
+    def get(self):
+        i = bisect.bisect_right(self.times, self.clock.time()) - 1
+        return self.values[i] if i >= 0 else None
+
+    def wait_for(self, value, timeout=None):
+        if self.get() == value:
+            return True
+        now = self.clock.time()
+        i = bisect.bisect_right(self.times, now)
+        while i < len(self.times) and self.values[i] != value:
+            i += 1
+        if i < len(self.times) and (timeout is None or self.times[i] - now <= timeout):
+            self.clock.advance_to(self.times[i])
+            return True
+        self.clock.sleep(timeout if timeout is not None else 0.0)
+        return False
+
+    def close(self):
+        pass
+
+    def rising_edges(self):
+        return [t for i, t in enumerate(self.times) if self.values[i] == 1 and (i == 0 or self.values[i - 1] == 0)]
+
+# ==========================================
+# CLASS: Replay Camera (recorded clip)
+# ==========================================
+def load_clip(path, frame_size=(400, 300), max_frames=None):
+    """Decodes a clip to grayscale frames (what JpegFrameDecoder hands the detector), plus its fps."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 15.0
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_size is not None:
+            frame = cv2.resize(frame, frame_size, interpolation=cv2.INTER_AREA)
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    cap.release()
+    return frames, fps
+
+class ReplayCamera:
+    """ThreadedSnapshotCamera stand-in: the clip starts startup_delay after start() and plays
+    at fps on the SimClock. Like the FrameRing, wait_frame() hands out the newest frame, so
+    frames that arrive while the detector is busy are dropped, as on the board."""
+    def __init__(self, clock, frames, fps, startup_delay=0.5, loop=False):
+        self.clock = clock
+        self.frames = frames
+        self.fps = fps
+        self.startup_delay = startup_delay  # Board connect + first JPEG
+        self.loop = loop
+        self.pacer = CapturePacer()  # Mode is recorded only, frames come at the clip's rate
+        self.origin = None
+        self.served = 0
+        self.dropped = 0
+
+    def start(self):
+        self.origin = self.clock.time() + self.startup_delay
+        return self
+
+    def frame_time(self, frame_id):
+        return self.origin + (frame_id - 1) / self.fps
+
+    def _latest_id(self, t):
+        """Id (1-based) of the newest frame out at time t, 0 if none yet."""
+        if t < self.origin:
+            return 0
+        latest = int((t - self.origin) * self.fps) + 1
+        return latest if self.loop else min(latest, len(self.frames))
+
+    def wait_frame(self, after_id, timeout=None):
+        latest = self._latest_id(self.clock.time())
+        if latest <= after_id:
+            wanted = after_id + 1
+            if not self.loop and wanted > len(self.frames):
+                self.clock.sleep(timeout or 0.0)  # Clip over: the camera sends nothing more
+                return None
+            due = self.frame_time(wanted)
+            if timeout is not None and due - self.clock.time() > timeout:
+                self.clock.sleep(timeout)
+                return None
+            self.clock.advance_to(due)
+            latest = wanted
+        self.dropped += latest - after_id - 1
+        self.served += 1
+        return latest, self.frame_time(latest), self.frames[(latest - 1) % len(self.frames)]
+
+    def stop(self):
+        pass
+
+# ==========================================
+# CLASS: Simulated Firebase
+# ==========================================
+class SimFirebase:
+    """Records update_status / log_fall calls with the SimClock time they happened."""
+    def __init__(self, clock):
+        self.clock = clock
+        self.statuses = []  # (time, device, status) on change
+        self.falls = []  # (time, room_id, FallEvent)
+
+    def update_status(self, device_name, status):
+        if not self.statuses or self.statuses[-1][2] != status:
+            self.statuses.append((self.clock.time(), device_name, status))
+
+    def log_fall(self, event=None, room_id='301'):
+        self.falls.append((self.clock.time(), room_id, event))
+
+# ==========================================
+# CLASS: Charged Detector (inference cost on the SimClock)
+# ==========================================
+class ChargedDetector:
+    """Wraps PersonDetector so every forward pass costs SimClock time: either the measured
+    wall time (times scale, e.g. 3.0 for a slower board) or a fixed inference_ms, which makes
+    runs exactly repeatable."""
+    def __init__(self, detector, clock, scale=1.0, inference_ms=None):
+        self.detector = detector
+        self.clock = clock
+        self.scale = scale
+        self.inference_ms = inference_ms
+        self.calls = 0
+        self.charged = 0.0
+
+    def detect(self, frame):
+        return self._charge(self.detector.detect, frame)
+
+    def detect_batch(self, frames):
+        return self._charge(self.detector.detect_batch, frames)
+
+    def _charge(self, fn, arg):
+        start = time.perf_counter()
+        result = fn(arg)
+        cost = self.inference_ms / 1000.0 if self.inference_ms is not None else (time.perf_counter() - start) * self.scale
+        self.clock.sleep(cost)
+        self.calls += 1
+        self.charged += cost
+        return result
+
+# ==========================================
+# CLASS: Simulation (one scenario)
+# ==========================================
+class Simulation:
+    """Replays a scenario through the real MonitorStateMachine / detector / tracker on virtual
+    time and reports the latencies that matter for an alert:
+      motion -> camera start -> first frame -> first inference, per motion episode
+      fall -> alert, per fall (from the labelled fall time if the scenario has one,
+      otherwise from the detector's own fall start)
+
+    Scenario (JSON):
+      {"clip": "Video_Testing/fall.mp4", "motion": [[0, 0], [2.0, 1], [40.0, 0]],
+       "falls": [12.5], "duration": 45}
+    "falls" are seconds into the clip (labelled by hand), "motion" and "duration" seconds
+    from the start of the simulation. The clip restarts each time the camera is started."""
+    def __init__(self, scenario, detector, detect_every=5, motion_gate=True, roi=False, camera_warmup=1.0,
+                 startup_delay=0.5, idle_timeout=0.5, frame_timeout=0.1, frame_size=(400, 300),
+                 inference_scale=1.0, inference_ms=None):
+        self.scenario = scenario
+        self.clock = SimClock()
+        clip_path = scenario["clip"]
+        if not os.path.isabs(clip_path):
+            clip_path = os.path.join(BASE_DIR, clip_path)
+        self.frames, self.fps = load_clip(clip_path, frame_size, scenario.get("max_frames"))
+        self.fps = scenario.get("fps", self.fps)
+        self.startup_delay = startup_delay
+
+        self.motion = MotionTimeline(self.clock, scenario.get("motion", [[0.0, 1]]))
+        self.fb = SimFirebase(self.clock)
+        self.detector = ChargedDetector(detector, self.clock, inference_scale, inference_ms)
+        self.cameras = []
+        self.marks = []
+
+        tracker = MultiPersonTracker(FallAnalyzer(smoothing_alpha=0.4), events=FallEventDetector())
+        base = RoiDetector(self.detector, tracker=tracker) if roi else self.detector
+        interval_detector = IntervalDetector(base, detect_every=detect_every,
+                                             gate=MotionGate() if motion_gate else None)
+        self.machine = MonitorStateMachine(interval_detector, tracker, self._open_camera, motion=self.motion,
+                                           fb=self.fb, clock=self.clock, camera_warmup=camera_warmup,
+                                           idle_timeout=idle_timeout, frame_timeout=frame_timeout,
+                                           marks=self.marks)
+
+    def _open_camera(self):
+        camera = ReplayCamera(self.clock, self.frames, self.fps, startup_delay=self.startup_delay)
+        self.cameras.append(camera)
+        return camera
+
+    def run(self):
+        duration = self.scenario.get("duration")
+        if duration is None:
+            duration = max(self.motion.times + [0.0]) + len(self.frames) / self.fps + 1.0
+        wall_start = time.perf_counter()
+        while self.clock.time() < duration:
+            self.machine.step()
+        self.machine.close()
+        self.wall_seconds = time.perf_counter() - wall_start
+        self.sim_seconds = self.clock.time()
+        return self.report()
+
+    def report(self):
+        marks = self.marks
+        starts = [t for (t, name, _) in marks if name == "camera_start"]
+        first_frames = [t for (t, name, _) in marks if name == "first_frame"]
+        first_inferences = [t for (t, name, _) in marks if name == "first_inference"]
+
+        episodes = []
+        for motion_at in self.motion.rising_edges():
+            start = next((t for t in starts if t >= motion_at), None)
+            if start is None:
+                continue
+            frame = next((t for t in first_frames if t >= start), None)
+            inference = next((t for t in first_inferences if t >= start), None)
+            episodes.append({
+                "motion_at": motion_at,
+                "motion_to_camera": start - motion_at,
+                "motion_to_first_frame": None if frame is None else frame - motion_at,
+                "motion_to_first_inference": None if inference is None else inference - motion_at,
+            })
+
+        alerts = []
+        for (alert_at, _, event) in self.fb.falls:
+            alerts.append({"alert_at": alert_at, "fall_start": event.start,
+                           "fall_to_alert": alert_at - event.start, "track_id": event.track_id})
+        # Labelled falls: seconds into the clip, for each camera start that played that far
+        labelled = []
+        for camera in self.cameras:
+            for offset in self.scenario.get("falls", []):
+                fall_at = camera.origin + offset
+                if fall_at > self.sim_seconds:
+                    continue
+                alert = next((a for a in alerts if a["alert_at"] >= fall_at), None)
+                labelled.append({"fall_at": fall_at,
+                                 "fall_to_alert": None if alert is None else alert["alert_at"] - fall_at})
+
+        frames_served = sum(c.served for c in self.cameras)
+        return {
+            "sim_seconds": self.sim_seconds,
+            "wall_seconds": self.wall_seconds,
+            "speedup": self.sim_seconds / self.wall_seconds if self.wall_seconds > 0 else None,
+            "episodes": episodes,
+            "alerts": alerts,
+            "labelled_falls": labelled,
+            "missed_falls": sum(1 for f in labelled if f["fall_to_alert"] is None),
+            "frames_processed": frames_served,
+            "frames_dropped": sum(c.dropped for c in self.cameras),
+            "detector_calls": self.detector.calls,
+            "inference_seconds": self.detector.charged,
+        }
+
+def print_report(report):
+    speedup = f", {report['speedup']:.1f}x real time" if report["speedup"] else ""
+    print(f"[INFO] Simulated {report['sim_seconds']:.1f}s in {report['wall_seconds']:.2f}s{speedup}")
+    print(f"  frames processed {report['frames_processed']}, dropped {report['frames_dropped']}, "
+          f"detector calls {report['detector_calls']} ({report['inference_seconds']:.2f}s simulated)")
+    for episode in report["episodes"]:
+        parts = [f"camera {episode['motion_to_camera'] * 1000:.0f}ms"]
+        for key, label in (("motion_to_first_frame", "first frame"), ("motion_to_first_inference", "first inference")):
+            if episode[key] is not None:
+                parts.append(f"{label} {episode[key] * 1000:.0f}ms")
+        print(f"  motion at {episode['motion_at']:.2f}s -> " + ", ".join(parts))
+    for alert in report["alerts"]:
+        print(f"  alert at {alert['alert_at']:.2f}s, person {alert['track_id']}: "
+              f"{alert['fall_to_alert']:.2f}s after the detected fall start")
+    for fall in report["labelled_falls"]:
+        result = "MISSED" if fall["fall_to_alert"] is None else f"alert after {fall['fall_to_alert']:.2f}s"
+        print(f"  labelled fall at {fall['fall_at']:.2f}s: {result}")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Replay a motion timeline and a clip through the IDLE/ACTIVE state machine")
+    parser.add_argument("scenario", help="Scenario JSON (see Simulation docstring)")
+    parser.add_argument("--detect-every", type=int, default=5)
+    parser.add_argument("--no-motion-gate", action="store_true")
+    parser.add_argument("--roi", action="store_true")
+    parser.add_argument("--camera-warmup", type=float, default=1.0, help="Pause after camera start (s)")
+    parser.add_argument("--startup-delay", type=float, default=0.5, help="Simulated board connect time (s)")
+    parser.add_argument("--idle-timeout", type=float, default=0.5)
+    parser.add_argument("--frame-timeout", type=float, default=0.1)
+    parser.add_argument("--inference-scale", type=float, default=1.0, help="Multiplier on measured inference time")
+    parser.add_argument("--inference-ms", type=float, help="Fixed inference cost (repeatable runs)")
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--json", help="Write the report here")
+    args = parser.parse_args()
+
+    with open(args.scenario) as f:
+        scenario = json.load(f)
+    if not os.path.isabs(scenario["clip"]):
+        scenario["clip"] = os.path.join(os.path.dirname(os.path.abspath(args.scenario)), scenario["clip"])
+
+    detector = PersonDetector(os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.prototxt"),
+                              os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.caffemodel"),
+                              confidence_threshold=0.5, backend=args.backend)
+    simulation = Simulation(scenario, detector, detect_every=args.detect_every, motion_gate=not args.no_motion_gate,
+                            roi=args.roi, camera_warmup=args.camera_warmup, startup_delay=args.startup_delay,
+                            idle_timeout=args.idle_timeout, frame_timeout=args.frame_timeout,
+                            inference_scale=args.inference_scale, inference_ms=args.inference_ms)
+    report = simulation.run()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,226 @@
+import cv2
+import numpy as np
+
+from MotionGate import GATE_CHANGE, GATE_STATIC
+
+# ==========================================
+# CLASS: Optical Flow Box Tracker
+# ==========================================
+class FlowBoxTracker:
+    """Carries person boxes forward between detections with sparse Lucas-Kanade optical flow."""
+    def __init__(self, scale=0.5, max_points=40, min_points=6):
+        self.scale = scale  # Flow runs on a downscaled grayscale copy of the frame
+        self.max_points = max_points
+        self.min_points = min_points  # Fewer surviving points than this = box lost
+        self.lk_params = dict(winSize=(15, 15), maxLevel=2,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        self.prev_gray = None
+        self.boxes = np.zeros((0, 4))
+        self.points = []
+
+    def init(self, gray, boxes):
+        """Seeds feature points inside each detected box."""
+        self.prev_gray = gray
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.points = [self._features(gray, box * self.scale) for box in self.boxes]
+
+    def update(self, gray):
+        """Moves every box by the flow of its points.
+        Returns (boxes, lost) where lost is True if any box lost track."""
+        if self.prev_gray is None or len(self.boxes) == 0:
+            self.prev_gray = gray
+            return self.boxes, False
+
+        counts = [len(p) for p in self.points]
+        if min(counts) < self.min_points:
+            self.prev_gray = gray
+            return self.boxes, True
+
+        # One LK call for the points of every box
+        old = np.concatenate(self.points).reshape(-1, 1, 2)
+        new, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, old, None, **self.lk_params)
+        old = old.reshape(-1, 2)
+        new = new.reshape(-1, 2)
+        good = status.reshape(-1) == 1
+
+        lost = False
+        offset = 0
+        for i, count in enumerate(counts):
+            keep = good[offset:offset + count]
+            p_old = old[offset:offset + count][keep]
+            p_new = new[offset:offset + count][keep]
+            offset += count
+
+            if len(p_new) < self.min_points:
+                lost = True
+                self.points[i] = p_new.astype(np.float32)
+                continue
+
+            self.boxes[i] = self._move(self.boxes[i], p_old / self.scale, p_new / self.scale)
+            self.points[i] = p_new.astype(np.float32)
+
+        self.prev_gray = gray
+        return self.boxes, lost
+
+    def _features(self, gray, box):
+        (h, w) = gray.shape[:2]
+        x1, y1 = max(int(box[0]), 0), max(int(box[1]), 0)
+        x2, y2 = min(int(box[2]), w), min(int(box[3]), h)
+        if x2 - x1 < 4 or y2 - y1 < 4:
+            return np.zeros((0, 2), dtype=np.float32)
+
+        corners = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], self.max_points, 0.01, 3)
+        if corners is None:
+            return np.zeros((0, 2), dtype=np.float32)
+        return (corners.reshape(-1, 2) + [x1, y1]).astype(np.float32)
+
+    @staticmethod
+    def _move(box, p_old, p_new):
+        """Shifts the box by the median flow and rescales each axis by the point spread,
+        so a person going from upright to lying down changes the box shape as well."""
+        c_old = np.median(p_old, axis=0)
+        c_new = np.median(p_new, axis=0)
+        spread_old = np.median(np.abs(p_old - c_old), axis=0)
+        spread_new = np.median(np.abs(p_new - c_new), axis=0)
+        scale = np.where(spread_old > 1e-3, spread_new / np.maximum(spread_old, 1e-3), 1.0)
+        scale = np.clip(scale, 0.8, 1.25)
+
+        center = (box[:2] + box[2:]) / 2 + (c_new - c_old)
+        half = (box[2:] - box[:2]) / 2 * scale
+        return np.concatenate([center - half, center + half])
+
+# ==========================================
+# CLASS: Interval Detector
+# ==========================================
+class IntervalDetector:
+    """Runs the full PersonDetector every N frames (or on demand) and carries boxes forward
+    with a cheap tracker in between. detect() has the same return value as PersonDetector.detect;
+    a detector that returns None for a frame leaves the previous boxes in place.
+
+    With a MotionGate, static frames skip both the DNN and the tracker and return the last
+    detections, and the gate (instead of motion_threshold) decides when to re-detect at once."""
+    def __init__(self, detector, detect_every=5, tracker_type="flow", motion_threshold=12.0, flow_scale=0.5,
+                 gate=None):
+        self.detector = detector
+        self.detect_every = max(int(detect_every), 1)
+        self.motion_threshold = motion_threshold  # Mean abs pixel change that forces a detection
+        self.gate = gate
+        self.flow_scale = flow_scale
+        self.tracker_type = self._resolve_tracker(tracker_type)
+
+        self.flow = FlowBoxTracker(scale=flow_scale)
+        self.cv_trackers = []
+        self.frames_since_detect = 0
+        self.prev_gray = None
+        self.boxes = np.zeros((0, 4))
+        self.confidences = np.zeros((0,))
+
+        self.frames = 0
+        self.detections_run = 0
+        self.detections_missed = 0
+        self.frames_gated = 0
+
+    def reset(self):
+        self.frames_since_detect = 0
+        self.prev_gray = None
+        self.cv_trackers = []
+        self.flow.init(None, np.zeros((0, 4)))
+        self.boxes = np.zeros((0, 4))
+        self.confidences = np.zeros((0,))
+        if self.gate is not None:
+            self.gate.reset()
+
+    def detect(self, frame, force=False):
+        self.frames += 1
+        gray = self._small_gray(frame)
+
+        gate_state = self.gate.check(gray) if self.gate is not None else None
+        if gate_state == GATE_STATIC and not force and self.prev_gray is not None:
+            # Nothing moved: last detections are still valid. prev_gray is kept as the
+            # reference so the flow tracker resumes from the last frame it actually saw.
+            self.frames_gated += 1
+            return self.boxes.copy(), self.confidences.copy()
+
+        run_dnn = (force or gate_state == GATE_CHANGE or self.detect_every == 1 or self.prev_gray is None
+                   or self.frames_since_detect + 1 >= self.detect_every)
+
+        # Large scene change: somebody moved fast or entered, do not wait for the interval
+        if not run_dnn and self.gate is None and self.motion_threshold is not None:
+            if cv2.absdiff(gray, self.prev_gray).mean() > self.motion_threshold:
+                run_dnn = True
+
+        if not run_dnn:
+            lost = self._carry_forward(frame, gray)
+            # Tracker drift: fall back to the real detector on this same frame
+            run_dnn = lost
+
+        result = self.detector.detect(frame) if run_dnn else None
+        if result is not None:
+            self.boxes, self.confidences = result
+            self._seed_tracker(frame, gray)
+            self.frames_since_detect = 0
+            self.detections_run += 1
+        else:
+            # None from the detector (e.g. a shared engine that timed out): keep the last
+            # boxes and try the DNN again on the next frame
+            if run_dnn:
+                self.detections_missed += 1
+            self.frames_since_detect += 1
+
+        self.prev_gray = gray
+        return self.boxes.copy(), self.confidences.copy()
+
+    def _carry_forward(self, frame, gray):
+        if len(self.boxes) == 0:
+            return False
+
+        if self.tracker_type == "flow":
+            boxes, lost = self.flow.update(gray)
+            self.boxes = boxes.copy()
+            return lost
+
+        lost = False
+        for i, tracker in enumerate(self.cv_trackers):
+            ok, (x, y, bw, bh) = tracker.update(frame)
+            if not ok:
+                lost = True
+                continue
+            self.boxes[i] = [x, y, x + bw, y + bh]
+        return lost
+
+    def _seed_tracker(self, frame, gray):
+        if self.tracker_type == "flow":
+            self.flow.init(gray, self.boxes)
+            return
+
+        self.cv_trackers = []
+        for (x1, y1, x2, y2) in self.boxes.astype("int"):
+            tracker = self._create_cv_tracker()
+            tracker.init(frame, (int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+            self.cv_trackers.append(tracker)
+
+    def _small_gray(self, frame):
+        small = cv2.resize(frame, None, fx=self.flow_scale, fy=self.flow_scale, interpolation=cv2.INTER_AREA)
+        if len(small.shape) == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def _create_cv_tracker(self):
+        if self.tracker_type == "mosse":
+            return cv2.legacy.TrackerMOSSE_create()
+        if hasattr(cv2, "TrackerKCF_create"):
+            return cv2.TrackerKCF_create()
+        return cv2.legacy.TrackerKCF_create()
+
+    @staticmethod
+    def _resolve_tracker(tracker_type):
+        """KCF/MOSSE live in opencv-contrib. Fall back to optical flow when they are missing."""
+        tracker_type = tracker_type.lower()
+        legacy = getattr(cv2, "legacy", None)
+        if tracker_type == "mosse" and hasattr(legacy, "TrackerMOSSE_create"):
+            return "mosse"
+        if tracker_type == "kcf" and (hasattr(cv2, "TrackerKCF_create") or hasattr(legacy, "TrackerKCF_create")):
+            return "kcf"
+        if tracker_type != "flow":
+            print(f"[WARNING] Tracker '{tracker_type}' not available in this OpenCV build, using optical flow")
+        return "flow"
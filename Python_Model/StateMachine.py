@@ -0,0 +1,200 @@
+import time
+
+from CapturePacing import PACE_NORMAL, PACE_STEADY, PACE_SUSPECT
+from FallEvents import STATUS_FALL, STATUS_FALLING
+from Metrics import METRICS
+from MotionGate import GATE_STATIC
+
+# ==========================================
+# STATE MACHINE STATES
+# ==========================================
+STATE_IDLE = "IDLE"       # Waiting for motion
+STATE_ACTIVE = "ACTIVE"   # Motion detected, camera active
+STATE_STOPPING = "STOPPING"  # Transitioning to idle
+
+# ==========================================
+# CLASS: System Clock
+# ==========================================
+class SystemClock:
+    """Wall clock. Simulation.SimClock has the same two methods and runs on virtual time."""
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+# ==========================================
+# CLASS: Monitor State Machine (one camera)
+# ==========================================
+class MonitorStateMachine:
+    """The IDLE / ACTIVE / STOPPING loop: camera off until the PIR flag goes up, detect /
+    track / report on every new frame while it is up, camera off again when it drops.
+
+    Everything outside the loop is passed in, so the same code runs against the ESP32 and
+    Firebase (VideoFromBoard, FleetRunner) or against recorded timelines (Simulation):
+      clock           time() / sleep()
+      motion          get() / wait_for(value, timeout), e.g. FireBaseConnect.MotionSubscription
+      camera_factory  () -> camera with start() / wait_frame(after_id, timeout) / stop() / pacer
+      fb              update_status(device, status) / log_fall(event, room_id)
+    marks, if a list, collects (time, name, detail) for every transition, first frame,
+    first inference and confirmed fall, which is what the latency report is built from."""
+    def __init__(self, interval_detector, tracker, camera_factory, motion=None, fb=None, recorder=None,
+                 camera_id="ESP32-S3-CAM", room_id="301", log_fall_history=True, always_on=False,
+                 clock=None, camera_warmup=1.0, idle_timeout=0.5, frame_timeout=0.1, on_frame=None, on_stop=None,
+                 marks=None):
+        self.interval_detector = interval_detector
+        self.tracker = tracker
+        self.camera_factory = camera_factory
+        self.motion = motion
+        self.fb = fb
+        self.recorder = recorder
+        self.camera_id = camera_id
+        self.room_id = room_id
+        self.log_fall_history = log_fall_history
+        self.always_on = always_on  # No PIR sensor: camera stays on
+        self.clock = clock or SystemClock()
+
+        # Timings that used to be fixed sleeps in VideoFromBoard.main
+        self.camera_warmup = camera_warmup  # Pause after starting the camera, before the first wait_frame
+        self.idle_timeout = idle_timeout  # Longest wait for motion per step (keeps Ctrl+C / stop responsive)
+        self.frame_timeout = frame_timeout  # Longest wait for a new frame per step
+
+        # on_frame(frame, tracks, state) runs after each processed frame (preview, display);
+        # returning False stops the machine. on_stop() runs after the camera was turned off.
+        self.on_frame = on_frame
+        self.on_stop = on_stop
+        self.marks = marks
+
+        self.state = STATE_IDLE
+        self.camera = None
+        self.last_frame_id = 0
+        self.frames_processed = 0
+        self.running = True
+
+    def run(self):
+        """Steps until stop() or on_frame asks to quit, then turns the camera off."""
+        try:
+            while self.running and self.step():
+                pass
+        finally:
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+    def step(self):
+        """One pass of the loop: a wait for motion, one frame, or the shutdown of the camera.
+        Returns False when on_frame asked to quit."""
+        if self.state == STATE_IDLE:
+            self._step_idle()
+        elif self.state == STATE_ACTIVE:
+            return self._step_active()
+        elif self.state == STATE_STOPPING:
+            self._step_stopping()
+        return True
+
+    def close(self):
+        if self.camera:
+            self.camera.stop()
+            self.camera = None
+            if self.recorder:
+                self.recorder.finish(self.camera_id)
+
+    def _mark(self, name, detail=None):
+        if self.marks is not None:
+            self.marks.append((self.clock.time(), name, detail))
+
+    def _step_idle(self):
+        if self.always_on:
+            reason = "Always on."
+        elif self.motion is None:
+            # If no Firebase, stay in IDLE
+            print("[WARNING] No Firebase connection, cannot monitor motion")
+            self.clock.sleep(1.0)
+            return
+        # Sleeps until the listener reports motion (timeout keeps Ctrl+C responsive)
+        elif self.motion.wait_for(1, timeout=self.idle_timeout):
+            reason = "Motion detected!"
+        else:
+            return
+
+        print(f"[INFO] {reason} Starting camera ({self.camera_id})...")
+        self._mark("camera_start")
+        self.camera = self.camera_factory().start()
+        self.clock.sleep(self.camera_warmup)  # Give camera time to initialize
+        self.tracker.reset()
+        self.interval_detector.reset()
+        self.last_frame_id = 0
+        self.frames_processed = 0
+        self.state = STATE_ACTIVE
+
+    def _step_active(self):
+        # Cached value, no network round-trip on the frame loop
+        if not self.always_on and self.motion is not None and self.motion.get() == 0:
+            print("[INFO] Motion ended. Stopping camera...")
+            self.state = STATE_STOPPING
+            return True
+
+        # Only frames not processed yet (the model never runs twice on the same frame)
+        entry = self.camera.wait_frame(self.last_frame_id, timeout=self.frame_timeout)
+        if entry is None:
+            return True
+        self.last_frame_id, captured_at, frame = entry
+        METRICS.observe("frame_age", self.clock.time() - captured_at)
+        if self.frames_processed == 0:
+            self._mark("first_frame", captured_at)
+
+        boxes, confidences = self.interval_detector.detect(frame)
+        (h, w) = frame.shape[:2]
+        with METRICS.stage("analyze"):
+            tracks = self.tracker.update(boxes, w, h, timestamp=captured_at)
+        self.frames_processed += 1
+        if self.frames_processed == 1:
+            self._mark("first_inference", len(boxes))
+
+        if tracks and self.fb:
+            fallen = any(status == STATUS_FALL for (_, _, status, _) in tracks)
+            try:
+                self.fb.update_status(self.camera_id, "Fall Down" if fallen else "Standing")
+            except Exception as e:
+                print(f"[ERROR] Firebase Update: {e}")
+
+        for kind, event in self.tracker.events.pop_events():
+            if kind == "confirmed":
+                print(f"[ALERT] Fall confirmed ({self.camera_id}): person {event.track_id}")
+                self._mark("fall_confirmed", event)
+                if self.fb and self.log_fall_history:
+                    self.fb.log_fall(event, room_id=self.room_id)
+                if self.recorder:
+                    self.recorder.trigger_event(self.camera_id, event)
+            else:
+                print(f"[INFO] Person {event.track_id} back up after {event.duration():.1f}s")
+
+        # Capture rate follows the scene: full speed on a suspected fall, slow when static
+        gate = self.interval_detector.gate
+        if any(status in (STATUS_FALLING, STATUS_FALL) for (_, _, status, _) in tracks):
+            self.camera.pacer.set_mode(PACE_SUSPECT)
+        elif gate is not None and gate.state == GATE_STATIC:
+            self.camera.pacer.set_mode(PACE_STEADY)
+        else:
+            self.camera.pacer.set_mode(PACE_NORMAL)
+
+        if self.on_frame is not None and self.on_frame(frame, tracks, self.state) is False:
+            return False
+        return True
+
+    def _step_stopping(self):
+        ring = getattr(self.camera, "ring", None)
+        stats = ring.stats() if ring is not None else None
+        self.close()
+        if stats:
+            print(f"[INFO] Camera stopped ({stats['consumed']} frames processed, "
+                  f"{stats['dropped']} dropped, {stats['duplicates']} duplicates)")
+        self._mark("camera_stop", self.frames_processed)
+        if self.on_stop is not None:
+            self.on_stop()
+        self.state = STATE_IDLE
+        self.tracker.reset()
+        self.interval_detector.reset()
+        print("[INFO] Returning to IDLE state. Monitoring for motion...")
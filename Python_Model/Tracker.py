@@ -0,0 +1,182 @@
+import time
+
+import numpy as np
+
+# ==========================================
+# CLASS: Track Store (array-backed state)
+# ==========================================
+class TrackStore:
+    """Per-track state kept in flat NumPy arrays. Row i is one track, freed rows are reused."""
+    def __init__(self, capacity=16):
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.boxes = np.zeros((capacity, 4), dtype=np.float64)  # Smoothed box (prev_box of the track)
+        self.velocity = np.zeros((capacity, 4), dtype=np.float64)  # Smoothed box change per frame
+        self.ratios = np.zeros(capacity, dtype=np.float32)
+        self.fallen = np.zeros(capacity, dtype=bool)
+        self.hits = np.zeros(capacity, dtype=np.int32)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.active))
+
+    def active_slots(self):
+        return np.flatnonzero(self.active)
+
+    def allocate(self, track_id, box, frame_idx):
+        """Claims a free row for a new track, doubling the arrays when full."""
+        free = np.flatnonzero(~self.active)
+        if len(free) == 0:
+            self._grow()
+            free = np.flatnonzero(~self.active)
+        slot = free[0]
+
+        self.ids[slot] = track_id
+        self.boxes[slot] = box
+        self.velocity[slot] = 0
+        self.ratios[slot] = 0
+        self.fallen[slot] = False
+        self.hits[slot] = 0
+        self.last_seen[slot] = frame_idx
+        self.active[slot] = True
+        return slot
+
+    def release(self, slots):
+        self.active[slots] = False
+        self.ids[slots] = -1
+
+    def clear(self):
+        self.release(np.arange(len(self.active)))
+
+    def _grow(self):
+        capacity = len(self.active)
+        self.ids = np.concatenate([self.ids, np.full(capacity, -1, dtype=np.int64)])
+        for name in ("boxes", "velocity", "ratios", "fallen", "hits", "last_seen", "active"):
+            old = getattr(self, name)
+            setattr(self, name, np.concatenate([old, np.zeros_like(old)]))
+
+# ==========================================
+# HELPER: Box overlap
+# ==========================================
+def iou_matrix(boxes_a, boxes_b):
+    """IoU of every box in boxes_a (M,4) against every box in boxes_b (N,4). Returns (M,N)."""
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+# ==========================================
+# CLASS: Multi Person Tracker
+# ==========================================
+class MultiPersonTracker:
+    """Assigns detections to track IDs and runs FallAnalyzer per track.
+    With a FallEventDetector (events=...) the status comes from the temporal analysis
+    instead of the single-frame aspect ratio."""
+    def __init__(self, analyzer, iou_threshold=0.3, max_centroid_dist=100, max_age=15, events=None):
+        self.analyzer = analyzer
+        self.events = events
+        self.iou_threshold = iou_threshold
+        self.max_centroid_dist = max_centroid_dist  # Fallback match when boxes do not overlap
+        self.max_age = max_age  # Frames a track survives without a matching detection
+
+        self.store = TrackStore()
+        self.next_id = 1
+        self.frame_idx = 0
+
+    def reset(self):
+        self.store.clear()
+        self.frame_idx = 0
+        if self.events is not None:
+            self.events.reset()
+
+    def update(self, boxes, frame_width, frame_height, timestamp=None):
+        """Matches this frame's person boxes to tracks.
+        Returns [(track_id, box, status, ratio), ...] for every track seen this frame.
+        timestamp (capture time, seconds) drives the temporal fall analysis; default now."""
+        self.frame_idx += 1
+        self.timestamp = time.time() if timestamp is None else timestamp
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+        slots = self.store.active_slots()
+        matches, unmatched = self._match(slots, boxes)
+
+        results = []
+        for slot, det in matches:
+            results.append(self._step(slot, boxes[det], self.store.boxes[slot].copy()))
+
+        for det in unmatched:
+            slot = self.store.allocate(self.next_id, boxes[det], self.frame_idx)
+            self.next_id += 1
+            # A new track has no history to smooth against
+            results.append(self._step(slot, boxes[det], None))
+
+        self._evict()
+        return results
+
+    def _step(self, slot, raw_box, prev_box):
+        store = self.store
+        box, status, ratio = self.analyzer.analyze_with_prev(raw_box, prev_box)
+        if self.events is not None:
+            status = self.events.update(int(store.ids[slot]), box, ratio, self.timestamp, raw_box=raw_box)
+
+        if prev_box is not None:
+            frames = max(self.frame_idx - store.last_seen[slot], 1)
+            store.velocity[slot] = 0.5 * store.velocity[slot] + 0.5 * (box - prev_box) / frames
+        store.boxes[slot] = box
+        store.ratios[slot] = ratio
+        store.fallen[slot] = status == "Fall Down"
+        store.hits[slot] += 1
+        store.last_seen[slot] = self.frame_idx
+        return int(store.ids[slot]), box, status, ratio
+
+    def predicted_boxes(self):
+        """Where each active track should be on the next frame (last box moved by its velocity).
+        Returns an (N, 4) array, used to pick detector crops."""
+        slots = self.store.active_slots()
+        ahead = (self.frame_idx + 1 - self.store.last_seen[slots])[:, None]
+        return self.store.boxes[slots] + self.store.velocity[slots] * ahead
+
+    def _match(self, slots, boxes):
+        """Greedy assignment: best IoU pairs first, then nearest centroids for the rest."""
+        if len(slots) == 0 or len(boxes) == 0:
+            return [], list(range(len(boxes)))
+
+        track_boxes = self.store.boxes[slots]
+        iou = iou_matrix(track_boxes, boxes)
+
+        track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+        det_centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        dist = np.linalg.norm(track_centers[:, None, :] - det_centers[None, :, :], axis=2)
+
+        # Lower cost is better: IoU matches always beat centroid-only matches
+        cost = np.where(iou >= self.iou_threshold, -iou, dist)
+        allowed = (iou >= self.iou_threshold) | (dist < self.max_centroid_dist)
+
+        used_tracks = np.zeros(len(slots), dtype=bool)
+        used_dets = np.zeros(len(boxes), dtype=bool)
+        matches = []
+        for flat in np.argsort(np.where(allowed, cost, np.inf), axis=None):
+            t, d = np.unravel_index(flat, cost.shape)
+            if not allowed[t, d]:
+                break
+            if used_tracks[t] or used_dets[d]:
+                continue
+            used_tracks[t] = True
+            used_dets[d] = True
+            matches.append((slots[t], d))
+
+        return matches, list(np.flatnonzero(~used_dets))
+
+    def _evict(self):
+        store = self.store
+        stale = store.active & (self.frame_idx - store.last_seen > self.max_age)
+        if stale.any():
+            slots = np.flatnonzero(stale)
+            if self.events is not None:
+                self.events.drop(store.ids[slots].tolist())
+            store.release(slots)
@@ -1,37 +1,123 @@
 import cv2
-import numpy as np
 import os
 import threading
 import time
 import requests
 from FireBaseConnect import FirebaseHandler
+from src import PersonDetector, FallAnalyzer
+from Tracker import MultiPersonTracker
+from SparseDetection import IntervalDetector
+from MotionGate import MotionGate
+from FallEvents import FallEventDetector
+from EventRecorder import EventRecorder
+from EventStore import EventStore
+from RoiDetection import RoiDetector
+from MjpegStream import MjpegStreamReader
+from FrameDecode import JpegFrameDecoder
+from FrameExchange import FrameRing
+from CapturePacing import Backoff, CapturePacer
+from StateMachine import MonitorStateMachine
+from Metrics import METRICS
+from Preview import PreviewServer, draw_tracks
 
 # ==========================================
 # CONFIGURATION
 # ==========================================
-ESP32_IP = "192.168.1.51"  # <-- ใส่ IP จริงของบอร์ดตรงนี้
-SNAPSHOT_URL = f"http://{ESP32_IP}/capture"
+ESP32_IP = "192.168.1.51"  # <-- ใส่ IP จริงของบอร์ดตรงนี้ (host only, ports below)
+HTTP_PORT = 80  # /capture
+STREAM_PORT = 81  # /stream (main2.cpp runs it on a second server)
+SNAPSHOT_URL = f"http://{ESP32_IP}:{HTTP_PORT}/capture"
+STREAM_URL = f"http://{ESP32_IP}:{STREAM_PORT}/stream"
 
-CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat",
-           "bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
-           "dog", "horse", "motorbike", "person", "pottedplant", "sheep",
-           "sofa", "train", "tvmonitor"]
+# "stream" = MJPEG from /stream (main2.cpp, port 81), "snapshot" = one GET /capture per frame
+# (use "snapshot" for boards still running firmware without the /stream handler)
+CAPTURE_MODE = "stream"
+
+# Pause after the camera starts before waiting for frames (tune with Simulation.py)
+CAMERA_WARMUP_SECONDS = 1.0
+
+# Per-stage latency / FPS / queue depth: Prometheus text at http://127.0.0.1:METRICS_PORT/metrics
+# plus one log line every METRICS_LOG_INTERVAL seconds. Off by default (opens a listening port).
+METRICS_ENABLED = False
+METRICS_PORT = 9100
+METRICS_LOG_INTERVAL = 60.0
+
+# Run MobileNetSSD every N frames and carry boxes with optical flow in between (1 = every frame)
+DETECT_EVERY_N = 5
+
+# Skip the DNN while the picture is static (background subtraction on a tiny copy of the frame);
+# any new movement re-detects immediately. The PIR flag only decides whether the camera is on.
+MOTION_GATE = True
+
+# Write each confirmed fall (fast descent, then down for 2s) to fall_history in Firebase
+LOG_FALL_HISTORY = False
+
+# Status changes and fall events are kept in this SQLite file and synced to Firebase in batches,
+# so nothing is lost while the network is down, e.g.
+# os.path.join(os.path.dirname(os.path.abspath(__file__)), "events.db") (None: write to Firebase directly)
+EVENT_STORE_PATH = None
+
+# Save the camera's own JPEGs from RECORD_PRE_SECONDS before to RECORD_POST_SECONDS after each
+# confirmed fall into RECORD_DIR (oldest clips deleted past RECORD_MAX_DISK_MB). Off by default.
+RECORD_FALLS = False
+RECORD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fall_clips")
+RECORD_PRE_SECONDS = 5.0
+RECORD_POST_SECONDS = 5.0
+RECORD_MAX_DISK_MB = 500
+
+CAMERA_ID = "ESP32-S3-CAM"
+
+# Frames are decoded at FRAME_SIZE (width, height); None keeps the board's own resolution,
+# so detector crops are cut from every pixel the camera sent.
+FRAME_SIZE = None
+
+# ROI detection: run the net on crops around tracked people and the room's zones (each blown
+# up to the 300x300 input), with a full-frame pass every ROI_FULL_EVERY detections.
+# Zones are (x1, y1, x2, y2) as fractions of the frame, e.g. {"bed": (0.55, 0.30, 0.95, 0.70),
+# "floor": (0.05, 0.45, 0.55, 1.0)}; measure them from a snapshot of the room. Off by default.
+ROI_DETECTION = False
+ROOM_ZONES = {}
+ROI_FULL_EVERY = 10
+
+# Headless server: no drawing, no cv2.imshow/waitKey on the frame loop (Ctrl+C to stop).
+# PREVIEW_PORT serves an annotated MJPEG preview at http://127.0.0.1:PREVIEW_PORT/ (None = off).
+HEADLESS = False
+PREVIEW_PORT = None
 
-COLOR = (0, 255, 0)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 prototxt_path = os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.prototxt")
 model_path = os.path.join(BASE_DIR, "MobileNetFile", "MobileNetSSD.caffemodel")
 
+# DNN backend: "auto" (cuda > openvino > opencv CPU, whichever this host has) or a name from
+# ModelLoader.BACKENDS. MODEL_QUANTIZE = True runs the net in int8 (calibrated on Video_Testing).
+# model_path may also point to an ONNX export of the same detector (prototxt is then ignored).
+DNN_BACKEND = "auto"
+MODEL_QUANTIZE = False
+
 # ==========================================
 # CLASS: Threaded Snapshot Camera (Optimized)
 # ==========================================
 class ThreadedSnapshotCamera:
-    def __init__(self, url):
+    def __init__(self, url, mode="snapshot", frame_size=(400, 300), recorder=None, camera_id=CAMERA_ID):
         self.url = url
-        self.frame = None
+        self.recorder = recorder  # EventRecorder: gets every raw JPEG for the fall-clip pre-roll
+        self.camera_id = camera_id
+        self.mode = mode  # "snapshot" = GET /capture per frame, "stream" = one long-lived MJPEG GET
         self.grabbed = False
         self.started = False
-        self.read_lock = threading.Lock()
+        self.reader = None
+
+        # Snapshot requests follow the consumer's pace (and the mode set by main), errors back off
+        self.pacer = CapturePacer()
+        self.backoff = Backoff()
+        self.stopped = threading.Event()  # Interrupts a backoff sleep on stop()
+
+        # Frames go to the inference loop through a ring with frame IDs (no repeats, drop counters)
+        self.ring = FrameRing(size=4)
+
+        # โหลดภาพแบบ Grayscale ลดขนาดตั้งแต่ตอน decode แล้วเขียนลง buffer ที่จองไว้ (ไม่ copy)
+        # Decoder buffers outnumber ring entries, so a frame handed out is not overwritten mid-use
+        self.decoder = JpegFrameDecoder(frame_size, grayscale=True, ring_size=self.ring.size + 2)
         
         # ✅ ใช้ Session เพื่อรักษา Connection (ลดภาระ CPU ของ ESP32 ลงอย่างมาก)
         self.session = requests.Session() 
@@ -40,60 +126,94 @@ class ThreadedSnapshotCamera:
         if self.started:
             return None
         self.started = True
-        self.thread = threading.Thread(target=self.update, args=())
+        target = self.update_stream if self.mode == "stream" else self.update
+        self.thread = threading.Thread(target=target, args=())
         self.thread.daemon = True
         self.thread.start()
         return self
 
     def update(self):
+        last_start = 0.0
         while self.started:
+            # ✅ สำคัญมาก: ไม่ขอภาพใหม่จนกว่าภาพก่อนหน้าจะถูกนำไปใช้ (ESP32 ได้พัก ไม่ส่งภาพทิ้ง)
+            # แล้วเว้นระยะตามโหมด: suspect = เร็วสุด, normal = 20 FPS, steady = 4 FPS
+            self.pacer.wait_turn(self.ring, last_start)
+            if not self.started:
+                break
+            last_start = time.time()
             try:
                 # ใช้ session.get แทน requests.get
-                response = self.session.get(self.url, timeout=3.0)
-                
-                if response.status_code == 200:
-                    img_array = np.array(bytearray(response.content), dtype=np.uint8)
-                    
-                    # โหลดภาพสีตามปกติ (MobileNet แม่นยำกว่าในภาพสี)
-                    # เปลี่ยนเลข 1 เป็น 0 เพื่อโหลดแบบ Grayscale
-                    frame = cv2.imdecode(img_array, 0) 
-                    
-                    if frame is not None:
-                        # Resize เล็กน้อยเพื่อความเร็ว
-                        frame = cv2.resize(frame, (400, 300))
-                        
-                        with self.read_lock:
-                            self.frame = frame
-                            self.grabbed = True
+                with METRICS.stage("capture"):
+                    response = self.session.get(self.url, timeout=3.0)
                 
-                # ✅ สำคัญมาก: หน่วงเวลาเล็กน้อยเพื่อให้ ESP32 ได้พัก
-                # 0.05 = 20 FPS (เพียงพอสำหรับ Fall Detection)
-                time.sleep(0.02) 
+                if response.status_code != 200:
+                    raise IOError(f"HTTP {response.status_code}")
+                self._publish(response.content)
+                self.backoff.reset()
 
             except Exception as e:
-                # กรณีเชื่อมต่อไม่ได้ ให้รอแป๊บหนึ่งแล้วลองใหม่
-                print(f"[Warning] Camera connection issue: {e}")
-                self.grabbed = False
-                time.sleep(1.0)
+                # กรณีเชื่อมต่อไม่ได้ รอนานขึ้นเรื่อยๆ (สุ่มเวลาไม่ให้หลายบอร์ดต่อพร้อมกัน) แล้วลองใหม่
+                self._retry_later(e)
+
+    def update_stream(self):
+        """MJPEG mode: frames arrive as fast as the board sends them, no request per frame."""
+        while self.started:
+            try:
+                self.reader = MjpegStreamReader(self.session, self.url)
+                for jpeg in self.reader.frames():
+                    if not self.started:
+                        break
+                    self._publish(jpeg)
+                    self.backoff.reset()
+            except Exception as e:
+                if not self.started:
+                    break
+                # Stream dropped (board restarted / WiFi), reconnect with backoff
+                self._retry_later(e)
+            finally:
+                if self.reader is not None:
+                    self.reader.close()
+
+    def _retry_later(self, error):
+        delay = self.backoff.next_delay()
+        print(f"[Warning] Camera connection issue: {error} (retry in {delay:.1f}s)")
+        self.grabbed = False
+        self.stopped.wait(delay)
+
+    def _publish(self, jpeg_bytes):
+        captured_at = time.time()
+        with METRICS.stage("decode"):
+            seq, frame = self.decoder.decode(jpeg_bytes)
+        
+        if frame is not None:
+            if self.recorder:
+                self.recorder.add_frame(self.camera_id, jpeg=jpeg_bytes, timestamp=captured_at)
+            self.ring.publish(frame, captured_at)
+            self.grabbed = True
 
     def read(self):
-        with self.read_lock:
-            frame = self.frame.copy() if self.frame is not None else None
-            grabbed = self.grabbed
-        return grabbed, frame
+        """Returns the newest frame by reference (a decoder buffer, valid for the next few frames)."""
+        entry = self.ring.read_latest()
+        if entry is None:
+            return False, None
+        return self.grabbed, entry[2]
+
+    def wait_frame(self, after_id, timeout=None):
+        """Blocks for a frame newer than after_id. Returns (frame_id, timestamp, frame) or None."""
+        return self.ring.wait_newer(after_id, timeout)
 
     def stop(self):
         self.started = False
+        self.stopped.set()
+        self.pacer.interrupt()
+        # Closing the ring releases a capture thread waiting for the consumer
+        self.ring.close()
+        # Closing the response unblocks a stream read that is waiting on the socket
+        if self.reader is not None:
+            self.reader.close()
         if hasattr(self, 'thread'):
             self.thread.join()
 
-# ==========================================
-# STATE MACHINE STATES
-# ==========================================
-STATE_IDLE = "IDLE"       # Waiting for motion
-STATE_ACTIVE = "ACTIVE"   # Motion detected, camera active
-STATE_STOPPING = "STOPPING"  # Transitioning to idle
-
 # ==========================================
 # MAIN FUNCTION WITH STATE MACHINE
 # ==========================================
@@ -102,174 +222,76 @@ def main():
     cert_path = "Firebase/preserving-fall-detector-firebase-adminsdk-fbsvc-a0baf4193e.json"
     db_url = 'https://preserving-fall-detector-default-rtdb.firebaseio.com/'
     
+    store = None
     try:
-        fb = FirebaseHandler(cert_path, db_url)
+        store = EventStore(EVENT_STORE_PATH) if EVENT_STORE_PATH else None
+        fb = FirebaseHandler(cert_path, db_url, async_writes=True, store=store)
         print("[INFO] Firebase connected successfully")
     except Exception as e:
         print(f"[ERROR] Firebase Connection Failed: {e}")
         print("[WARNING] Continuing without Firebase integration")
         fb = None
+        if store:
+            store.close()
 
     print(f"[INFO] Loading model...")
-    net = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
-
-    # State machine variables
-    current_state = STATE_IDLE
-    stream = None
-    prev_box = None
-    last_motion_check = 0
-    motion_check_interval = 0.5  # Check Firebase every 0.5 seconds
+    detector = PersonDetector(prototxt_path, model_path, confidence_threshold=0.5,
+                              backend=DNN_BACKEND, quantize=MODEL_QUANTIZE)
+    tracker = MultiPersonTracker(FallAnalyzer(smoothing_alpha=0.4), events=FallEventDetector())
+    if ROI_DETECTION:
+        detector = RoiDetector(detector, tracker=tracker, zones=ROOM_ZONES, full_every=ROI_FULL_EVERY)
+    interval_detector = IntervalDetector(detector, detect_every=DETECT_EVERY_N,
+                                         gate=MotionGate() if MOTION_GATE else None)
+
+    # Motion flag is pushed to us by a Firebase listener, the main loop only reads the cached value
+    motion = fb.subscribe_motion() if fb else None
+
+    preview = PreviewServer(port=PREVIEW_PORT).start() if PREVIEW_PORT is not None else None
+    recorder = EventRecorder(RECORD_DIR, pre_seconds=RECORD_PRE_SECONDS, post_seconds=RECORD_POST_SECONDS,
+                             max_disk_mb=RECORD_MAX_DISK_MB).start() if RECORD_FALLS else None
+
+    camera_url = STREAM_URL if CAPTURE_MODE == "stream" else SNAPSHOT_URL
+    def open_camera():
+        return ThreadedSnapshotCamera(camera_url, mode=CAPTURE_MODE, frame_size=FRAME_SIZE, recorder=recorder)
+
+    def show_frame(frame, tracks, state):
+        if preview:
+            preview.submit(frame, tracks, state)
+        if not HEADLESS:
+            with METRICS.stage("draw"):
+                # frame เป็น buffer ของกล้อง ห้ามวาดทับ (draw_tracks แปลง/ copy ให้ก่อน)
+                frame = draw_tracks(frame, tracks, state)
+
+            with METRICS.stage("display"):
+                cv2.imshow("ESP32 Fall Detection", frame)
+                key = cv2.waitKey(1) & 0xFF
+
+            if key == ord("q"):
+                return False
+        METRICS.frame("active_loop")
+        return True
+
+    def close_window():
+        if not HEADLESS:
+            cv2.destroyAllWindows()
+
+    machine = MonitorStateMachine(interval_detector, tracker, open_camera, motion=motion, fb=fb, recorder=recorder,
+                                  camera_id=CAMERA_ID, log_fall_history=LOG_FALL_HISTORY,
+                                  camera_warmup=CAMERA_WARMUP_SECONDS, on_frame=show_frame, on_stop=close_window)
+
+    if METRICS_ENABLED:
+        METRICS.enable(port=METRICS_PORT, log_interval=METRICS_LOG_INTERVAL)
+        METRICS.gauge("frame_ring_pending",
+                      lambda: machine.camera.ring.latest_id - machine.camera.ring.last_consumed_id if machine.camera else 0)
+        METRICS.gauge("frames_dropped", lambda: machine.camera.ring.dropped if machine.camera else 0)
+        METRICS.gauge("firebase_queue_depth", lambda: fb.writer.queue_depth() if fb and fb.writer else 0)
     
     print("[INFO] System ready. Monitoring Firebase for motion...")
     
     while True:
         try:
-            current_time = time.time()
-            
-            # ==========================================
-            # STATE: IDLE - Waiting for motion
-            # ==========================================
-            if current_state == STATE_IDLE:
-                # Check Firebase for motion state periodically
-                if current_time - last_motion_check >= motion_check_interval:
-                    last_motion_check = current_time
-                    
-                    if fb:
-                        motion_state = fb.get_motion_state()
-                        
-                        if motion_state == 1:
-                            print("[INFO] Motion detected! Starting camera...")
-                            current_state = STATE_ACTIVE
-                            
-                            # Start camera stream
-                            stream = ThreadedSnapshotCamera(SNAPSHOT_URL).start()
-                            time.sleep(1.0)  # Give camera time to initialize
-                            prev_box = None
-                    else:
-                        # If no Firebase, stay in IDLE (or could default to ACTIVE)
-                        print("[WARNING] No Firebase connection, cannot monitor motion")
-                        time.sleep(1.0)
-                
-                # Sleep to reduce CPU usage in idle state
-                time.sleep(0.1)
-                continue
-            
-            # ==========================================
-            # STATE: ACTIVE - Processing camera feed
-            # ==========================================
-            elif current_state == STATE_ACTIVE:
-                # Check motion state periodically
-                if current_time - last_motion_check >= motion_check_interval:
-                    last_motion_check = current_time
-                    
-                    if fb:
-                        motion_state = fb.get_motion_state()
-                        
-                        if motion_state == 0:
-                            print("[INFO] Motion ended. Stopping camera...")
-                            current_state = STATE_STOPPING
-                            continue
-                
-                # Process camera frame
-                if stream:
-                    grabbed, frame = stream.read()
-                    
-                    # ถ้ายังไม่มีภาพ ให้ข้ามลูปไปก่อน (อย่าพึ่งรัน Model)
-                    if not grabbed or frame is None:
-                        time.sleep(0.01)
-                        continue
-
-                    # ตรวจสอบว่าเป็นภาพ Grayscale หรือไม่ ถ้าใช่ให้แปลงเป็น BGR ก่อนเข้าโมเดล
-                    if len(frame.shape) == 2:
-                        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-
-                    (h, w) = frame.shape[:2]
-                    blob = cv2.dnn.blobFromImage(frame, 0.007843, (300, 300), 127.5)
-                    net.setInput(blob)
-                    detections = net.forward()
-                    
-                    max_conf_idx = -1
-                    max_conf_val = 0
-
-                    for i in np.arange(0, detections.shape[2]):
-                        percent = detections[0, 0, i, 2]
-                        idx = int(detections[0, 0, i, 1])
-                        
-                        # กรองเอาเฉพาะ Person (15)
-                        if CLASSES[idx] != "person" or percent <= 0.5:
-                            continue
-                        
-                        if percent > max_conf_val:
-                            max_conf_val = percent
-                            max_conf_idx = i
-
-                    if max_conf_idx != -1:
-                        box = detections[0, 0, max_conf_idx, 3:7] * np.array([w, h, w, h])
-                        current_box = box.astype("int")
-
-                        if prev_box is not None:
-                            dist = np.linalg.norm(current_box - prev_box)
-                            if dist < 100:
-                                alpha = 0.4
-                                current_box = (alpha * current_box + (1 - alpha) * prev_box).astype("int")
-                        
-                        prev_box = current_box.astype("float")
-                        (startX, startY, endX, endY) = current_box
-                        box_width = endX - startX
-                        box_height = endY - startY
-                        aspect_ratio = box_height / box_width if box_width > 0 else 0
-                        
-                        label = "{}: Ratio: {:.2f}".format("Person", aspect_ratio)
-                        cv2.rectangle(frame, (startX, startY), (endX, endY), COLOR, 2)
-                        font_scale = max(box_width * 0.003, 0.5)
-
-                        if aspect_ratio > 1:
-                            status_text = " Standing"
-                            text_color = COLOR
-                        else:
-                            status_text = " Fall Down"
-                            text_color = (0, 0, 255)
-
-                        cv2.putText(frame, label + status_text, (startX, startY - 5), 
-                                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color, 2)
-
-                        # Firebase Update Logic
-                        if fb:
-                            try:
-                                # Update status to Firebase
-                                fb.update_status("ESP32-S3-CAM", status_text.strip())
-                                
-                                # Optional: Log fall history if fall detected
-                                if "Fall" in status_text:
-                                    # fb.log_fall() # Uncomment if history logging is desired
-                                    pass
-
-                            except Exception as e:
-                                print(f"[ERROR] Firebase Update: {e}")
-
-                    # Display state indicator
-                    cv2.putText(frame, f"State: {current_state}", (10, 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
-                    
-                    cv2.imshow("ESP32 Fall Detection", frame)
-                    
-                    if cv2.waitKey(1) & 0xFF == ord("q"):
-                        break
-            
-            # ==========================================
-            # STATE: STOPPING - Clean up camera
-            # ==========================================
-            elif current_state == STATE_STOPPING:
-                if stream:
-                    stream.stop()
-                    stream = None
-                    print("[INFO] Camera stopped")
-                
-                cv2.destroyAllWindows()
-                current_state = STATE_IDLE
-                prev_box = None
-                print("[INFO] Returning to IDLE state. Monitoring for motion...")
-        
+            if not machine.step():
+                break
         except KeyboardInterrupt:
             print("\n[INFO] Keyboard interrupt received. Shutting down...")
             break
@@ -280,9 +302,17 @@ def main():
             time.sleep(1.0)
     
     # Cleanup
-    if stream:
-        stream.stop()
-    cv2.destroyAllWindows()
+    machine.close()
+    if motion:
+        motion.close()
+    if fb:
+        fb.close()
+    if preview:
+        preview.stop()
+    if recorder:
+        recorder.stop()
+    if not HEADLESS:
+        cv2.destroyAllWindows()
     print("[INFO] System shutdown complete")
 
 if __name__ == "__main__":
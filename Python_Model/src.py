@@ -1,8 +1,18 @@
 import cv2
 import numpy as np
 import os
+import threading
 import time
 from FireBaseConnect import FirebaseHandler
+from Tracker import MultiPersonTracker
+from SparseDetection import IntervalDetector
+from MotionGate import MotionGate
+from FallEvents import FallEventDetector
+from EventRecorder import EventRecorder
+from FrameExchange import FrameRing
+from Metrics import METRICS
+from ModelLoader import load_net
+from Preview import PreviewServer, draw_tracks
 
 class VideoSource:
     """Class for handling video input (file or camera)."""
@@ -10,50 +20,127 @@ class VideoSource:
         self.cap = cv2.VideoCapture(source)
         if not self.cap.isOpened():
             print(f"Error: Could not open video source {source}")
+        self.ring = FrameRing()
+        self.started = False
 
     def read(self):
-        return self.cap.read()
+        if self.started:
+            # Threaded mode: newest frame from the capture thread
+            entry = self.ring.read_latest()
+            if entry is None:
+                return not self.ring.closed, None
+            return True, entry[2]
+        with METRICS.stage("capture"):
+            return self.cap.read()
+
+    def start(self, realtime=True):
+        """Reads frames on a background thread and publishes them into self.ring.
+        With realtime=True a file is played at its own FPS, like a live camera."""
+        if self.started:
+            return self
+        self.started = True
+        self.thread = threading.Thread(target=self._update, args=(realtime,))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def _update(self, realtime):
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        interval = 1.0 / fps if realtime and fps and fps > 0 else 0
+        next_time = time.time()
+        while self.started:
+            with METRICS.stage("capture"):
+                ret, frame = self.cap.read()
+            if not ret:
+                break
+            self.ring.publish(frame)
+            if interval:
+                next_time += interval
+                time.sleep(max(next_time - time.time(), 0))
+        self.ring.close()
+
+    def wait_frame(self, after_id, timeout=None):
+        """Blocks for a frame newer than after_id. Returns (frame_id, timestamp, frame) or None."""
+        return self.ring.wait_newer(after_id, timeout)
 
     def release(self):
+        self.started = False
+        if hasattr(self, 'thread'):
+            self.thread.join()
         self.cap.release()
 
 class PersonDetector:
     """Class for detecting persons using MobileNetSSD."""
-    def __init__(self, prototxt_path, model_path, confidence_threshold=0.5):
+    PERSON_CLASS_ID = 15
+
+    def __init__(self, prototxt_path, model_path, confidence_threshold=0.5, nms_threshold=None,
+                 backend="auto", quantize=False, warmup_runs=2, cache=True):
         self.CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat",
                         "bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
                         "dog", "horse", "motorbike", "person", "pottedplant", "sheep",
                         "sofa", "train", "tvmonitor"]
         self.confidence_threshold = confidence_threshold
+        self.nms_threshold = nms_threshold  # None = trust the SSD's own NMS
         
+        # Caffe or ONNX, backend picked for this host, warmed up and cached per thread (ModelLoader)
         print(f"[INFO] Loading model from: {model_path}")
-        self.net = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+        self.net = load_net(model_path, prototxt_path, backend=backend, quantize=quantize,
+                            warmup_runs=warmup_runs, cache=cache)
 
     def detect(self, frame):
-        """Returns the detection with the highest confidence for a person."""
+        """Returns every person above the threshold as (boxes (N,4), confidences (N,)),
+        sorted by confidence, highest first."""
         (h, w) = frame.shape[:2]
-        blob = cv2.dnn.blobFromImage(frame, 0.007843, (300, 300), 127.5)
-        self.net.setInput(blob)
-        detections = self.net.forward()
+        with METRICS.stage("blob"):
+            blob = cv2.dnn.blobFromImage(self.to_input(frame), 0.007843, (300, 300), 127.5)
+        with METRICS.stage("forward"):
+            self.net.setInput(blob)
+            detections = self.net.forward()
 
-        max_conf_idx = -1
-        max_conf_val = 0
+        with METRICS.stage("postprocess"):
+            return self._people(detections[0, 0], w, h)
 
-        for i in np.arange(0, detections.shape[2]):
-            percent = detections[0, 0, i, 2]
-            idx = int(detections[0, 0, i, 1])
+    def detect_batch(self, frames):
+        """Runs one forward pass over several frames. Returns one detect() result per frame."""
+        with METRICS.stage("blob"):
+            blob = cv2.dnn.blobFromImages([self.to_input(f) for f in frames], 0.007843, (300, 300), 127.5)
+        with METRICS.stage("batch_forward"):
+            self.net.setInput(blob)
+            detections = self.net.forward()
 
-            if self.CLASSES[idx] != "person" or percent <= self.confidence_threshold:
-                continue
+        # Column 0 of every SSD output row is the index of the image in the batch
+        rows = detections[0, 0]
+        results = []
+        for i, frame in enumerate(frames):
+            (h, w) = frame.shape[:2]
+            results.append(self._people(rows[rows[:, 0] == i], w, h))
+        return results
 
-            if percent > max_conf_val:
-                max_conf_val = percent
-                max_conf_idx = i
+    def to_input(self, frame):
+        """Shrinks a BGR or grayscale frame to the 300x300 network input.
+        Grayscale is expanded to 3 channels after the resize, on 300x300 pixels instead of the full frame."""
+        if frame.shape[:2] != (300, 300):
+            frame = cv2.resize(frame, (300, 300))
+        if len(frame.shape) == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        return frame
 
-        if max_conf_idx != -1:
-            return detections[0, 0, max_conf_idx, 3:7] * np.array([w, h, w, h]), max_conf_val
-        
-        return None, 0
+    def _people(self, rows, w, h):
+        """Filters raw SSD output rows down to person boxes in pixel coordinates."""
+        mask = (rows[:, 1] == self.PERSON_CLASS_ID) & (rows[:, 2] > self.confidence_threshold)
+        confidences = rows[mask, 2]
+        boxes = rows[mask, 3:7] * np.array([w, h, w, h])
+
+        if self.nms_threshold is not None and len(boxes) > 1:
+            # NMSBoxes wants (x, y, width, height)
+            xywh = np.column_stack((boxes[:, :2], boxes[:, 2:] - boxes[:, :2]))
+            keep = cv2.dnn.NMSBoxes(xywh.tolist(), confidences.tolist(),
+                                    self.confidence_threshold, self.nms_threshold)
+            keep = np.array(keep, dtype=int).reshape(-1)
+            boxes, confidences = boxes[keep], confidences[keep]
+
+        order = np.argsort(-confidences)
+        return boxes[order], confidences[order]
 
 class FallAnalyzer:
     """Class for analyzing detections to determine fall status."""
@@ -63,15 +150,20 @@ class FallAnalyzer:
 
     def analyze(self, raw_box, frame_width, frame_height):
         """Applies smoothing and determines if the person is falling."""
+        current_box, status, aspect_ratio = self.analyze_with_prev(raw_box, self.prev_box)
+        self.prev_box = current_box.astype("float")
+        return current_box, status, aspect_ratio
+
+    def analyze_with_prev(self, raw_box, prev_box):
+        """Same as analyze() but smooths against the given previous box and keeps no state,
+        so a tracker can hold one previous box per person."""
         current_box = raw_box.astype("int")
 
         # Smoothing Logic
-        if self.prev_box is not None:
-            dist = np.linalg.norm(current_box - self.prev_box)
+        if prev_box is not None:
+            dist = np.linalg.norm(current_box - prev_box)
             if dist < 100:  # If distance is small, smooth it
-                current_box = (self.alpha * current_box + (1 - self.alpha) * self.prev_box).astype("int")
-
-        self.prev_box = current_box.astype("float")
+                current_box = (self.alpha * current_box + (1 - self.alpha) * prev_box).astype("int")
         
         (startX, startY, endX, endY) = current_box
         box_width = endX - startX
@@ -93,7 +185,8 @@ class FallAnalyzer:
 
 class HumanDetectionApp:
     """Main Application Class."""
-    def __init__(self):
+    def __init__(self, detect_every=5, metrics_port=None, metrics_log_interval=None,
+                 headless=False, preview_port=None, motion_gate=True, record_dir=None):
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.prototxt_path = os.path.join(self.base_dir, "MobileNetFile", "MobileNetSSD.prototxt")
         self.model_path = os.path.join(self.base_dir, "MobileNetFile", "MobileNetSSD.caffemodel")
@@ -102,16 +195,28 @@ class HumanDetectionApp:
         self.firebase_db_url = 'https://motionsensorproject-14403-default-rtdb.firebaseio.com/'
         
         self.detector = PersonDetector(self.prototxt_path, self.model_path)
+        # Full DNN every `detect_every` frames, optical flow in between (1 = every frame)
+        # Motion gate: no DNN at all while the scene is static, immediate re-detect when it changes
+        self.interval_detector = IntervalDetector(self.detector, detect_every=detect_every,
+                                                  gate=MotionGate() if motion_gate else None)
         self.analyzer = FallAnalyzer()
+        # Falls are confirmed over time (fast descent, then down for 2s), not from one frame's ratio
+        self.tracker = MultiPersonTracker(self.analyzer, events=FallEventDetector())
         self.video_source = VideoSource(self.video_path)
-        self.firebase = FirebaseHandler(self.firebase_cert_path, self.firebase_db_url, root_node='realtime_camera_src')
-        
-        self.color_green = (0, 255, 0)
-        self.color_red = (0, 0, 255)
+        self.firebase = FirebaseHandler(self.firebase_cert_path, self.firebase_db_url, root_node='realtime_camera_src', async_writes=True)
         
-        # Debounce for fall logging (prevent spamming every frame)
-        self.last_fall_log_time = 0
-        self.fall_log_cooldown = 5.0 # seconds
+        # Headless: no drawing and no cv2 window. Preview (optional) is served over HTTP instead.
+        self.headless = headless
+        self.preview = PreviewServer(port=preview_port).start() if preview_port is not None else None
+
+        # Fall clips (JPEG pre-roll, encoded on the recorder's thread, written on a confirmed fall); off unless record_dir is set
+        self.recorder = EventRecorder(record_dir).start() if record_dir else None
+
+        # Stage timings, FPS and queue depths (off unless a port or log interval is given)
+        if metrics_port is not None or metrics_log_interval:
+            METRICS.enable(port=metrics_port, log_interval=metrics_log_interval)
+            METRICS.gauge("firebase_queue_depth",
+                          lambda: self.firebase.writer.queue_depth() if self.firebase.writer else 0)
 
     def run(self):
         print("[INFO] Starting video stream...")
@@ -122,45 +227,67 @@ class HumanDetectionApp:
                 break
 
             # Detection
-            raw_box, confidence = self.detector.detect(frame)
+            boxes, confidences = self.interval_detector.detect(frame)
 
-            if raw_box is not None:
-                (h, w) = frame.shape[:2]
-                
-                # Analysis
-                box, status, ratio = self.analyzer.analyze(raw_box, w, h)
-                (startX, startY, endX, endY) = box
+            (h, w) = frame.shape[:2]
+
+            # Analysis (one track per person)
+            with METRICS.stage("analyze"):
+                now = time.time()
+                tracks = self.tracker.update(boxes, w, h, timestamp=now)
+
+            if tracks:
+                statuses = [status for (_, _, status, _) in tracks]
+                status = "Fall Down" if "Fall Down" in statuses else "Standing"
                 
                 # Firebase Update
                 self.firebase.update_status("ROOM-01", status)
                 
-                # Log Fall Event (with cooldown)
-                if status == "Fall Down":
-                    current_time = time.time()
-                    if current_time - self.last_fall_log_time > self.fall_log_cooldown:
-                        self.firebase.log_fall()
-                        self.last_fall_log_time = current_time
-                
+            if self.recorder:
+                self.recorder.add_frame("ROOM-01", frame=frame, timestamp=now)
+
+            # Log Fall Event (once per confirmed fall)
+            for kind, event in self.tracker.events.pop_events():
+                if kind == "confirmed":
+                    print(f"[ALERT] Fall confirmed: person {event.track_id}")
+                    self.firebase.log_fall(event)
+                    if self.recorder:
+                        self.recorder.trigger_event("ROOM-01", event)
+                else:
+                    print(f"[INFO] Person {event.track_id} back up after {event.duration():.1f}s")
+
+            if self.preview:
+                self.preview.submit(frame, tracks)
+
+            if not self.headless:
                 # Visualization
-                box_width = endX - startX
-                font_scale = max(box_width * 0.003, 0.5)
-                
-                label = f"Person: Ratio: {ratio:.2f}"
-                
-                color = self.color_green if status == "Standing" else self.color_red
-                
-                cv2.rectangle(frame, (startX, startY), (endX, endY), self.color_green, 2)
-                cv2.putText(frame, f"{label} {status}", (startX, startY - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 2)
+                with METRICS.stage("draw"):
+                    draw_tracks(frame, tracks, copy=False)
 
-            cv2.imshow("Frame", frame)
+                with METRICS.stage("display"):
+                    cv2.imshow("Frame", frame)
+                    key = cv2.waitKey(1) & 0xFF
 
-            if cv2.waitKey(1) & 0xFF == ord("q"):
-                break
+                if key == ord("q"):
+                    break
+            METRICS.frame("detection_loop")
 
         self.video_source.release()
-        cv2.destroyAllWindows()
+        self.firebase.close()
+        if self.preview:
+            self.preview.stop()
+        if self.recorder:
+            self.recorder.stop()
+        if not self.headless:
+            cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    app = HumanDetectionApp()
+    import argparse
+    parser = argparse.ArgumentParser(description="Fall detection on a video file")
+    parser.add_argument("--headless", action="store_true", help="no drawing, no cv2 window")
+    parser.add_argument("--preview-port", type=int, default=None, help="serve an annotated MJPEG preview")
+    parser.add_argument("--record-dir", default=None, help="save a clip around every confirmed fall here")
+    args = parser.parse_args()
+
+    app = HumanDetectionApp(headless=args.headless, preview_port=args.preview_port, record_dir=args.record_dir)
     app.run()
\ No newline at end of file